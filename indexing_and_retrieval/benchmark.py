@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from index_base import Compression, IndexInfo, Optimizations, QueryProc
+from metrics import measure_latency, measure_throughput, peak_rss_mb, percentile_latencies
+from self_index import SelfIndex
+
+
+# Benchmarks SelfIndex-v1.xyziq variants over a fixed corpus and query set. Each variant
+# runs in a fresh process (so peak RSS is its own): build, load, then latency and
+# throughput over the queries. Results go to a JSON file and can be compared with a
+# baseline file from an earlier run; regressions beyond the tolerance fail the run.
+#   python benchmark.py --docs docs.jsonl --queries queries.txt --out bench.json \
+#       [--baseline old.json] [--info TFIDF BM25] [--optim Null Skipping]
+# docs.jsonl holds one {"doc_id", "text"} object per line ("title" is prepended if present);
+# queries.txt one query per line.
+
+# Datastores SelfIndex implements (DB1/DB2 have no SelfIndex backend)
+_SUPPORTED_DSTORES = ("CUSTOM",)
+
+# Metric -> True if higher is better; these are the metrics compared against a baseline
+TRACKED = {
+    "build_s": False,
+    "docs_per_s": True,
+    "size_bytes": False,
+    "load_s": False,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "qps": True,
+    "peak_rss_mb": False,
+}
+
+
+def variant_matrix(infos: Sequence[str] = tuple(IndexInfo.__members__),
+                   dstores: Sequence[str] = _SUPPORTED_DSTORES,
+                   comprs: Sequence[str] = tuple(Compression.__members__),
+                   qprocs: Sequence[str] = tuple(QueryProc.__members__),
+                   optims: Sequence[str] = tuple(Optimizations.__members__)) -> Iterator[Dict[str, str]]:
+    for info, dstore, compr, qproc, optim in itertools.product(infos, dstores, comprs, qprocs, optims):
+        yield {"info": info, "dstore": dstore, "compr": compr, "qproc": qproc, "optim": optim}
+
+
+def read_docs(path: Path) -> List[Tuple[str, str]]:
+    docs: List[Tuple[str, str]] = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                text = str(row["text"])
+                if row.get("title"):
+                    text = str(row["title"]) + "\n" + text
+                docs.append((str(row.get("doc_id", row.get("id"))), text))
+    return docs
+
+
+def read_queries(path: Path) -> List[str]:
+    return [q.strip() for q in path.read_text(encoding="utf-8").splitlines() if q.strip()]
+
+
+def run_variant(variant: Dict[str, str], docs: List[Tuple[str, str]], queries: List[str],
+                repeat: int = 1, options: Dict | None = None) -> Dict:
+    """Builds, loads and queries one variant in this process; returns its measurements."""
+    options = dict(options or {})
+    # Repeated queries would otherwise be answered from the result cache
+    options.setdefault("result_cache_mb", 0)
+    idx = SelfIndex("SelfIndex", variant["info"], variant["dstore"], variant["qproc"],
+                    variant["compr"], variant["optim"], **options)
+    index_id = f"bench/{idx.identifier_short}"
+
+    t0 = time.perf_counter()
+    idx.create_index(index_id, docs)
+    build_s = time.perf_counter() - t0
+    build_rss = peak_rss_mb()
+    index_dir = Path("indices") / index_id
+    files = {str(p.relative_to(index_dir)): p.stat().st_size for p in sorted(index_dir.rglob("*")) if p.is_file()}
+
+    idx = SelfIndex("SelfIndex", variant["info"], variant["dstore"], variant["qproc"],
+                    variant["compr"], variant["optim"], **options)
+    t0 = time.perf_counter()
+    idx.load_index(str(index_dir))
+    load_s = time.perf_counter() - t0
+
+    latencies: List[float] = []
+    for _ in range(repeat):
+        latencies.extend(measure_latency(idx.query, queries)[0])
+    pct = percentile_latencies(latencies)
+    qps = measure_throughput(idx.query, queries * repeat)
+    idx.delete_index(index_id)
+    return {
+        "id": idx.identifier_short,
+        "variant": variant,
+        "docs": len(docs),
+        "queries": len(queries),
+        "build_s": build_s,
+        "docs_per_s": len(docs) / build_s if build_s > 0 else float("inf"),
+        "files": files,
+        "size_bytes": sum(files.values()),
+        "load_s": load_s,
+        "p50_ms": pct["p50"],
+        "p95_ms": pct["p95"],
+        "p99_ms": pct["p99"],
+        "avg_ms": pct["avg"],
+        "qps": qps,
+        "build_peak_rss_mb": build_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_matrix(variants: List[Dict[str, str]], docs_path: Path, queries_path: Path,
+               repeat: int = 1, options: Dict | None = None) -> List[Dict]:
+    results: List[Dict] = []
+    ctx = multiprocessing.get_context("spawn")
+    for variant in variants:
+        # A fresh interpreter per variant keeps peak RSS and caches separate
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            result = pool.submit(_run_variant_files, variant, str(docs_path), str(queries_path), repeat, options).result()
+        print(_summary(result), flush=True)
+        results.append(result)
+    return results
+
+
+def _run_variant_files(variant: Dict[str, str], docs_path: str, queries_path: str,
+                       repeat: int, options: Dict | None) -> Dict:
+    return run_variant(variant, read_docs(Path(docs_path)), read_queries(Path(queries_path)), repeat, options)
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[Dict]:
+    """Regressions: tracked metrics worse than the baseline run of the same variant by
+    more than tolerance (a fraction, 0.1 = 10%).
+    """
+    base = {r["id"]: r for r in baseline}
+    out: List[Dict] = []
+    for r in results:
+        old = base.get(r["id"])
+        if old is None:
+            continue
+        for metric, higher_is_better in TRACKED.items():
+            before, after = old.get(metric), r.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (-change if higher_is_better else change) > tolerance:
+                out.append({"id": r["id"], "metric": metric, "baseline": before, "current": after, "change": change})
+    return out
+
+
+def _summary(r: Dict) -> str:
+    return (f"{r['id']}: build {r['build_s']:.2f}s ({r['docs_per_s']:.0f} docs/s) size {r['size_bytes']} "
+            f"load {r['load_s'] * 1000:.1f}ms p50/p95/p99 {r['p50_ms']:.2f}/{r['p95_ms']:.2f}/{r['p99_ms']:.2f}ms "
+            f"{r['qps']:.0f} q/s peak rss {r['peak_rss_mb']:.0f}MB")
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark SelfIndex variants.")
+    parser.add_argument("--docs", type=Path, required=True, help="JSONL corpus with doc_id and text")
+    parser.add_argument("--queries", type=Path, required=True, help="one query per line")
+    parser.add_argument("--out", type=Path, default=Path("benchmark.json"))
+    parser.add_argument("--baseline", type=Path, help="earlier --out file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown (0.10 = 10%%)")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the query set")
+    parser.add_argument("--info", nargs="+", default=list(IndexInfo.__members__), choices=list(IndexInfo.__members__))
+    parser.add_argument("--dstore", nargs="+", default=list(_SUPPORTED_DSTORES), choices=list(_SUPPORTED_DSTORES))
+    parser.add_argument("--compr", nargs="+", default=list(Compression.__members__), choices=list(Compression.__members__))
+    parser.add_argument("--qproc", nargs="+", default=list(QueryProc.__members__), choices=list(QueryProc.__members__))
+    parser.add_argument("--optim", nargs="+", default=list(Optimizations.__members__), choices=list(Optimizations.__members__))
+    args = parser.parse_args(argv)
+
+    variants = list(variant_matrix(args.info, args.dstore, args.compr, args.qproc, args.optim))
+    results = run_matrix(variants, args.docs, args.queries, args.repeat)
+    args.out.write_text(json.dumps({
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "docs": str(args.docs),
+        "queries": str(args.queries),
+        "results": results,
+    }, indent=1))
+    if args.baseline is None:
+        return 0
+    regressions = compare(results, json.loads(args.baseline.read_text())["results"], args.tolerance)
+    for reg in regressions:
+        print(f"REGRESSION {reg['id']} {reg['metric']}: {reg['baseline']:.4g} -> {reg['current']:.4g} "
+              f"({reg['change']:+.1%})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
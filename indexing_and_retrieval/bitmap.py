@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Union
+
+import numpy as np
+
+
+# Roaring-style compressed doc set. A doc code is split into a chunk key (high bits,
+# doc >> 16) and a 16-bit low part. Each chunk holds its low parts either as
+#   array container  -> sorted list of ints, for sparse chunks (<= ARRAY_MAX values)
+#   bitmap container -> one 65536-bit Python int, for dense chunks
+# Set algebra runs chunk by chunk on the cheapest representation.
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+ARRAY_MAX = 4096
+_FULL = (1 << CHUNK_SIZE) - 1
+_BITMAP_BYTES = CHUNK_SIZE // 8
+
+Container = Union[List[int], int]
+
+
+def _to_bitmap(values: List[int] | np.ndarray) -> int:
+    flags = np.zeros(CHUNK_SIZE, dtype=bool)
+    flags[values] = True
+    return int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+
+def _bitmap_array(bits: int) -> np.ndarray:
+    raw = np.frombuffer(bits.to_bytes(_BITMAP_BYTES, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(raw, bitorder="little"))
+
+
+def _bitmap_values(bits: int) -> List[int]:
+    return _bitmap_array(bits).tolist()
+
+
+def _bitmap_contains(bits: int):
+    raw = bits.to_bytes(_BITMAP_BYTES, "little")
+    return lambda v: raw[v >> 3] >> (v & 7) & 1
+
+
+def _normalize(c: Container) -> Container | None:
+    # Picks the container type for the cardinality; None for an empty container
+    if isinstance(c, int):
+        n = c.bit_count()
+        if n == 0:
+            return None
+        return _bitmap_values(c) if n <= ARRAY_MAX else c
+    if not c:
+        return None
+    return _to_bitmap(c) if len(c) > ARRAY_MAX else c
+
+
+def _and(a: Container, b: Container) -> Container | None:
+    if isinstance(a, int) and isinstance(b, int):
+        return _normalize(a & b)
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        has = _bitmap_contains(b)
+        return _normalize([v for v in a if has(v)])
+    if len(a) > len(b):
+        a, b = b, a
+    other = set(b)
+    return _normalize([v for v in a if v in other])
+
+
+def _or(a: Container, b: Container) -> Container | None:
+    if isinstance(a, int) or isinstance(b, int):
+        a_bits = a if isinstance(a, int) else _to_bitmap(a)
+        b_bits = b if isinstance(b, int) else _to_bitmap(b)
+        return _normalize(a_bits | b_bits)
+    return _normalize(sorted(set(a).union(b)))
+
+
+def _andnot(a: Container, b: Container) -> Container | None:
+    if isinstance(a, int):
+        b_bits = b if isinstance(b, int) else _to_bitmap(b)
+        return _normalize(a & ~b_bits)
+    if isinstance(b, int):
+        has = _bitmap_contains(b)
+        return _normalize([v for v in a if not has(v)])
+    other = set(b)
+    return _normalize([v for v in a if v not in other])
+
+
+class DocSet:
+    """Immutable compressed set of non-negative doc codes supporting &, |, - (and-not)."""
+
+    __slots__ = ("_chunks",)
+
+    def __init__(self, chunks: Dict[int, Container] | None = None) -> None:
+        # chunk key -> non-empty container, keys kept in ascending order
+        self._chunks: Dict[int, Container] = chunks or {}
+
+    @classmethod
+    def from_sorted(cls, codes: Iterable[int]) -> DocSet:
+        chunks: Dict[int, Container] = {}
+        key = -1
+        values: List[int] = []
+        for code in codes:
+            k = code >> CHUNK_BITS
+            if k != key:
+                if values:
+                    chunks[key] = _normalize(values)  # type: ignore[assignment]
+                key, values = k, []
+            values.append(code & (CHUNK_SIZE - 1))
+        if values:
+            chunks[key] = _normalize(values)  # type: ignore[assignment]
+        return cls(chunks)
+
+    @classmethod
+    def from_array(cls, codes: np.ndarray) -> DocSet:
+        """from_sorted for a sorted NumPy array, split into chunks without a Python loop per code."""
+        chunks: Dict[int, Container] = {}
+        if not len(codes):
+            return cls(chunks)
+        codes = np.asarray(codes, dtype=np.int64)
+        bounds = np.flatnonzero(np.diff(codes >> CHUNK_BITS)) + 1
+        for part in np.split(codes, bounds):
+            low = part & (CHUNK_SIZE - 1)
+            chunks[int(part[0]) >> CHUNK_BITS] = _to_bitmap(low) if len(part) > ARRAY_MAX else low.tolist()
+        return cls(chunks)
+
+    @classmethod
+    def range(cls, start: int, stop: int) -> DocSet:
+        """All codes in [start, stop)."""
+        chunks: Dict[int, Container] = {}
+        if stop <= start:
+            return cls(chunks)
+        for key in range(start >> CHUNK_BITS, ((stop - 1) >> CHUNK_BITS) + 1):
+            lo = max(start - (key << CHUNK_BITS), 0)
+            hi = min(stop - (key << CHUNK_BITS), CHUNK_SIZE)
+            bits = _FULL if (lo, hi) == (0, CHUNK_SIZE) else ((1 << hi) - 1) ^ ((1 << lo) - 1)
+            c = _normalize(bits)
+            if c is not None:
+                chunks[key] = c
+        return cls(chunks)
+
+    def __and__(self, other: DocSet) -> DocSet:
+        chunks: Dict[int, Container] = {}
+        for key, a in self._chunks.items():
+            b = other._chunks.get(key)
+            if b is not None:
+                c = _and(a, b)
+                if c is not None:
+                    chunks[key] = c
+        return DocSet(chunks)
+
+    def __or__(self, other: DocSet) -> DocSet:
+        chunks: Dict[int, Container] = {}
+        for key in sorted(self._chunks.keys() | other._chunks.keys()):
+            a = self._chunks.get(key)
+            b = other._chunks.get(key)
+            if a is None or b is None:
+                chunks[key] = a if b is None else b  # type: ignore[assignment]
+            else:
+                chunks[key] = _or(a, b)  # type: ignore[assignment]
+        return DocSet(chunks)
+
+    def __sub__(self, other: DocSet) -> DocSet:
+        chunks: Dict[int, Container] = {}
+        for key, a in self._chunks.items():
+            b = other._chunks.get(key)
+            c = a if b is None else _andnot(a, b)
+            if c is not None:
+                chunks[key] = c
+        return DocSet(chunks)
+
+    def complement(self, universe: DocSet) -> DocSet:
+        return universe - self
+
+    def __contains__(self, code: int) -> bool:
+        c = self._chunks.get(code >> CHUNK_BITS)
+        if c is None:
+            return False
+        low = code & (CHUNK_SIZE - 1)
+        if isinstance(c, int):
+            return bool(c >> low & 1)
+        i = bisect_left(c, low)
+        return i < len(c) and c[i] == low
+
+    def __len__(self) -> int:
+        return sum(c.bit_count() if isinstance(c, int) else len(c) for c in self._chunks.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._chunks)
+
+    def __iter__(self) -> Iterator[int]:
+        for key, c in self._chunks.items():
+            base = key << CHUNK_BITS
+            values = _bitmap_values(c) if isinstance(c, int) else c
+            for v in values:
+                yield base + v
+
+    def to_list(self) -> List[int]:
+        out: List[int] = []
+        for key, c in self._chunks.items():
+            base = key << CHUNK_BITS
+            values = _bitmap_values(c) if isinstance(c, int) else c
+            if base:
+                out.extend(base + v for v in values)
+            else:
+                out.extend(values)
+        return out
+
+    def to_array(self) -> np.ndarray:
+        parts = [(key << CHUNK_BITS) + (_bitmap_array(c) if isinstance(c, int) else np.array(c, dtype=np.int64))
+                 for key, c in self._chunks.items()]
+        return np.concatenate(parts).astype(np.int64) if parts else np.zeros(0, dtype=np.int64)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the containers."""
+        return sum(_BITMAP_BYTES if isinstance(c, int) else 8 * len(c) for c in self._chunks.values())
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import io
-import math
 import struct
 import zlib
 from typing import Iterable, List
 
+import numpy as np
+
 
 def vbyte_encode(numbers: Iterable[int]) -> bytes:
     out = bytearray()
@@ -41,6 +42,19 @@ def vbyte_decode(data: bytes) -> List[int]:
     return numbers
 
 
+def vbyte_decode_array(data: bytes | memoryview) -> np.ndarray:
+    # Vectorized vbyte_decode: each number ends at the first byte below 0x80
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if not len(raw):
+        return np.zeros(0, dtype=np.int64)
+    if raw[-1] & 0x80:
+        raise ValueError("truncated vbyte stream")
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 7 * (np.arange(len(raw)) - np.repeat(starts, ends - starts + 1))
+    return np.add.reduceat((raw & 0x7F).astype(np.int64) << shifts, starts)
+
+
 def zlib_compress(raw: bytes, level: int = 6) -> bytes:
     return zlib.compress(raw, level=level)
 
@@ -49,16 +63,7 @@ def zlib_decompress(data: bytes) -> bytes:
     return zlib.decompress(data)
 
 
-def add_skip_pointers(postings: List[int]) -> List[tuple[int, int]]:
-    # Returns list of (doc_id, skip_index) where skip_index is target index or -1
-    L = len(postings)
-    if L == 0:
-        return []
-    step = int(math.sqrt(L)) or 1
-    result: List[tuple[int, int]] = []
-    for i, d in enumerate(postings):
-        target = i + step
-        result.append((d, target if target < L else -1))
-    return result
-
 
+def zlib_compressor(level: int = 6):
+    # For data compressed in pieces; the stream decodes with zlib_decompress
+    return zlib.compressobj(level)
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import heapq
+from bisect import bisect_left
+from typing import Callable, List, Sequence, Tuple
+
+from bitmap import DocSet
+from postings import END, PostingsCursor, phrase_in
+
+
+# Document-at-a-time query operators. Every cursor exposes the current matching doc
+# code as .doc (END when exhausted) and only moves forward:
+#   next()        -> advance past the current doc
+#   seek(target)  -> advance to the first match >= target
+
+
+class EmptyCursor:
+    def __init__(self) -> None:
+        self.doc = END
+
+    def next(self) -> int:
+        return END
+
+    def seek(self, target: int) -> int:
+        return END
+
+
+class TermCursor:
+    """Matches every doc of one postings list."""
+
+    def __init__(self, postings: PostingsCursor) -> None:
+        self.postings = postings
+        self.doc = postings.doc
+
+    def next(self) -> int:
+        self.doc = self.postings.next()
+        return self.doc
+
+    def seek(self, target: int) -> int:
+        self.doc = self.postings.seek(target)
+        return self.doc
+
+
+class AndCursor:
+    """Leapfrog intersection: children are sought to the largest doc among them."""
+
+    def __init__(self, children: Sequence) -> None:
+        self.children = list(children)
+        self.doc = self._align(max(c.doc for c in self.children))
+
+    def _align(self, target: int) -> int:
+        while target < END:
+            for c in self.children:
+                d = c.seek(target)
+                if d != target:
+                    target = d
+                    break
+            else:
+                break
+        self.doc = target if target < END else END
+        return self.doc
+
+    def next(self) -> int:
+        return self._align(self.children[0].next())
+
+    def seek(self, target: int) -> int:
+        if target <= self.doc:
+            return self.doc
+        return self._align(target)
+
+
+class OrCursor:
+    def __init__(self, children: Sequence) -> None:
+        self.children = list(children)
+        self.doc = min(c.doc for c in self.children)
+
+    def next(self) -> int:
+        current = self.doc
+        for c in self.children:
+            if c.doc == current:
+                c.next()
+        self.doc = min(c.doc for c in self.children)
+        return self.doc
+
+    def seek(self, target: int) -> int:
+        if target <= self.doc:
+            return self.doc
+        self.doc = min(c.seek(target) for c in self.children)
+        return self.doc
+
+
+class ListCursor:
+    """Matches the doc codes of a sorted list (e.g. the live docs, for NOT)."""
+
+    def __init__(self, codes: List[int]) -> None:
+        self.codes = codes
+        self.i = 0
+        self.doc = codes[0] if codes else END
+
+    def next(self) -> int:
+        self.i += 1
+        self.doc = self.codes[self.i] if self.i < len(self.codes) else END
+        return self.doc
+
+    def seek(self, target: int) -> int:
+        if target <= self.doc:
+            return self.doc
+        self.i = bisect_left(self.codes, target, self.i)
+        self.doc = self.codes[self.i] if self.i < len(self.codes) else END
+        return self.doc
+
+
+class FilterCursor:
+    """Matches the child's docs that are not in excluded (e.g. deleted docs)."""
+
+    def __init__(self, child, excluded: DocSet) -> None:
+        self.child = child
+        self.excluded = excluded
+        self.doc = self._settle(child.doc)
+
+    def _settle(self, d: int) -> int:
+        while d < END and d in self.excluded:
+            d = self.child.next()
+        self.doc = d
+        return d
+
+    def next(self) -> int:
+        return self._settle(self.child.next())
+
+    def seek(self, target: int) -> int:
+        if target <= self.doc:
+            return self.doc
+        return self._settle(self.child.seek(target))
+
+
+class AndNotCursor:
+    """Matches pos's docs that neg does not match; neg is only sought to pos's docs."""
+
+    def __init__(self, pos, neg) -> None:
+        self.pos = pos
+        self.neg = neg
+        self.doc = self._settle(pos.doc)
+
+    def _settle(self, d: int) -> int:
+        while d < END and self.neg.seek(d) == d:
+            d = self.pos.next()
+        self.doc = d
+        return d
+
+    def next(self) -> int:
+        return self._settle(self.pos.next())
+
+    def seek(self, target: int) -> int:
+        if target <= self.doc:
+            return self.doc
+        return self._settle(self.pos.seek(target))
+
+
+class PhraseCursor:
+    """Docs where the terms occur at consecutive positions (one cursor per phrase word)."""
+
+    def __init__(self, terms: Sequence[PostingsCursor]) -> None:
+        self.terms = list(terms)
+        self._and = AndCursor([TermCursor(t) for t in self.terms])
+        self.doc = self._settle(self._and.doc)
+
+    def _matches(self) -> bool:
+        return phrase_in([t.positions() for t in self.terms])
+
+    def _settle(self, d: int) -> int:
+        while d < END and not self._matches():
+            d = self._and.next()
+        self.doc = d
+        return d
+
+    def next(self) -> int:
+        return self._settle(self._and.next())
+
+    def seek(self, target: int) -> int:
+        if target <= self.doc:
+            return self.doc
+        return self._settle(self._and.seek(target))
+
+
+def top_k(root, score: Callable[[int], float | None], k: int) -> List[Tuple[int, float]]:
+    """Walks root in doc order keeping the k best (doc, score) in a min-heap.
+    score returns None for docs that must not be ranked. Ties favour lower doc codes.
+    """
+    heap: List[Tuple[float, int]] = []
+    d = root.doc
+    while d < END:
+        s = score(d)
+        if s is not None:
+            if len(heap) < k:
+                heapq.heappush(heap, (s, -d))
+            elif (s, -d) > heap[0]:
+                heapq.heapreplace(heap, (s, -d))
+        d = root.next()
+    return [(-neg_d, s) for s, neg_d in sorted(heap, reverse=True)]
+
+
+# Relative slack on score upper bounds so float rounding never prunes a doc that ties
+_BOUND_SLACK = 1.0 + 1e-9
+
+
+def wand_top_k(root, terms: Sequence[Tuple[PostingsCursor, Callable[[int], float]]],
+               score: Callable[[int], float | None], k: int, block_max: bool = False) -> List[Tuple[int, float]]:
+    """Top-k with WAND dynamic pruning (Block-Max WAND if block_max).
+    terms: one (cursor, weight) per distinct scoring term, where weight(tf) is the term's
+    contribution for that tf and is non-decreasing in tf, so weight(max_tf) of the list
+    (or of a block) bounds any doc in it. Only docs containing a scoring term are ranked,
+    as in top_k. root decides boolean matching; score must add up the same contributions.
+    """
+    heap: List[Tuple[float, int]] = []
+    theta = 0.0  # every contribution is positive, so any scoring doc beats 0
+    # (cursor, term upper bound, per-block upper bounds)
+    ts = [(cur, weight(cur.plist.max_tf), [weight(m) for m in cur.plist.block_max_tf] if block_max else [])
+          for cur, weight in terms if cur.doc < END]
+    while ts:
+        ts.sort(key=lambda t: t[0].doc)
+        # Pivot: first term at which the summed upper bounds could beat the threshold
+        acc = 0.0
+        p = -1
+        for i, t in enumerate(ts):
+            acc += t[1]
+            if acc * _BOUND_SLACK > theta:
+                p = i
+                break
+        if p < 0:
+            break
+        pivot = ts[p][0].doc
+        while p + 1 < len(ts) and ts[p + 1][0].doc == pivot:
+            p += 1
+        if block_max:
+            # Tighter bound from the blocks that would hold the pivot (no decoding needed)
+            bound = 0.0
+            skip_to = END
+            for cur, _, block_bounds in ts[:p + 1]:
+                plist = cur.plist
+                b = plist.find_block(pivot, max(cur.block, 0))
+                if b < plist.n_blocks:  # else the term has no docs left from the pivot on
+                    bound += block_bounds[b]
+                    skip_to = min(skip_to, plist.block_last[b] + 1)
+            if bound * _BOUND_SLACK <= theta:
+                if p + 1 < len(ts):
+                    skip_to = min(skip_to, ts[p + 1][0].doc)
+                for cur, _, _ in ts[:p + 1]:
+                    cur.seek(skip_to)
+                ts = [t for t in ts if t[0].doc < END]
+                continue
+        if ts[0][0].doc == pivot:
+            matched = root.seek(pivot)
+            if matched == pivot:
+                s = score(pivot)
+                if s is not None:
+                    if len(heap) < k:
+                        heapq.heappush(heap, (s, -pivot))
+                    elif (s, -pivot) > heap[0]:
+                        heapq.heapreplace(heap, (s, -pivot))
+                    if len(heap) == k:
+                        theta = heap[0][0]
+                for cur, _, _ in ts[:p + 1]:
+                    cur.next()
+            else:
+                # Nothing before root's next match can be returned
+                for cur, _, _ in ts:
+                    cur.seek(matched)
+        else:
+            ts[0][0].seek(pivot)
+        ts = [t for t in ts if t[0].doc < END]
+    return [(-neg_d, s) for s, neg_d in sorted(heap, reverse=True)]
@@ -1,18 +1,28 @@
 from __future__ import annotations
 
 import json
+import mmap
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from doctable import DocTableFile, write_doc_table
+from lexicon import Lexicon, LexiconWriter, TermInfo
+
+# Positions per run file line; a merge holds one line of each run at a time
+_RUN_LINE_POSITIONS = 4096
 
 
 class LocalStore:
-    """Custom local JSON-based store per index directory.
+    """Custom local store per index directory: binary postings, lexicon and doc table
+    files plus a JSON manifest.
     Layout:
-      meta.json       -> metadata
-      terms.jsonl     -> per-term line: {term, df, cf, offset}
-      postings.bin    -> contiguous binary blocks of postings payloads
-      lexicon.json    -> term -> {offset, length}
-      docs.json       -> doc_id -> {length}
+      meta.json       -> metadata and segment manifest
+      postings.bin    -> contiguous binary blocks of postings payloads (doc codes, tfs)
+      positions.bin   -> the matching positions payloads, only read for phrases
+      lexicon.bin     -> sorted front-coded term -> (df, cf, offsets, lengths), see lexicon.py
+      docs.bin        -> columnar doc table (ids, lengths) indexed by doc code, see doctable.py
+      seg-NNNNN/      -> segments added by update_index, same layout without meta.json
+      run-NNNNN.tmp   -> sorted partial inverted indexes, only present while building
     """
 
     def __init__(self, root: Path) -> None:
@@ -20,37 +30,116 @@ class LocalStore:
         self.root.mkdir(parents=True, exist_ok=True)
         self.meta_path = self.root / "meta.json"
         self.postings_path = self.root / "postings.bin"
-        self.lexicon_path = self.root / "lexicon.json"
-        self.docs_path = self.root / "docs.json"
+        self.positions_path = self.root / "positions.bin"
+        self.lexicon_path = self.root / "lexicon.bin"
+        self.docs_path = self.root / "docs.bin"
+        self._postings_view: memoryview | None = None
+        self._positions_view: memoryview | None = None
 
     def write_meta(self, meta: Dict) -> None:
-        self.meta_path.write_text(json.dumps(meta))
+        # Written via rename: meta.json is the manifest that commits index updates
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta))
+        tmp.replace(self.meta_path)
 
     def read_meta(self) -> Dict:
         return json.loads(self.meta_path.read_text())
 
-    def write_lexicon(self, lex: Dict[str, Tuple[int, int]]) -> None:
-        self.lexicon_path.write_text(json.dumps(lex))
+    def read_lexicon(self) -> Lexicon:
+        return Lexicon(self.lexicon_path)
+
+    def write_postings(self, items: Iterable[Tuple[str, int, Callable[[BinaryIO, BinaryIO], int]]]) -> int:
+        # Streams (term, df, write) in sorted term order into fresh postings, positions
+        # and lexicon files, returns the number of terms. write(postings, positions)
+        # appends the term's two payloads and returns its cf.
+        tmp = self.postings_path.with_suffix(".bin.tmp")
+        pos_tmp = self.positions_path.with_suffix(".bin.tmp")
+        lex_tmp = self.lexicon_path.with_suffix(".bin.tmp")
+        lex = LexiconWriter(lex_tmp)
+        n = 0
+        with tmp.open("wb") as f, pos_tmp.open("wb") as pf:
+            for term, df, write in items:
+                offset, pos_offset = f.tell(), pf.tell()
+                cf = write(f, pf)
+                lex.add(term, TermInfo(df, cf, offset, f.tell() - offset, pos_offset, pf.tell() - pos_offset))
+                n += 1
+        lex.close()
+        tmp.replace(self.postings_path)
+        pos_tmp.replace(self.positions_path)
+        lex_tmp.replace(self.lexicon_path)
+        return n
+
+    def map_postings(self) -> None:
+        """Memory-maps postings.bin and positions.bin so read_postings/read_positions
+        return zero-copy memoryview slices. Rebuilds replace the files via rename, so an
+        existing mapping keeps pointing at the old file contents and stays consistent
+        with the lexicon loaded with it.
+        """
+        self.unmap_postings()
+        self._postings_view = _map(self.postings_path)
+        self._positions_view = _map(self.positions_path)
+
+    def unmap_postings(self) -> None:
+        # The maps themselves are released once the last slice handed out is garbage collected
+        self._postings_view = None
+        self._positions_view = None
+
+    def read_postings(self, offset: int, length: int) -> bytes | memoryview:
+        return _read(self.postings_path, self._postings_view, offset, length)
+
+    def read_positions(self, offset: int, length: int) -> bytes | memoryview:
+        return _read(self.positions_path, self._positions_view, offset, length)
+
+    def write_docs(self, rows: Iterable[Tuple[int, str, int]]) -> int:
+        # (doc code, doc id, length) rows in increasing code order
+        return write_doc_table(self.docs_path, rows)
+
+    def read_docs(self) -> DocTableFile:
+        return DocTableFile(self.docs_path)
+
+    def run_path(self, n: int) -> Path:
+        return self.root / f"run-{n:05d}.tmp"
 
-    def read_lexicon(self) -> Dict[str, Tuple[int, int]]:
-        return json.loads(self.lexicon_path.read_text())
+    def clear_runs(self) -> None:
+        for p in self.root.glob("run-*.tmp"):
+            p.unlink()
 
-    def append_postings(self, payload: bytes) -> Tuple[int, int]:
-        # returns (offset, length)
-        with self.postings_path.open("ab") as f:
-            offset = f.tell()
-            f.write(payload)
-            return offset, len(payload)
+    def write_run(self, path: Path, items: Iterable[Tuple[str, int, Iterable[Tuple[int, List[int]]]]]) -> None:
+        # (term, df, entries) in sorted term order. One JSON line per up to
+        # _RUN_LINE_POSITIONS positions of a term: [term, df, [[doc_code, [pos, ...]], ...]]
+        with path.open("w", encoding="utf-8") as f:
+            for term, df, entries in items:
+                line: List[Tuple[int, List[int]]] = []
+                size = 0
+                for entry in entries:
+                    line.append(entry)
+                    size += len(entry[1])
+                    if size >= _RUN_LINE_POSITIONS:
+                        f.write(json.dumps([term, df, line]))
+                        f.write("\n")
+                        line, size = [], 0
+                if line:
+                    f.write(json.dumps([term, df, line]))
+                    f.write("\n")
 
-    def read_postings(self, offset: int, length: int) -> bytes:
-        with self.postings_path.open("rb") as f:
-            f.seek(offset)
-            return f.read(length)
+    def iter_run(self, path: Path) -> Iterator[Tuple[str, int, List[Tuple[int, List[int]]]]]:
+        # One (term, df, entries) per line; a long term spans consecutive lines
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                term, df, entries = json.loads(line)
+                yield term, df, entries
 
-    def write_docs(self, docs: Dict[str, Dict]) -> None:
-        self.docs_path.write_text(json.dumps(docs))
 
-    def read_docs(self) -> Dict[str, Dict]:
-        return json.loads(self.docs_path.read_text())
+def _map(path: Path) -> memoryview | None:
+    with path.open("rb") as f:
+        if path.stat().st_size == 0:
+            return None
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
 
 
+def _read(path: Path, view: memoryview | None, offset: int, length: int) -> bytes | memoryview:
+    if view is not None:
+        return view[offset:offset + length]
+    with path.open("rb") as f:
+        f.seek(offset)
+        return f.read(length)
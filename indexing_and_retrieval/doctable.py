@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from bisect import bisect_right
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from scoring import bm25_norms
+
+
+# Columnar doc table of one segment (docs.bin), covering doc codes
+# first_code .. first_code + n - 1 (merged segments may have holes):
+#   header   -> version u32, first_code u32, n u32, n_present u32
+#   id_off   -> (n + 1) x u64 offsets of each external doc id in the heap
+#   lengths  -> n x u32 token counts
+#   order    -> n_present x u32 row numbers sorted by doc id, for id -> code lookups
+#   present  -> n x u8, 0 for codes with no doc (dropped when segments were merged)
+#   heap     -> UTF-8 doc ids back to back
+# Columns are read as NumPy views over a memory map; every section is 4- or 8-byte aligned.
+DOCTABLE_VERSION = 1
+_HEADER = struct.Struct("<IIII")
+
+
+def write_doc_table(path: Path, rows: Iterable[Tuple[int, str, int]]) -> int:
+    """Writes (code, doc id, length) rows given in increasing code order; returns the row count."""
+    rows = list(rows)
+    first = rows[0][0] if rows else 0
+    n = rows[-1][0] - first + 1 if rows else 0
+    lengths = np.zeros(n, dtype="<u4")
+    present = np.zeros(n, dtype=np.uint8)
+    ids: List[bytes] = [b""] * n
+    for code, doc_id, length in rows:
+        i = code - first
+        lengths[i] = length
+        present[i] = 1
+        ids[i] = doc_id.encode("utf-8")
+    id_off = np.zeros(n + 1, dtype="<u8")
+    np.cumsum([len(b) for b in ids], out=id_off[1:])
+    order = np.array(sorted(np.flatnonzero(present).tolist(), key=ids.__getitem__), dtype="<u4")
+    tmp = path.with_suffix(".bin.tmp")
+    with tmp.open("wb") as f:
+        f.write(_HEADER.pack(DOCTABLE_VERSION, first, n, len(order)))
+        for column in (id_off, lengths, order, present):
+            f.write(column.tobytes())
+        f.write(b"".join(ids))
+    tmp.replace(path)
+    return len(rows)
+
+
+class DocTableFile:
+    """Memory-mapped doc table of one segment."""
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        version, self.first_code, self.n, n_present = _HEADER.unpack_from(self._map)
+        if version != DOCTABLE_VERSION:
+            raise ValueError(f"unsupported doc table format version {version}")
+        off = _HEADER.size
+        self.id_off = np.frombuffer(self._map, dtype="<u8", count=self.n + 1, offset=off)
+        off += 8 * (self.n + 1)
+        self.lengths = np.frombuffer(self._map, dtype="<u4", count=self.n, offset=off)
+        off += 4 * self.n
+        self.order = np.frombuffer(self._map, dtype="<u4", count=n_present, offset=off)
+        off += 4 * n_present
+        self.present = np.frombuffer(self._map, dtype=np.uint8, count=self.n, offset=off)
+        self._heap = off + self.n
+
+    def doc_id(self, code: int) -> str:
+        i = code - self.first_code
+        start, stop = int(self.id_off[i]), int(self.id_off[i + 1])
+        return self._map[self._heap + start:self._heap + stop].decode("utf-8")
+
+    def code_of(self, doc_id: str) -> int | None:
+        # Binary search over the rows sorted by doc id
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.doc_id(self.first_code + int(self.order[mid])) < doc_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.order):
+            code = self.first_code + int(self.order[lo])
+            if self.doc_id(code) == doc_id:
+                return code
+        return None
+
+
+class DocTable:
+    """Doc table of a whole index, indexed by doc code, over the segments' DocTableFiles.
+    lengths, norm (BM25 length normalization) and live are dense arrays over codes
+    0..max_code; live is False for unused, dropped and deleted codes.
+    """
+
+    def __init__(self, files: List[DocTableFile], deleted: np.ndarray) -> None:
+        # (first code of each file, files) in code order, replaced as a whole so that
+        # queries never pair one version's starts with another's files
+        self._files: Tuple[List[int], List[DocTableFile]] = ([], [])
+        self.lengths = np.zeros(1, dtype=np.uint32)
+        self.live = np.zeros(1, dtype=bool)
+        for f in files:
+            self._attach(f)
+        self.live[deleted] = False
+        self._norms_for: Tuple[float, np.ndarray, float] | None = None
+        self.refresh()
+
+    def _attach(self, f: DocTableFile) -> None:
+        if not f.n:
+            return
+        end = f.first_code + f.n
+        lengths, live = self.lengths, self.live
+        if len(lengths) < end:
+            grow = end - len(lengths)
+            lengths = np.concatenate((lengths, np.zeros(grow, dtype=np.uint32)))
+            live = np.concatenate((live, np.zeros(grow, dtype=bool)))
+        lengths[f.first_code:end] = f.lengths
+        live[f.first_code:end] = f.present != 0
+        self.lengths, self.live = lengths, live
+        self._publish(self.files + [f])
+
+    def _publish(self, files: List[DocTableFile]) -> None:
+        files = sorted(files, key=lambda f: f.first_code)
+        self._files = ([f.first_code for f in files], files)
+
+    @property
+    def files(self) -> List[DocTableFile]:
+        return self._files[1]
+
+    def refresh(self) -> None:
+        # Collection statistics over live docs
+        live_lengths = self.lengths[self.live]
+        self.n_live = len(live_lengths)
+        self.avgdl = float(live_lengths.mean()) if self.n_live else 1.0
+        self.norm = bm25_norms(self.lengths, self.avgdl)
+        # Smallest norm of a live doc, which gives BM25's largest weight for a tf
+        self.min_norm = float(self.norm[self.live].min()) if self.n_live else 1.0
+        self._norms_for = None
+
+    def norms_for(self, avgdl: float) -> Tuple[np.ndarray, float]:
+        """(norm, min_norm) computed with another average doc length, e.g. that of the
+        whole collection when this table is one shard of it. The last result is kept.
+        """
+        if self._norms_for is None or self._norms_for[0] != avgdl:
+            norm = bm25_norms(self.lengths, avgdl)
+            self._norms_for = (avgdl, norm, float(norm[self.live].min()) if self.n_live else 1.0)
+        return self._norms_for[1], self._norms_for[2]
+
+    def total_length(self) -> int:
+        """Sum of the lengths of live docs."""
+        return int(self.lengths[self.live].sum(dtype=np.int64))
+
+    def add_segment(self, f: DocTableFile, removed: List[int]) -> None:
+        self._attach(f)
+        self.live[removed] = False
+        self.refresh()
+
+    def replace_files(self, old: List[DocTableFile], new: DocTableFile) -> None:
+        # After a merge: same live docs, different files serving their ids. Runs on the
+        # merge thread while queries call doc_id(), hence the single swap in _publish.
+        self._publish([f for f in self.files if f not in old] + ([new] if new.n else []))
+
+    @property
+    def max_code(self) -> int:
+        return len(self.lengths) - 1
+
+    def live_codes(self) -> np.ndarray:
+        return np.flatnonzero(self.live)
+
+    def doc_id(self, code: int) -> str:
+        starts, files = self._files
+        i = bisect_right(starts, code) - 1
+        if i < 0 or code >= starts[i] + files[i].n:
+            raise KeyError(code)
+        return files[i].doc_id(code)
+
+    def code_of(self, doc_id: str) -> int | None:
+        """Code of the live doc with this external id, if any."""
+        for f in reversed(self.files):
+            code = f.code_of(doc_id)
+            if code is not None and self.live[code]:
+                return code
+        return None
+
+    def __len__(self) -> int:
+        return self.n_live
+
+    def __iter__(self) -> Iterator[str]:
+        """Live doc ids in code order."""
+        for code in self.live_codes().tolist():
+            yield self.doc_id(code)
+
+    def nbytes(self) -> int:
+        """Resident size of the dense columns (the per-segment files are memory-mapped)."""
+        return self.lengths.nbytes + self.live.nbytes + self.norm.nbytes
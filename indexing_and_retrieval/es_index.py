@@ -1,41 +1,72 @@
 from __future__ import annotations
 
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import Dict, Iterable, Iterator, List, Tuple
 
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch, NotFoundError, helpers
 
+from index_base import IndexBase
 
-def get_es(host: str = "http://localhost:9200") -> Elasticsearch:
-    # For local dev clusters with security disabled
-    return Elasticsearch(hosts=[host], verify_certs=False)
 
+# Bulk requests: docs per request and a byte cap (ES recommends 5-15 MB bulk bodies)
+_BULK_CHUNK_DOCS = 1000
+_BULK_CHUNK_BYTES = 10 * 1024 * 1024
+_TOP_K = 50
+# Searches per _msearch request
+_MSEARCH_SIZE = 100
+_SEARCH_FIELDS = ["title^2", "text"]
 
-def ensure_index(es: Elasticsearch, index_name: str) -> None:
-    if es.indices.exists(index=index_name):
-        return
-    mapping = {
-        "settings": {
-            "number_of_shards": 1,
-            "number_of_replicas": 0,
-            "analysis": {
-                "analyzer": {
-                    "english_custom": {
-                        "type": "standard",
-                        "stopwords": "_english_"
-                    }
-                }
-            }
-        },
-        "mappings": {
-            "properties": {
-                "doc_id": {"type": "keyword"},
-                "title": {"type": "text", "analyzer": "english"},
-                "text": {"type": "text", "analyzer": "english"},
-                "source": {"type": "keyword"}
+_SETTINGS = {
+    "number_of_shards": 1,
+    "number_of_replicas": 0,
+    "analysis": {
+        "analyzer": {
+            "english_custom": {
+                "type": "standard",
+                "stopwords": "_english_"
             }
         }
     }
-    es.indices.create(index=index_name, mappings=mapping["mappings"], settings=mapping["settings"])  # type: ignore[arg-type]
+}
+_MAPPINGS = {
+    "properties": {
+        "doc_id": {"type": "keyword"},
+        "title": {"type": "text", "analyzer": "english"},
+        "text": {"type": "text", "analyzer": "english"},
+        "source": {"type": "keyword"}
+    }
+}
+# IndexInfo -> similarity of the text fields; the scripts mirror scoring.py
+# (BOOLEAN queries are wrapped in constant_score instead)
+_SIMILARITY = {
+    "WORDCOUNT": {"type": "scripted", "script": {"source": "return query.boost * doc.freq;"}},
+    "TFIDF": {"type": "scripted", "script": {"source": (
+        "double idf = Math.log((field.docCount + 1.0) / (term.docFreq + 1.0)) + 1.0; "
+        "return query.boost * (1.0 + Math.log(doc.freq)) * idf;")}},
+    "BM25": {"type": "BM25", "k1": 1.2, "b": 0.75},
+}
+# Compression -> index.codec (stored fields); ES has no uncompressed codec
+_CODEC = {"NONE": "default", "CODE": "default", "CLIB": "best_compression"}
+
+
+def get_es(host: str = "http://localhost:9200", connections_per_node: int = 10,
+           request_timeout: float = 30.0, max_retries: int = 3) -> Elasticsearch:
+    # For local dev clusters with security disabled. Requests share a pool of
+    # connections_per_node keep-alive connections and are retried on gateway errors;
+    # bulk loads retry 429s themselves, with backoff (see _bulk).
+    return Elasticsearch(hosts=[host], verify_certs=False, connections_per_node=connections_per_node,
+                         request_timeout=request_timeout, max_retries=max_retries,
+                         retry_on_status=(502, 503, 504), retry_on_timeout=True)
+
+
+def ensure_index(es: Elasticsearch, index_name: str) -> None:
+    if es.indices.exists(index=index_name):
+        return
+    es.indices.create(index=index_name, mappings=_MAPPINGS, settings=_SETTINGS)  # type: ignore[arg-type]
 
 
 def _doc_actions(index_name: str, docs: Iterable[Dict]) -> Iterator[Dict]:
@@ -51,10 +82,236 @@ def _doc_actions(index_name: str, docs: Iterable[Dict]) -> Iterator[Dict]:
         }
 
 
-def bulk_index(es: Elasticsearch, index_name: str, docs: Iterable[Dict], batch_size: int = 2000) -> Tuple[int, int]:
-    success, failed = helpers.bulk(es, _doc_actions(index_name, docs), chunk_size=batch_size, raise_on_error=False)
-    # helpers.bulk returns (success_count, errors) where errors is a list when raise_on_error=False.
-    failed_count = len(failed) if isinstance(failed, list) else 0
-    return int(success), int(failed_count)
+def _bulk(es: Elasticsearch, actions: Iterable[Dict], chunk_size: int = _BULK_CHUNK_DOCS,
+          max_chunk_bytes: int = _BULK_CHUNK_BYTES, threads: int = 1, max_retries: int = 5,
+          initial_backoff: float = 1.0, max_backoff: float = 60.0) -> Tuple[int, int]:
+    # Streams actions through streaming_bulk, which retries docs (and whole requests)
+    # rejected with 429 after exponential backoff. With threads > 1 that many bulk
+    # streams pull from the same action iterator. Returns (succeeded, failed) docs.
+    options = dict(chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes, max_retries=max_retries,
+                   initial_backoff=initial_backoff, max_backoff=max_backoff, raise_on_error=False)
+
+    def run(stream: Iterable[Dict]) -> Tuple[int, int]:
+        ok = failed = 0
+        for success, _ in helpers.streaming_bulk(es, stream, **options):
+            if success:
+                ok += 1
+            else:
+                failed += 1
+        return ok, failed
+
+    if threads <= 1:
+        return run(actions)
+    source = iter(actions)
+    lock = threading.Lock()
+    done = object()
+
+    def shared() -> Iterator[Dict]:
+        while True:
+            with lock:
+                action = next(source, done)
+            if action is done:
+                return
+            yield action  # type: ignore[misc]
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        counts = [f.result() for f in [pool.submit(run, shared()) for _ in range(threads)]]
+    return sum(ok for ok, _ in counts), sum(failed for _, failed in counts)
+
+
+def bulk_index(es: Elasticsearch, index_name: str, docs: Iterable[Dict], batch_size: int = 2000,
+               threads: int = 1) -> Tuple[int, int]:
+    return _bulk(es, _doc_actions(index_name, docs), chunk_size=batch_size, threads=threads)
+
+
+def _search_body(query: str, size: int, boolean: bool = False) -> Dict:
+    q: Dict = {
+        "query_string": {
+            "query": query,
+            "fields": _SEARCH_FIELDS,
+            "default_operator": "AND"
+        }
+    }
+    if boolean:
+        q = {"constant_score": {"filter": q}}
+    # Ids and scores only; without an exact hit count ES can skip non-competitive docs
+    return {"query": q, "size": size, "_source": False, "track_total_hits": False}
+
+
+def search(es: Elasticsearch, index_name: str, query: str, size: int = 20) -> List[str]:
+    # Same boolean query_string search as the notebook's ES runs; returns the hit ids
+    resp = es.search(index=index_name, body=_search_body(query, size))
+    return [h.get("_id") for h in resp.get("hits", {}).get("hits", [])]
+
+
+def _index_name(index_id: str) -> str:
+    # ES index names are lowercase and cannot contain \ / * ? " < > | , # : or spaces
+    return re.sub(r'[\\/*?"<>|,#: ]', "-", index_id.lower()).lstrip("-_+")
+
+
+def _dump_name(serialized_index_dump: str) -> str:
+    # load_index takes the same "indices/<index_id>" path as SelfIndex, or a bare index id
+    parts = Path(serialized_index_dump).parts
+    return _index_name("/".join(parts[1:] if len(parts) > 1 and parts[0] == "indices" else parts))
+
+
+class ESIndex(IndexBase):
+    """Index variant stored in Elasticsearch. index ids map to ES index names (lowercased,
+    path separators replaced); the variant config is kept in the index's _meta mapping.
+    """
+
+    def __init__(self, core: str, info: str, dstore: str, qproc: str, compr: str, optim: str,
+                 host: str = "http://localhost:9200", es: Elasticsearch | None = None,
+                 connections: int = 10, bulk_threads: int = 4, chunk_size: int = _BULK_CHUNK_DOCS,
+                 max_chunk_bytes: int = _BULK_CHUNK_BYTES, max_retries: int = 5, initial_backoff: float = 1.0,
+                 max_backoff: float = 60.0, replicas: int = 0, refresh_interval: str = "1s",
+                 msearch_size: int = _MSEARCH_SIZE) -> None:
+        """
+        host / es: cluster to use; es replaces the client get_es(host, connections) builds.
+        connections: pooled keep-alive connections per node, shared by bulk threads and
+            concurrent queries.
+        bulk_threads: bulk requests in flight during create_index / update_index.
+        chunk_size, max_chunk_bytes: docs and bytes per bulk request.
+        max_retries, initial_backoff, max_backoff: docs rejected with 429 are retried up
+            to max_retries times, waiting initial_backoff * 2**attempt (capped) seconds.
+        replicas, refresh_interval: index settings restored after create_index; during
+            the load refresh is disabled and replicas are 0.
+        msearch_size: searches per _msearch request in query_batch.
+        """
+        super().__init__(core, info, dstore, qproc, compr, optim)
+        self.config = {"core": core, "info": info, "dstore": dstore, "qproc": qproc, "compr": compr, "optim": optim}
+        self.es = es if es is not None else get_es(host, connections_per_node=connections)
+        self.bulk_options: Dict = dict(chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes, threads=bulk_threads,
+                                 max_retries=max_retries, initial_backoff=initial_backoff, max_backoff=max_backoff)
+        self.replicas = replicas
+        self.refresh_interval = refresh_interval
+        self.msearch_size = msearch_size
+        self.index_name: str | None = None
+
+    @classmethod
+    def open(cls, index_id: str, host: str = "http://localhost:9200", es: Elasticsearch | None = None,
+             **options) -> 'ESIndex':
+        """Builds an ESIndex with the variant config stored in the index's _meta and
+        loads it. options are passed to the constructor.
+        """
+        es = es if es is not None else get_es(host, connections_per_node=options.pop("connections", 10))
+        name = _dump_name(index_id)
+        try:
+            mapping = es.indices.get_mapping(index=name)
+        except NotFoundError:
+            raise ValueError(f"no Elasticsearch index {name}")
+        config = mapping[name]["mappings"].get("_meta", {}).get("config")
+        if not config or config.get("core") != "ESIndex":
+            raise ValueError(f"Elasticsearch index {name} has no ESIndex config in _meta")
+        index = cls(**config, es=es, **options)
+        index.load_index(index_id)
+        return index
+
+    def _settings(self) -> Dict:
+        settings = json.loads(json.dumps(_SETTINGS))
+        settings["codec"] = _CODEC[self.config["compr"]]
+        if self.config["info"] in _SIMILARITY:
+            settings["similarity"] = {"default": _SIMILARITY[self.config["info"]]}
+        # Bulk load without refreshes or replicas; restored once the load is done
+        settings["refresh_interval"] = "-1"
+        settings["number_of_replicas"] = 0
+        return settings
+
+    def create_index(self, index_id: str, files: Iterable[tuple[str, str]]) -> None:
+        name = _index_name(index_id)
+        self.es.indices.delete(index=name, ignore_unavailable=True)
+        self.es.indices.create(index=name, settings=self._settings(),
+                               mappings={**_MAPPINGS, "_meta": {"config": self.config}})
+        try:
+            _, failed = self._bulk(name, self._index_actions(name, files))
+        finally:
+            self.es.indices.put_settings(index=name, settings={
+                "refresh_interval": self.refresh_interval, "number_of_replicas": self.replicas})
+        self.es.indices.refresh(index=name)
+        if failed:
+            raise RuntimeError(f"{failed} docs could not be indexed into {name}")
+        self.index_name = name
+
+    def _index_actions(self, name: str, files: Iterable[tuple[str, str]]) -> Iterator[Dict]:
+        # Texts are "title\ntext" as the notebook (and ingest.iter_documents) build them;
+        # the first line goes to the title field so the title^2 boost applies
+        for doc_id, text in files:
+            title, sep, body = text.partition("\n")
+            if not sep:
+                title, body = "", text
+            yield {"_index": name, "_id": doc_id, "_op_type": "index", "doc_id": doc_id, "title": title, "text": body}
+
+    def _bulk(self, name: str, actions: Iterable[Dict]) -> Tuple[int, int]:
+        return _bulk(self.es, actions, **self.bulk_options)
+
+    def load_index(self, serialized_index_dump: str) -> None:
+        # ES keeps the index; this only selects it
+        name = _dump_name(serialized_index_dump)
+        if not self.es.indices.exists(index=name):
+            raise ValueError(f"no Elasticsearch index {name}")
+        self.index_name = name
+
+    def update_index(self, index_id: str, remove_files: Iterable[tuple[str, str]], add_files: Iterable[tuple[str, str]]) -> None:
+        name = _index_name(index_id)
+        if not self.es.indices.exists(index=name):
+            self.create_index(index_id, add_files)
+            return
+        # Deletes go first so a doc both removed and added ends up with its new text;
+        # deletes of docs that are not there fail and are ignored
+        self._bulk(name, ({"_index": name, "_id": doc_id, "_op_type": "delete"} for doc_id, _ in remove_files))
+        _, failed_adds = self._bulk(name, self._index_actions(name, add_files))
+        self.es.indices.refresh(index=name)
+        self.index_name = name
+        if failed_adds:
+            raise RuntimeError(f"{failed_adds} docs could not be indexed into {name}")
+
+    def _body(self, query: str, k: int) -> Dict:
+        return _search_body(query, k, boolean=self.config["info"] == "BOOLEAN")
+
+    @staticmethod
+    def _response(resp: Dict) -> str:
+        hits = resp.get("hits", {}).get("hits", [])
+        return json.dumps({"results": [{"doc_id": h["_id"], "score": h["_score"]} for h in hits]})
+
+    def query(self, query: str) -> str:
+        if self.index_name is None:
+            raise RuntimeError("no index loaded; call create_index or load_index first")
+        return self._response(self.es.search(index=self.index_name, body=self._body(query, _TOP_K)))
+
+    def query_batch(self, queries: Iterable[str], k: int = _TOP_K) -> List[str]:
+        """Runs many queries through _msearch, msearch_size per request; returns the
+        same responses as query() (top k each). A search that failed inside the batch
+        gets {"results": [], "error": ...}.
+        """
+        if self.index_name is None:
+            raise RuntimeError("no index loaded; call create_index or load_index first")
+        queries = list(queries)
+        out: List[str] = []
+        for i in range(0, len(queries), self.msearch_size):
+            searches: List[Dict] = []
+            for q in queries[i:i + self.msearch_size]:
+                searches.append({})
+                searches.append(self._body(q, k))
+            resp = self.es.msearch(index=self.index_name, searches=searches)
+            for r in resp["responses"]:
+                if "error" in r:
+                    out.append(json.dumps({"results": [], "error": r["error"]}))
+                else:
+                    out.append(self._response(r))
+        return out
+
+    def delete_index(self, index_id: str) -> None:
+        name = _index_name(index_id)
+        self.es.indices.delete(index=name, ignore_unavailable=True)
+        if self.index_name == name:
+            self.index_name = None
 
+    def list_indices(self) -> Iterable[str]:
+        # ES indices created by ESIndex (those with its config in _meta)
+        mappings = self.es.indices.get_mapping(index="*", expand_wildcards="open")
+        return sorted(name for name, m in mappings.items()
+                      if m.get("mappings", {}).get("_meta", {}).get("config", {}).get("core") == "ESIndex")
 
+    def list_indexed_files(self, index_id: str) -> Iterable[str]:
+        hits = helpers.scan(self.es, index=_index_name(index_id), query={"query": {"match_all": {}}, "_source": False})
+        return [h["_id"] for h in hits]
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Streaming ingestion of local Parquet / Arrow IPC files. Files are read one record batch
+# at a time on a background thread that stays at most `prefetch` batches ahead of the
+# consumer, and rows are turned into Python objects one batch at a time, so memory for
+# the raw text is bounded by (prefetch + 1) batches however large the files are:
+#   idx.create_index(index_id, iter_documents(["wiki-00.parquet", "wiki-01.parquet"]))
+#   bulk_index(es, index_name, iter_records(["wiki-00.parquet"]))
+#   python ingest.py wiki-*.parquet --index-id wiki --info BM25 [--target es --es-index wiki]
+# Column defaults match the notebook's DataFrame: doc_id, title, text, source.
+logger = logging.getLogger(__name__)
+
+_PARQUET_SUFFIXES = (".parquet", ".pq")
+_BATCH_ROWS = 1024
+_PREFETCH = 4
+
+
+class IngestProgress(NamedTuple):
+    files_done: int
+    files: int
+    rows: int
+    # Rows in all files when the formats record it up front (Parquet), else None
+    total_rows: int | None
+    text_bytes: int
+    elapsed_s: float
+
+
+def _open_batches(path: Path, columns: Sequence[str], batch_rows: int) -> Tuple[List[str], Iterator[pa.RecordBatch]]:
+    # (columns present in the file, record batches of at most batch_rows rows)
+    if path.suffix.lower() in _PARQUET_SUFFIXES:
+        # Buffered column reads: without them whole row groups are read into memory
+        pf = pq.ParquetFile(path, buffer_size=1 << 20, pre_buffer=False)
+        present = [c for c in columns if c in pf.schema_arrow.names]
+        return present, pf.iter_batches(batch_size=batch_rows, columns=present)
+    source = pa.memory_map(str(path))
+    try:
+        reader = pa.ipc.open_file(source)
+        schema = reader.schema
+        batches: Iterable[pa.RecordBatch] = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        # Not the random-access file format; read it as an IPC stream
+        source.seek(0)
+        stream = pa.ipc.open_stream(source)
+        schema = stream.schema
+        batches = stream
+    present = [c for c in columns if c in schema.names]
+
+    def sliced() -> Iterator[pa.RecordBatch]:
+        for batch in batches:
+            for off in range(0, batch.num_rows, batch_rows):
+                yield batch.slice(off, batch_rows)
+    return present, sliced()
+
+
+def _total_rows(paths: Sequence[Path]) -> int | None:
+    total = 0
+    for path in paths:
+        if path.suffix.lower() not in _PARQUET_SUFFIXES:
+            return None
+        total += pq.ParquetFile(path).metadata.num_rows
+    return total
+
+
+def iter_batches(paths: Iterable[str | Path], columns: Sequence[str], batch_rows: int = _BATCH_ROWS,
+                 prefetch: int = _PREFETCH) -> Iterator[Tuple[int, Dict[str, list]]]:
+    """(file number, {column: values}) for each record batch of the files in order.
+    Columns missing from a file are left out of its batches. A reader thread decodes
+    up to prefetch batches ahead; stopping the iteration early stops the reader.
+    """
+    paths = [Path(p) for p in paths]
+    out: queue.Queue = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    done = object()
+
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read() -> None:
+        try:
+            for i, path in enumerate(paths):
+                present, batches = _open_batches(path, columns, batch_rows)
+                for batch in batches:
+                    item = (i, {c: batch.column(c).to_pylist() for c in present})
+                    if not put(item):
+                        return
+            put(done)
+        except BaseException as e:  # handed to the consumer
+            put(e)
+
+    reader = threading.Thread(target=read, name="ingest-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = out.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+def _text(values: Sequence[object]) -> str:
+    return "\n".join(str(v) for v in values if v is not None and v != "")
+
+
+def iter_documents(paths: Iterable[str | Path], id_column: str = "doc_id",
+                   text_columns: Sequence[str] = ("title", "text"), batch_rows: int = _BATCH_ROWS,
+                   prefetch: int = _PREFETCH,
+                   progress: Callable[[IngestProgress], None] | None = None) -> Iterator[Tuple[str, str]]:
+    """(doc_id, text) for every row, text being the non-empty text columns joined by a
+    newline (title, then text, as in the notebook), for SelfIndex.create_index or
+    update_index. progress is called after each batch has been consumed.
+    """
+    paths = [Path(p) for p in paths]
+    tracker = _Tracker(paths, progress)
+    for i, cols in iter_batches(paths, [id_column, *text_columns], batch_rows, prefetch):
+        if id_column not in cols:
+            raise ValueError(f"{paths[i]} has no {id_column!r} column")
+        texts = [cols[c] for c in text_columns if c in cols]
+        if not texts:
+            raise ValueError(f"{paths[i]} has none of the text columns {list(text_columns)}")
+        n_bytes = 0
+        for doc_id, *values in zip(cols[id_column], *texts):
+            text = _text(values)
+            n_bytes += len(text)
+            yield str(doc_id), text
+        tracker.batch_done(i, len(cols[id_column]), n_bytes)
+    tracker.finish()
+
+
+def iter_records(paths: Iterable[str | Path], columns: Sequence[str] = ("doc_id", "title", "text", "source"),
+                 batch_rows: int = _BATCH_ROWS, prefetch: int = _PREFETCH,
+                 progress: Callable[[IngestProgress], None] | None = None) -> Iterator[Dict[str, object]]:
+    """One dict of the given columns per row (missing columns left out), for
+    es_index.bulk_index. progress is called after each batch has been consumed.
+    """
+    paths = [Path(p) for p in paths]
+    tracker = _Tracker(paths, progress)
+    for i, cols in iter_batches(paths, columns, batch_rows, prefetch):
+        names = list(cols)
+        n_rows = n_bytes = 0
+        for values in zip(*(cols[c] for c in names)):
+            n_rows += 1
+            n_bytes += sum(len(v) for v in values if isinstance(v, str))
+            yield dict(zip(names, values))
+        tracker.batch_done(i, n_rows, n_bytes)
+    tracker.finish()
+
+
+class _Tracker:
+    def __init__(self, paths: Sequence[Path], progress: Callable[[IngestProgress], None] | None) -> None:
+        self.progress = progress
+        self.files = len(paths)
+        self.total_rows = _total_rows(paths) if progress is not None else None
+        self.file = 0
+        self.rows = 0
+        self.text_bytes = 0
+        self.start = time.perf_counter()
+
+    def _report(self, files_done: int) -> None:
+        if self.progress is not None:
+            self.progress(IngestProgress(files_done, self.files, self.rows, self.total_rows,
+                                         self.text_bytes, time.perf_counter() - self.start))
+
+    def batch_done(self, file: int, rows: int, text_bytes: int) -> None:
+        self.file = file
+        self.rows += rows
+        self.text_bytes += text_bytes
+        self._report(file)
+
+    def finish(self) -> None:
+        self._report(self.files)
+
+
+def log_progress(every_s: float = 5.0) -> Callable[[IngestProgress], None]:
+    """A progress callback that logs rows, MB of text and rows/s at most every every_s seconds."""
+    last = [-every_s]
+
+    def report(p: IngestProgress) -> None:
+        if p.elapsed_s - last[0] < every_s and p.files_done < p.files:
+            return
+        last[0] = p.elapsed_s
+        of = f"/{p.total_rows}" if p.total_rows is not None else ""
+        rate = p.rows / p.elapsed_s if p.elapsed_s > 0 else 0.0
+        logger.info("ingested %d%s rows (%.1f MB text) from %d/%d files, %.0f rows/s",
+                    p.rows, of, p.text_bytes / (1024 * 1024), p.files_done, p.files, rate)
+    return report
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Stream Parquet/Arrow files into a SelfIndex or Elasticsearch.")
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--target", choices=("self", "es"), default="self")
+    parser.add_argument("--index-id", help="SelfIndex id (default: the variant's identifier)")
+    parser.add_argument("--info", default="TFIDF")
+    parser.add_argument("--compr", default="CODE")
+    parser.add_argument("--qproc", default="TERMatat")
+    parser.add_argument("--optim", default="Null")
+    parser.add_argument("--workers", type=int, default=1, help="SelfIndex build processes")
+    parser.add_argument("--memory-budget-mb", type=float, default=512.0)
+    parser.add_argument("--es-index", help="Elasticsearch index name (es)")
+    parser.add_argument("--host", default="http://localhost:9200")
+    parser.add_argument("--batch-rows", type=int, default=_BATCH_ROWS)
+    parser.add_argument("--prefetch", type=int, default=_PREFETCH)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.target == "es":
+        from es_index import bulk_index, ensure_index, get_es
+        if not args.es_index:
+            parser.error("--target es needs --es-index")
+        es = get_es(args.host)
+        ensure_index(es, args.es_index)
+        ok, failed = bulk_index(es, args.es_index, iter_records(args.files, batch_rows=args.batch_rows,
+                                                                 prefetch=args.prefetch, progress=log_progress()))
+        logger.info("indexed %d docs into %s, %d failed", ok, args.es_index, failed)
+        return
+    from self_index import SelfIndex
+    idx = SelfIndex("SelfIndex", args.info, "CUSTOM", args.qproc, args.compr, args.optim,
+                    memory_budget_mb=args.memory_budget_mb, workers=args.workers)
+    index_id = args.index_id or idx.identifier_short
+    idx.create_index(index_id, iter_documents(args.files, batch_rows=args.batch_rows,
+                                              prefetch=args.prefetch, progress=log_progress()))
+    logger.info("built indices/%s", index_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple, Tuple
+
+
+# Binary lexicon (lexicon.bin), terms sorted by their UTF-8 bytes (= str order):
+#   header   -> version u8, block_size u32, n_terms u32, index_off u64, records_off u64
+#   terms    -> blocks of block_size front-coded terms; each term is
+#               (shared prefix length u16, suffix length u16, suffix bytes), and the
+#               first term of a block shares nothing so a block decodes on its own
+#   index    -> n_blocks x u64 byte offset of each block
+#   records  -> n_terms x (df u32, cf u32, postings offset u64, postings length u32,
+#               positions offset u64, positions length u32)
+# A lookup binary searches the first terms of the blocks, then scans one block.
+# The file is memory-mapped, so only the pages a query touches are read.
+LEXICON_VERSION = 2
+LEXICON_BLOCK = 16
+_HEADER = struct.Struct("<BIIQQ")
+_TERM = struct.Struct("<HH")
+_OFFSET = struct.Struct("<Q")
+_RECORD = struct.Struct("<IIQIQI")
+
+
+class TermInfo(NamedTuple):
+    df: int
+    cf: int
+    offset: int
+    length: int
+    pos_offset: int
+    pos_length: int
+
+
+class LexiconWriter:
+    """Streams (term, TermInfo) in sorted term order into a lexicon file."""
+
+    def __init__(self, path: Path, block_size: int = LEXICON_BLOCK) -> None:
+        self.path = path
+        self.block_size = block_size
+        self._f = path.open("wb")
+        self._f.write(b"\0" * _HEADER.size)
+        self._index = bytearray()
+        self._records = bytearray()
+        self._n = 0
+        self._prev = b""
+
+    def add(self, term: str, info: TermInfo) -> None:
+        key = term.encode("utf-8")
+        if self._n and key <= self._prev:
+            raise ValueError(f"lexicon terms must be unique and sorted, got {term!r} after {self._prev!r}")
+        if self._n % self.block_size == 0:
+            self._index += _OFFSET.pack(self._f.tell())
+            shared = 0
+        else:
+            shared = _common_prefix(self._prev, key)
+        self._f.write(_TERM.pack(shared, len(key) - shared))
+        self._f.write(key[shared:])
+        self._records += _RECORD.pack(*info)
+        self._prev = key
+        self._n += 1
+
+    def close(self) -> None:
+        index_off = self._f.tell()
+        self._f.write(self._index)
+        records_off = self._f.tell()
+        self._f.write(self._records)
+        self._f.seek(0)
+        self._f.write(_HEADER.pack(LEXICON_VERSION, self.block_size, self._n, index_off, records_off))
+        self._f.close()
+
+
+def _common_prefix(a: bytes, b: bytes) -> int:
+    n = min(len(a), len(b), 0xFFFF)
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class Lexicon:
+    """Read-only, memory-mapped view of a lexicon file. Behaves like a sorted
+    Mapping[str, TermInfo]: get(), in, iteration in term order and len().
+    """
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        version, self.block_size, self._n, self._index_off, self._records_off = _HEADER.unpack_from(self._map)
+        if version != LEXICON_VERSION:
+            raise ValueError(f"unsupported lexicon format version {version}")
+        self._n_blocks = (self._n + self.block_size - 1) // self.block_size
+        # First terms of the blocks probed so far; binary search always starts at the
+        # same blocks, so this in-memory index stays small
+        self._first_keys: Dict[int, bytes] = {}
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _block_offset(self, b: int) -> int:
+        return _OFFSET.unpack_from(self._map, self._index_off + b * _OFFSET.size)[0]
+
+    def _first_key(self, b: int) -> bytes:
+        key = self._first_keys.get(b)
+        if key is None:
+            off = self._block_offset(b)
+            _, n = _TERM.unpack_from(self._map, off)
+            start = off + _TERM.size
+            key = self._first_keys[b] = self._map[start:start + n]
+        return key
+
+    def _record(self, i: int) -> TermInfo:
+        return TermInfo(*_RECORD.unpack_from(self._map, self._records_off + i * _RECORD.size))
+
+    def _iter_block(self, b: int) -> Iterator[bytes]:
+        off = self._block_offset(b)
+        key = b""
+        for _ in range(min(self.block_size, self._n - b * self.block_size)):
+            shared, n = _TERM.unpack_from(self._map, off)
+            off += _TERM.size
+            key = key[:shared] + self._map[off:off + n]
+            off += n
+            yield key
+
+    def get(self, term: str) -> TermInfo | None:
+        key = term.encode("utf-8")
+        # Last block whose first term is <= key
+        lo, hi = 0, self._n_blocks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._first_key(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        b = lo - 1
+        if b < 0:
+            return None
+        for i, k in enumerate(self._iter_block(b)):
+            if k == key:
+                return self._record(b * self.block_size + i)
+            if k > key:
+                break
+        return None
+
+    def __contains__(self, term: str) -> bool:
+        return self.get(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for b in range(self._n_blocks):
+            for key in self._iter_block(b):
+                yield key.decode("utf-8")
+
+    def items(self) -> Iterator[Tuple[str, TermInfo]]:
+        for i, term in enumerate(self):
+            yield term, self._record(i)
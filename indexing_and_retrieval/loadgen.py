@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+
+# Open-loop load generator. Queries from a log are replayed at scheduled arrival times
+# (Poisson or constant, at the offered rate) whether or not earlier queries have
+# finished, on a pool of threads or processes. Latency is measured from each query's
+# scheduled send time, so time spent queued behind a saturated target counts; this is
+# the coordinated-omission correction a closed loop like metrics.measure_latency lacks.
+# Service time, from when a worker picked the query up, is reported alongside.
+#   python loadgen.py --target self --index indices/<id> --queries q.txt --rate 50 100 200 \
+#       [--duration 30] [--arrivals poisson|constant] [--concurrency 8] [--processes]
+#   python loadgen.py --target es --index <es index> [--host http://localhost:9200] ...
+# Several --rate values sweep the offered load; the saturation point is the highest rate
+# whose achieved throughput still keeps up with it.
+ARRIVALS = ("poisson", "constant")
+_PERCENTILES = (50.0, 75.0, 90.0, 95.0, 99.0, 99.9, 99.99, 100.0)
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of integer microsecond values. Values below
+    2**bits are counted exactly; above, every power-of-two range is split into 2**(bits-1)
+    equal buckets, so any value is kept to within 2**-(bits-1) of its magnitude
+    (bits=11: 3 significant decimal digits).
+    """
+
+    def __init__(self, bits: int = 11) -> None:
+        self.bits = bits
+        self._sub = 1 << bits
+        self._half = self._sub >> 1
+        self.counts: Counter[int] = Counter()
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+        self.min = 0
+
+    def _bucket(self, v: int) -> int:
+        if v < self._sub:
+            return v
+        shift = v.bit_length() - self.bits
+        return self._sub + (shift - 1) * self._half + (v >> shift) - self._half
+
+    def _highest(self, b: int) -> int:
+        # Largest value counted in bucket b
+        if b < self._sub:
+            return b
+        shift, m = divmod(b - self._sub, self._half)
+        return ((m + self._half + 1) << (shift + 1)) - 1
+
+    def record(self, value_us: float, count: int = 1) -> None:
+        v = max(0, int(value_us))
+        self.counts[self._bucket(v)] += count
+        if self.total == 0 or v < self.min:
+            self.min = v
+        self.max = max(self.max, v)
+        self.total += count
+        self.sum += v * count
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        assert other.bits == self.bits
+        if other.total:
+            self.min = min(self.min, other.min) if self.total else other.min
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def value_at(self, percentile: float) -> int:
+        """Smallest recorded value (to histogram precision) at or above percentile."""
+        if self.total == 0:
+            return 0
+        rank = max(1, -(-self.total * percentile // 100))
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= rank:
+                return min(self._highest(b), self.max)
+        return self.max
+
+    def summary_ms(self) -> Dict[str, float]:
+        out = {f"p{p:g}": self.value_at(p) / 1000.0 for p in _PERCENTILES}
+        out["mean"] = self.sum / self.total / 1000.0 if self.total else 0.0
+        out["min"] = self.min / 1000.0
+        out["count"] = self.total
+        return out
+
+    def export(self) -> Dict:
+        # Non-empty buckets as [highest value us, count]; enough to plot or re-merge
+        return {"bits": self.bits, "buckets": [[self._highest(b), self.counts[b]] for b in sorted(self.counts)]}
+
+
+def arrival_offsets(n: int, rate: float, arrivals: str = "poisson", seed: int = 0) -> List[float]:
+    """Send times in seconds from the start for n queries offered at rate per second."""
+    if arrivals not in ARRIVALS:
+        raise ValueError(f"arrivals must be one of {ARRIVALS}, got {arrivals!r}")
+    if arrivals == "constant":
+        return [i / rate for i in range(n)]
+    rng = random.Random(seed)
+    offsets: List[float] = []
+    t = 0.0
+    for _ in range(n):
+        offsets.append(t)
+        t += rng.expovariate(rate)
+    return offsets
+
+
+def open_target(kind: str, location: str, host: str = "http://localhost:9200", **options) -> Callable[[str], object]:
+    """Query function of a target: kind "self" opens the SelfIndex (or ShardedIndex)
+    persisted in the location directory, "es" searches the Elasticsearch index named
+    location on host. options go to the index constructor.
+    """
+    if kind == "self":
+        from sharded_index import ShardedIndex
+        from self_index import SelfIndex
+        meta = json.loads((Path(location) / "meta.json").read_text())
+        cls = ShardedIndex if "sharded" in meta else SelfIndex
+        return cls.open(location, **{**options, "background_merge": False}).query
+    if kind == "es":
+        from es_index import get_es, search
+        es = get_es(host)
+        return lambda q: search(es, location, q)
+    raise ValueError(f"unknown target kind {kind!r}")
+
+
+# --- Worker side (processes): one opened target per process ---
+_worker_fn: Callable[[str], object] | None = None
+
+
+def _init_worker(target: Dict) -> None:
+    global _worker_fn
+    _worker_fn = open_target(**target)
+
+
+def _ready() -> None:
+    return None
+
+
+def _worker_call(query: str) -> float:
+    assert _worker_fn is not None
+    return _timed_call(_worker_fn, query)
+
+
+def _timed_call(fn: Callable[[str], object], query: str) -> float:
+    # Service time in seconds, measured where the query runs
+    t0 = time.perf_counter()
+    fn(query)
+    return time.perf_counter() - t0
+
+
+def run_load(target: Callable[[str], object] | Dict, queries: Sequence[str], rate: float,
+             duration: float | None = None, n: int | None = None, arrivals: str = "poisson",
+             concurrency: int = 8, processes: bool = False, seed: int = 0, warmup: int = 0) -> Dict:
+    """Offers queries (replayed in order, cycling) at rate per second for duration
+    seconds, or n queries, and waits for all of them. target is a query function or,
+    with processes=True, the open_target() arguments each worker process opens.
+    warmup queries are first run through the pool unmeasured. Returns offered vs
+    achieved QPS and the response (from scheduled send time) and service time histograms.
+    """
+    if not queries:
+        raise ValueError("no queries to replay")
+    if n is None:
+        n = max(1, int(rate * (duration if duration is not None else 10.0)))
+    offsets = arrival_offsets(n, rate, arrivals, seed)
+    pool: Executor
+    if processes:
+        if not isinstance(target, dict):
+            raise ValueError("processes=True needs the target as open_target() arguments")
+        pool = ProcessPoolExecutor(max_workers=concurrency, initializer=_init_worker, initargs=(target,))
+        # Open the index in every worker before the clock starts
+        for f in [pool.submit(_ready) for _ in range(concurrency)]:
+            f.result()
+    else:
+        fn = open_target(**target) if isinstance(target, dict) else target
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+    if warmup > 0:
+        warm = [queries[i % len(queries)] for i in range(warmup)]
+        for f in [pool.submit(_worker_call, q) if processes else pool.submit(_timed_call, fn, q) for q in warm]:
+            f.exception()
+
+    response = LatencyHistogram()
+    service = LatencyHistogram()
+    lock = threading.Lock()
+    errors: List[str] = []
+    last_done = [0.0]
+    max_lag = 0.0
+
+    def done(scheduled: float, fut: Future) -> None:
+        finished = time.perf_counter()
+        with lock:
+            last_done[0] = max(last_done[0], finished)
+            if fut.exception() is not None:
+                errors.append(repr(fut.exception()))
+                return
+            response.record((finished - scheduled) * 1e6)
+            service.record(fut.result() * 1e6)
+
+    futures: List[Future] = []
+    try:
+        start = time.perf_counter()
+        for i, offset in enumerate(offsets):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            q = queries[i % len(queries)]
+            fut = pool.submit(_worker_call, q) if processes else pool.submit(_timed_call, fn, q)
+            fut.add_done_callback(lambda f, s=scheduled: done(s, f))
+            futures.append(fut)
+        for fut in futures:
+            fut.exception()
+    finally:
+        pool.shutdown()
+    # The arrivals actually drawn span window; an unsaturated run achieves sent / window
+    window = offsets[-1] + 1 / rate
+    elapsed = max(last_done[0] - start, window)
+    return {
+        "offered_qps": rate,
+        "arrivals": arrivals,
+        "concurrency": concurrency,
+        "mode": "processes" if processes else "threads",
+        "sent": n,
+        "sent_qps": n / window,
+        "completed": response.total,
+        "errors": len(errors),
+        "first_errors": errors[:5],
+        "elapsed_s": elapsed,
+        "achieved_qps": response.total / elapsed if elapsed > 0 else float("inf"),
+        # How late the generator itself sent queries; large values mean it could not keep up
+        "max_send_lag_ms": max_lag * 1000.0,
+        "response_ms": response.summary_ms(),
+        "service_ms": service.summary_ms(),
+        "response_hist": response.export(),
+        "service_hist": service.export(),
+    }
+
+
+def sweep(target: Callable[[str], object] | Dict, queries: Sequence[str], rates: Sequence[float],
+          **kwargs) -> List[Dict]:
+    """run_load at each offered rate in turn."""
+    return [run_load(target, queries, rate, **kwargs) for rate in rates]
+
+
+def saturation_point(results: Sequence[Dict], tolerance: float = 0.05) -> float | None:
+    """Highest offered rate whose achieved QPS was within tolerance of the rate the
+    queries were actually sent at (None if none).
+    """
+    ok = [r["offered_qps"] for r in results if r["achieved_qps"] >= (1 - tolerance) * r["sent_qps"]]
+    return max(ok) if ok else None
+
+
+def _summary(r: Dict) -> str:
+    resp, serv = r["response_ms"], r["service_ms"]
+    return (f"offered {r['offered_qps']:.0f} q/s (sent {r['sent_qps']:.1f}) achieved {r['achieved_qps']:.1f} q/s "
+            f"({r['completed']}/{r['sent']} ok, {r['errors']} errors) response p50/p99/p99.9/max "
+            f"{resp['p50']:.2f}/{resp['p99']:.2f}/{resp['p99.9']:.2f}/{resp['p100']:.2f}ms "
+            f"service p50/p99 {serv['p50']:.2f}/{serv['p99']:.2f}ms")
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Open-loop load test of a SelfIndex or Elasticsearch index.")
+    parser.add_argument("--target", choices=("self", "es"), default="self")
+    parser.add_argument("--index", required=True, help="index directory (self) or index name (es)")
+    parser.add_argument("--host", default="http://localhost:9200", help="Elasticsearch host (es)")
+    parser.add_argument("--queries", type=Path, required=True, help="query log, one query per line")
+    parser.add_argument("--rate", type=float, nargs="+", required=True, help="offered queries per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per rate")
+    parser.add_argument("--arrivals", choices=ARRIVALS, default="poisson")
+    parser.add_argument("--concurrency", type=int, default=8, help="worker threads or processes")
+    parser.add_argument("--processes", action="store_true", help="run queries in worker processes")
+    parser.add_argument("--warmup", type=int, default=0, help="unmeasured queries run before each rate")
+    parser.add_argument("--result-cache-mb", type=float, help="SelfIndex result cache size (0 disables it)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    queries = [q.strip() for q in args.queries.read_text(encoding="utf-8").splitlines() if q.strip()]
+    target: Dict = {"kind": args.target, "location": args.index, "host": args.host}
+    if args.target == "self" and args.result_cache_mb is not None:
+        # Replayed logs repeat queries; without this they mostly measure cache hits
+        target["result_cache_mb"] = args.result_cache_mb
+    if not args.processes:
+        # Open once; every rate of the sweep reuses the loaded index
+        target = open_target(**target)  # type: ignore[assignment]
+    results: List[Dict] = []
+    for rate in args.rate:
+        r = run_load(target, queries, rate, duration=args.duration, arrivals=args.arrivals,
+                     concurrency=args.concurrency, processes=args.processes, seed=args.seed,
+                     warmup=args.warmup)
+        print(_summary(r), flush=True)
+        results.append(r)
+    point = saturation_point(results)
+    print(f"saturation point: {point:.0f} q/s" if point is not None else "saturated at every offered rate")
+    if args.out is not None:
+        args.out.write_text(json.dumps({"index": args.index, "target": args.target, "results": results}, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import sys
 import time
 from statistics import mean
 from typing import Callable, Dict, Iterable, List, Sequence, Tuple
@@ -41,6 +42,17 @@ def measure_throughput(fn: Callable[[str], object], queries: Sequence[str]) -> f
     return float(len(queries) / elapsed) if elapsed > 0 else float("inf")
 
 
+def measure_batch_throughput(fn: Callable[[Sequence[str]], object], queries: Sequence[str]) -> float:
+    # Queries per second when all queries go through one batched call (e.g. SelfIndex.query_batch)
+    if not queries:
+        return 0.0
+    t0 = time.perf_counter()
+    _ = fn(queries)
+    t1 = time.perf_counter()
+    elapsed = t1 - t0
+    return float(len(queries) / elapsed) if elapsed > 0 else float("inf")
+
+
 def precision_recall_at_k(predicted: Sequence[str], relevant: Sequence[str], k: int) -> Tuple[float, float]:
     k = max(1, min(k, len(predicted)))
     topk = set(predicted[:k])
@@ -68,3 +80,13 @@ def mean_average_precision(preds: Sequence[Sequence[str]], rels: Sequence[Sequen
     return float(mean(ap_values)) if ap_values else 0.0
 
 
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    try:
+        import resource
+    except ImportError:  # Windows: psutil reports the peak working set
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024)
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Sequence
+
+
+# Query plans are hashable tuples, so repeated subexpressions compare equal:
+#   ('EMPTY',)                 matches nothing
+#   ('TERM', term)             one normalized term
+#   ('PHRASE', (t1, t2, ...))  consecutive normalized terms (two or more)
+#   ('AND', c1, c2, ...)       n-ary, children ordered rarest first
+#   ('OR', c1, c2, ...)        n-ary
+#   ('NOT', c)                 complement against all live docs
+#   ('ANDNOT', pos, neg)       pos minus neg, without building a complement
+# Costs are rough counts of postings entries (or docs) touched; doc estimates assume
+# independent terms and only serve to order operands and explain plans.
+Plan = tuple
+
+
+class Planner:
+    """Rewrites a parsed query AST into an evaluation plan using term dfs.
+    term_key maps TERM text to its normalized term (None if it has none), phrase_terms
+    maps PHRASE text to its normalized terms, df gives a term's document frequency.
+    """
+
+    def __init__(self, term_key: Callable[[str], str | None], phrase_terms: Callable[[str], List[str]],
+                 df: Callable[[str], int], n_docs: int) -> None:
+        self.term_key = term_key
+        self.phrase_terms = phrase_terms
+        self.df = df
+        self.n_docs = max(n_docs, 1)
+        self._df: Dict[str, int] = {}
+
+    def term_df(self, term: str) -> int:
+        if term not in self._df:
+            self._df[term] = self.df(term)
+        return self._df[term]
+
+    def plan(self, ast) -> Plan:
+        return self._rewrite(ast)
+
+    def _rewrite(self, node) -> Plan:
+        kind = node[0]
+        if kind == 'TERM':
+            term = self.term_key(node[1])
+            return ('TERM', term) if term is not None and self.term_df(term) else ('EMPTY',)
+        if kind == 'PHRASE':
+            terms = self.phrase_terms(node[1])
+            if not terms or any(not self.term_df(t) for t in terms):
+                return ('EMPTY',)
+            return ('TERM', terms[0]) if len(terms) == 1 else ('PHRASE', tuple(terms))
+        if kind == 'NOT':
+            child = self._rewrite(node[1])
+            if child[0] == 'NOT':
+                return child[1]
+            return ('NOT', child)
+        if kind in ('AND', 'OR'):
+            children = _dedupe(self._flatten(node, kind))
+            return self._rewrite_and(children) if kind == 'AND' else self._rewrite_or(children)
+        return ('EMPTY',)
+
+    def _flatten(self, node, kind: str) -> List[Plan]:
+        # Rewrites the operands of a chain of one operator, inlining nested chains
+        out: List[Plan] = []
+        for child in node[1:]:
+            if child[0] == kind:
+                out.extend(self._flatten(child, kind))
+            else:
+                rewritten = self._rewrite(child)
+                out.extend(rewritten[1:] if rewritten[0] == kind else [rewritten])
+        return out
+
+    def _rewrite_and(self, children: List[Plan]) -> Plan:
+        if any(c[0] == 'EMPTY' for c in children):
+            return ('EMPTY',)
+        pos = sorted((c for c in children if c[0] != 'NOT'), key=self.estimate)
+        negs: List[Plan] = []
+        for c in children:
+            if c[0] == 'NOT':
+                negs.extend(c[1][1:] if c[1][0] == 'OR' else [c[1]])
+        # NOT a AND NOT b == NOT (a OR b); the union is built once instead of two complements
+        neg = self._rewrite_or(_dedupe(negs)) if negs else None
+        if not pos:
+            return ('NOT', neg)
+        base = pos[0] if len(pos) == 1 else ('AND',) + tuple(pos)
+        if neg is None or neg[0] == 'EMPTY':
+            return base
+        return ('ANDNOT', base, neg)
+
+    def _rewrite_or(self, children: List[Plan]) -> Plan:
+        children = [c for c in children if c[0] != 'EMPTY']
+        if not children:
+            return ('EMPTY',)
+        if len(children) == 1:
+            return children[0]
+        return ('OR',) + tuple(children)
+
+    def estimate(self, node: Plan) -> int:
+        """Estimated number of matching docs."""
+        kind = node[0]
+        n = self.n_docs
+        if kind == 'TERM':
+            return self.term_df(node[1])
+        if kind == 'PHRASE':
+            return min(self.term_df(t) for t in node[1])
+        if kind == 'AND':
+            p = 1.0
+            for c in node[1:]:
+                p *= self.estimate(c) / n
+            return max(1, int(p * n)) if p else 0
+        if kind == 'OR':
+            q = 1.0
+            for c in node[1:]:
+                q *= 1.0 - self.estimate(c) / n
+            return int((1.0 - q) * n)
+        if kind == 'NOT':
+            return n - self.estimate(node[1])
+        if kind == 'ANDNOT':
+            return int(self.estimate(node[1]) * (1.0 - self.estimate(node[2]) / n))
+        return 0
+
+    def cost(self, node: Plan) -> int:
+        """Estimated work: postings entries decoded plus docs materialized by complements."""
+        kind = node[0]
+        if kind == 'TERM':
+            return self.term_df(node[1])
+        if kind == 'PHRASE':
+            # doc ids of every term plus positions for the candidate docs
+            return sum(self.term_df(t) for t in node[1]) + len(node[1]) * self.estimate(node)
+        if kind == 'NOT':
+            return self.n_docs + self.cost(node[1])
+        if kind in ('AND', 'OR', 'ANDNOT'):
+            return sum(self.cost(c) for c in node[1:])
+        return 0
+
+    def explain(self, node: Plan) -> Dict:
+        out: Dict = {"op": node[0]}
+        if node[0] == 'TERM':
+            out["term"] = node[1]
+        elif node[0] == 'PHRASE':
+            out["terms"] = list(node[1])
+        elif node[0] != 'EMPTY':
+            out["children"] = [self.explain(c) for c in node[1:]]
+        out["est_docs"] = self.estimate(node)
+        out["est_cost"] = self.cost(node)
+        return out
+
+
+def _dedupe(children: Sequence[Plan]) -> List[Plan]:
+    seen = set()
+    out: List[Plan] = []
+    for c in children:
+        if c not in seen:
+            seen.add(c)
+            out.append(c)
+    return out
+
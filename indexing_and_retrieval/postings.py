@@ -0,0 +1,493 @@
+from __future__ import annotations
+
+import io
+import math
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from typing import BinaryIO, Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+import tracing
+from compression import vbyte_encode, vbyte_decode, vbyte_decode_array, zlib_compress, zlib_compressor, zlib_decompress
+
+
+# Binary postings layout, two payloads per term:
+#   docs payload (postings.bin)
+#     header  -> fixed 17 bytes: version u8, df u32, cf u32, max_tf u32, n_blocks u32
+#     skips   -> n_blocks x (last_doc u32, count u32, max_tf u32, docs_off u32, pos_off u32)
+#     body    -> per block, count doc-code gaps then count tfs
+#   positions payload (positions.bin)
+#     per block, position gaps of each doc (first one absolute)
+# Doc gaps restart at each block (relative to the previous block's last doc) so any
+# block can be decoded on its own; docs_off is a byte offset into the body, pos_off
+# into the positions payload. Queries without phrases never read positions.bin.
+# The term and block max_tf bound the score any doc in them can get (used by WAND/BMW).
+# Header and skip table are never compressed. Each block section is stored per
+# Compression mode:
+#   NONE -> little-endian uint32 array
+#   CODE -> vbyte
+#   CLIB -> zlib over the uint32 array
+# With optim=Null a term has a single block.
+POSTINGS_VERSION = 4
+_HEADER = struct.Struct("<BIIII")
+_SKIP = struct.Struct("<IIIII")
+# Cursor position past the last doc code
+END = 1 << 62
+# Position gaps PostingsWriter buffers before encoding them
+_POS_CHUNK = 1 << 16
+
+
+def _to_u32(ints: List[int]) -> bytes:
+    arr = array("I", ints)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_u32(data: bytes | memoryview) -> List[int]:
+    arr = array("I")
+    arr.frombytes(data)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tolist()
+
+
+def _encode_ints(ints: List[int], compr: str) -> bytes:
+    if compr == "CODE":
+        return vbyte_encode(ints)
+    if compr == "CLIB":
+        return zlib_compress(_to_u32(ints))
+    return _to_u32(ints)
+
+
+def _decode_ints(data: bytes | memoryview, compr: str) -> List[int]:
+    if compr == "CODE":
+        return vbyte_decode(data)
+    if compr == "CLIB":
+        return _from_u32(zlib_decompress(data))
+    return _from_u32(data)
+
+
+def _decode_array(data: bytes | memoryview, compr: str) -> np.ndarray:
+    if compr == "CODE":
+        return vbyte_decode_array(data)
+    if compr == "CLIB":
+        data = zlib_decompress(data)
+    return np.frombuffer(data, dtype="<u4").astype(np.int64)
+
+
+def skip_block_size(df: int, block_size: int | None) -> int:
+    """Docs per skip block: block_size if given, else sqrt(df) spacing."""
+    if block_size:
+        return block_size
+    return max(1, int(math.sqrt(df)))
+
+
+def encode_postings(doc_map: Dict[int, List[int]], compr: str, block_size: int | None = 0) -> Tuple[bytes, bytes]:
+    """Returns the (docs, positions) payloads.
+    block_size: docs per skip block, None for sqrt(df) spacing, 0 for no skips.
+    """
+    out, pos_out = io.BytesIO(), io.BytesIO()
+    writer = PostingsWriter(out, pos_out, compr, len(doc_map), block_size)
+    for d in sorted(doc_map):
+        writer.add(d, doc_map[d])
+    writer.close()
+    return out.getvalue(), pos_out.getvalue()
+
+
+class PostingsWriter:
+    """Writes one term's payloads as encode_postings would, with (doc code, positions)
+    added in increasing code order. Each skip block goes to out, and its position gaps
+    to pos_out, as soon as it fills; the header and skip table are filled in by close,
+    which returns cf. df must be known up front since the block spacing depends on it.
+    Memory is one block's doc gaps and tfs (the whole term's, 8 bytes a doc, with a
+    single block) plus at most _POS_CHUNK position gaps.
+    """
+
+    def __init__(self, out: BinaryIO, pos_out: BinaryIO, compr: str, df: int, block_size: int | None = 0) -> None:
+        self.out = out
+        self.pos_out = pos_out
+        self.compr = compr
+        self.df = df
+        self.step = skip_block_size(df, block_size) if block_size != 0 else max(df, 1)
+        self.cf = 0
+        self.max_tf = 0
+        self.n = 0
+        self._start = out.tell()
+        out.write(bytes(_HEADER.size + -(-df // self.step) * _SKIP.size))
+        self._docs_start = out.tell()
+        self._pos_start = pos_out.tell()
+        self._skips: List[Tuple[int, int, int, int, int]] = []
+        self._gaps = array("I")
+        self._tfs = array("I")
+        self._prev_doc = 0
+        self._pos_gaps: List[int] = []
+        # Set once a block's position gaps outgrow _POS_CHUNK and are compressed in pieces
+        self._zlib = None
+        self._pos_block_start = self._pos_start
+
+    def add(self, doc: int, positions: Iterable[int]) -> None:
+        if self.n and doc <= self._prev_doc:
+            raise ValueError(f"doc code {doc} added after {self._prev_doc}")
+        self._gaps.append(doc - self._prev_doc)
+        self._prev_doc = doc
+        pos_gaps = self._pos_gaps
+        prev_pos = 0
+        tf = 0
+        for p in sorted(positions):
+            pos_gaps.append(p - prev_pos)
+            prev_pos = p
+            tf += 1
+        self._tfs.append(tf)
+        self.cf += tf
+        self.n += 1
+        if len(pos_gaps) >= _POS_CHUNK:
+            self._write_positions()
+        if len(self._gaps) == self.step:
+            self._flush_block()
+
+    def _write_positions(self) -> None:
+        # vbyte and uint32 sections concatenate; zlib ones go through one stream per block
+        if self.compr == "CLIB":
+            if self._zlib is None:
+                self._zlib = zlib_compressor()
+            self.pos_out.write(self._zlib.compress(_to_u32(self._pos_gaps)))
+        else:
+            self.pos_out.write(_encode_ints(self._pos_gaps, self.compr))
+        self._pos_gaps = []
+
+    def _flush_block(self) -> None:
+        if self._zlib is not None:
+            self._write_positions()
+            self.pos_out.write(self._zlib.flush())
+            self._zlib = None
+        else:
+            self.pos_out.write(_encode_ints(self._pos_gaps, self.compr))
+            self._pos_gaps = []
+        block_max = max(self._tfs)
+        self.max_tf = max(self.max_tf, block_max)
+        self._skips.append((self._prev_doc, len(self._gaps), block_max,
+                            self.out.tell() - self._docs_start, self._pos_block_start - self._pos_start))
+        self.out.write(_encode_ints((self._gaps + self._tfs).tolist(), self.compr))
+        self._pos_block_start = self.pos_out.tell()
+        self._gaps = array("I")
+        self._tfs = array("I")
+
+    def close(self) -> int:
+        if self._gaps:
+            self._flush_block()
+        if self.n != self.df:
+            raise ValueError(f"expected {self.df} docs, got {self.n}")
+        end = self.out.tell()
+        self.out.seek(self._start)
+        self.out.write(_HEADER.pack(POSTINGS_VERSION, self.df, self.cf, self.max_tf, len(self._skips)))
+        self.out.write(b"".join(_SKIP.pack(*s) for s in self._skips))
+        self.out.seek(end)
+        return self.cf
+
+
+def read_header(payload: bytes | memoryview) -> Tuple[int, int, int]:
+    """Returns (df, cf, max_tf) without decoding the body."""
+    version, df, cf, max_tf, _ = _HEADER.unpack_from(payload)
+    if version != POSTINGS_VERSION:
+        raise ValueError(f"unsupported postings format version {version}")
+    return df, cf, max_tf
+
+
+class PostingsList:
+    """Lazily decoded view over one term's postings payload.
+    Only the header and skip table are parsed up front; blocks are decoded on demand.
+    positions returns the term's positions payload; it is only called once positions
+    are first needed.
+    """
+
+    def __init__(self, payload: bytes | memoryview, compr: str,
+                 positions: Callable[[], bytes | memoryview] | None = None) -> None:
+        self.df, self.cf, self.max_tf = read_header(payload)
+        self.compr = compr
+        n_blocks = _HEADER.unpack_from(payload)[4]
+        skips_end = _HEADER.size + n_blocks * _SKIP.size
+        table = _from_u32(payload[_HEADER.size:skips_end])
+        self.block_last: List[int] = table[0::5]
+        self.block_count: List[int] = table[1::5]
+        self.block_max_tf: List[int] = table[2::5]
+        self._docs_off: List[int] = table[3::5]
+        self._pos_off: List[int] = table[4::5]
+        self._body = payload[skips_end:]
+        self._read_positions = positions
+        self._positions: bytes | memoryview | None = None
+        self._docs: Dict[int, Tuple[List[int], List[int]]] = {}
+        self.blocks_decoded = 0
+        # When set, cursors keep decoded blocks on the list (block_docs), and position
+        # gaps are kept too, so that later readers of the same list reuse them
+        self.keep_blocks = False
+        self._pos_gaps: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return self.df
+
+    @property
+    def n_blocks(self) -> int:
+        return len(self.block_last)
+
+    def _section(self, offsets: List[int], b: int, end: int) -> bytes | memoryview:
+        stop = offsets[b + 1] if b + 1 < len(offsets) else end
+        return self._body[offsets[b]:stop]
+
+    def decode_block(self, b: int) -> Tuple[List[int], List[int]]:
+        """Decodes (doc codes, tfs) of block b without keeping them."""
+        n = self.block_count[b]
+        trace = tracing.current()
+        if trace is not None:
+            trace.push("decode")
+        ints = _decode_ints(self._section(self._docs_off, b, len(self._body)), self.compr)
+        base = self.block_last[b - 1] if b else 0
+        ints[0] += base
+        self.blocks_decoded += 1
+        docs = list(accumulate(ints[:n]))
+        if trace is not None:
+            trace.pop()
+            trace.count("blocks_decoded")
+            trace.count("postings_decoded", n)
+        return docs, ints[n:2 * n]
+
+    def block_docs(self, b: int) -> Tuple[List[int], List[int]]:
+        """Returns (doc codes, tfs) of block b, decoded once and kept on this list."""
+        cached = self._docs.get(b)
+        if cached is None:
+            cached = self._docs[b] = self.decode_block(b)
+        return cached
+
+    def _position_gaps(self, b: int) -> List[int]:
+        if not self.keep_blocks:
+            return self._decode_position_gaps(b)
+        gaps = self._pos_gaps.get(b)
+        if gaps is None:
+            gaps = self._pos_gaps[b] = self._decode_position_gaps(b)
+        return gaps
+
+    def _decode_position_gaps(self, b: int) -> List[int]:
+        if self._positions is None:
+            if self._read_positions is None:
+                raise ValueError("postings list was opened without its positions")
+            self._positions = self._read_positions()
+        stop = self._pos_off[b + 1] if b + 1 < len(self._pos_off) else len(self._positions)
+        trace = tracing.current()
+        if trace is not None:
+            trace.push("decode")
+        gaps = _decode_ints(self._positions[self._pos_off[b]:stop], self.compr)
+        if trace is not None:
+            trace.pop()
+            trace.count("positions_decoded", len(gaps))
+        return gaps
+
+    def block_positions(self, b: int, tfs: List[int] | None = None) -> List[List[int]]:
+        """Returns the absolute position list of every doc in block b."""
+        if tfs is None:
+            tfs = self.block_docs(b)[1]
+        gaps = self._position_gaps(b)
+        out: List[List[int]] = []
+        i = 0
+        for tf in tfs:
+            out.append(list(accumulate(gaps[i:i + tf])))
+            i += tf
+        return out
+
+    def docs(self) -> List[int]:
+        out: List[int] = []
+        for b in range(self.n_blocks):
+            out.extend(self.block_docs(b)[0])
+        return out
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (doc codes, tfs) of the whole list as int64 arrays, positions untouched."""
+        gaps: List[np.ndarray] = []
+        tfs: List[np.ndarray] = []
+        tracing.push("decode")
+        for b, n in enumerate(self.block_count):
+            ints = _decode_array(self._section(self._docs_off, b, len(self._body)), self.compr)
+            gaps.append(ints[:n])
+            tfs.append(ints[n:2 * n])
+        if not gaps:
+            tracing.pop()
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # Each block's first gap is relative to the previous block's last doc
+        docs = np.cumsum(np.concatenate(gaps))
+        tracing.pop()
+        tracing.count("blocks_decoded", len(gaps))
+        tracing.count("postings_decoded", len(docs))
+        return docs, np.concatenate(tfs)
+
+    def find_block(self, doc: int, start: int = 0) -> int:
+        """Index of the first block at or after start that may contain doc (n_blocks if none)."""
+        return bisect_left(self.block_last, doc, start)
+
+    def intersect(self, candidates: Iterable[int]) -> List[int]:
+        """Sorted candidates that occur in this list; blocks that cannot contain a
+        candidate are skipped via the skip table without being decoded.
+        """
+        out: List[int] = []
+        b = 0
+        n_blocks = self.n_blocks
+        for d in candidates:
+            b = self.find_block(d, b)
+            if b >= n_blocks:
+                break
+            docs = self.block_docs(b)[0]
+            i = bisect_left(docs, d)
+            if i < len(docs) and docs[i] == d:
+                out.append(d)
+        return out
+
+    def positions_for(self, docs: Iterable[int]) -> Dict[int, List[int]]:
+        """Position lists for the given sorted doc codes (all must be present). Only the
+        blocks holding them are decoded, and only their own gaps are accumulated.
+        """
+        out: Dict[int, List[int]] = {}
+        b = -1
+        block_docs: List[int] = []
+        starts: List[int] = []
+        gaps: List[int] = []
+        for d in docs:
+            if b < 0 or d > self.block_last[b]:
+                b = self.find_block(d, max(b, 0))
+                block_docs, tfs = self.block_docs(b)
+                starts = list(accumulate(tfs, initial=0))
+                gaps = self._position_gaps(b)
+            i = bisect_left(block_docs, d)
+            out[d] = list(accumulate(gaps[starts[i]:starts[i + 1]]))
+        return out
+
+    def cursor(self) -> PostingsCursor:
+        return PostingsCursor(self)
+
+    def to_dict(self) -> Dict[int, List[int]]:
+        postings: Dict[int, List[int]] = {}
+        for b in range(self.n_blocks):
+            docs, _ = self.block_docs(b)
+            postings.update(zip(docs, self.block_positions(b)))
+        return postings
+
+
+class ChainedPostings(PostingsList):
+    """One term's postings spread over several segments, read as a single list.
+    Segments cover increasing, disjoint doc code ranges and every segment's first block
+    stores absolute doc codes, so the blocks of the parts are simply concatenated.
+    """
+
+    def __init__(self, parts: List[PostingsList]) -> None:
+        self.parts = parts
+        self.compr = parts[0].compr
+        self.df = sum(p.df for p in parts)
+        self.cf = sum(p.cf for p in parts)
+        self.max_tf = max(p.max_tf for p in parts)
+        self.block_last = [d for p in parts for d in p.block_last]
+        self.block_count = [n for p in parts for n in p.block_count]
+        self.block_max_tf = [m for p in parts for m in p.block_max_tf]
+        # Global index of each part's first block
+        self._starts = list(accumulate([0] + [p.n_blocks for p in parts[:-1]]))
+        self._docs = {}
+        self.blocks_decoded = 0
+        self.keep_blocks = False
+        self._pos_gaps = {}
+
+    def _locate(self, b: int) -> Tuple[PostingsList, int]:
+        i = bisect_left(self._starts, b + 1) - 1
+        return self.parts[i], b - self._starts[i]
+
+    def decode_block(self, b: int) -> Tuple[List[int], List[int]]:
+        part, local = self._locate(b)
+        self.blocks_decoded += 1
+        return part.decode_block(local)
+
+    def _decode_position_gaps(self, b: int) -> List[int]:
+        part, local = self._locate(b)
+        return part._decode_position_gaps(local)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = [p.arrays() for p in self.parts]
+        return np.concatenate([d for d, _ in arrays]), np.concatenate([t for _, t in arrays])
+
+
+class PostingsCursor:
+    """Forward-only cursor over a PostingsList in doc-code order. Blocks are decoded one
+    at a time as the cursor reaches them and seek() uses the skip table to jump blocks.
+    doc is the current doc code, or END once the list is exhausted.
+    """
+
+    def __init__(self, plist: PostingsList) -> None:
+        self.plist = plist
+        self.block = -1
+        self.i = 0
+        self.doc = END
+        self._docs: List[int] = []
+        self._tfs: List[int] = []
+        self._positions: List[List[int]] | None = None
+        self._load(0)
+
+    def _load(self, b: int) -> None:
+        self.block = b
+        self.i = 0
+        self._positions = None
+        if b >= self.plist.n_blocks:
+            self._docs, self._tfs = [], []
+            self.doc = END
+            return
+        if self.plist.keep_blocks:
+            self._docs, self._tfs = self.plist.block_docs(b)
+        else:
+            self._docs, self._tfs = self.plist.decode_block(b)
+        self.doc = self._docs[0]
+
+    def next(self) -> int:
+        self.i += 1
+        if self.i < len(self._docs):
+            self.doc = self._docs[self.i]
+        else:
+            self._load(self.block + 1)
+        return self.doc
+
+    def seek(self, target: int) -> int:
+        """Advances to the first doc >= target."""
+        if target <= self.doc:
+            return self.doc
+        if target > self.plist.block_last[self.block]:
+            self._load(self.plist.find_block(target, self.block + 1))
+            if self.doc == END:
+                return END
+        self.i = bisect_left(self._docs, target, self.i)
+        self.doc = self._docs[self.i]
+        return self.doc
+
+    def tf(self) -> int:
+        return self._tfs[self.i]
+
+    def positions(self) -> List[int]:
+        if self._positions is None:
+            self._positions = self.plist.block_positions(self.block, self._tfs)
+        return self._positions[self.i]
+
+
+def phrase_in(positions: Sequence[List[int]]) -> bool:
+    """True if some p has p in positions[0], p + 1 in positions[1], and so on.
+    A merge over the sorted lists: each candidate start is the largest shifted head,
+    and every list only moves forward.
+    """
+    idx = [0] * len(positions)
+    target = positions[0][0] if positions[0] else None
+    while target is not None:
+        for k, plist in enumerate(positions):
+            i = bisect_left(plist, target + k, idx[k])
+            if i == len(plist):
+                return False
+            idx[k] = i
+            if plist[i] - k != target:
+                target = plist[i] - k
+                break
+        else:
+            return True
+    return False
@@ -3,12 +3,28 @@ from __future__ import annotations
 import re
 from collections import Counter
 from dataclasses import dataclass
-from typing import Iterable, List, Tuple
+from itertools import filterfalse
+from typing import Dict, Iterable, List, Sequence, Tuple
 
 import nltk
 
 
 _WORD_RE = re.compile(r"[A-Za-z][A-Za-z\-']+")
+# Batched tokenization (see TextPreprocessor._split_batch): texts are joined around a
+# marker token, every byte that _WORD_RE does not allow in a word becomes a space, and
+# the result is split on whitespace, all in C. Tokens then only differ from _WORD_RE
+# matches by leading ' or - (stripped) and single letters (dropped with the stopwords).
+_MARK = "\x00"
+_LEAD_RE = re.compile(rb" [-']+")
+_SINGLE_LETTERS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+
+def _word_bytes(lowercase: bool) -> bytes:
+    # bytes.translate table: word characters and the marker map to themselves
+    keep = set(b"abcdefghijklmnopqrstuvwxyz'-" + _MARK.encode())
+    if not lowercase:
+        keep |= set(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+    return bytes(c if c in keep else 32 for c in range(256))
 
 
 def _ensure_nltk() -> None:
@@ -27,6 +43,8 @@ class PreprocessConfig:
     lowercase: bool = True
     remove_stopwords: bool = True
     stem: bool = True
+    # Max number of surface forms kept in the stem memo (0 disables it)
+    stem_cache_size: int = 200_000
 
 
 class TextPreprocessor:
@@ -35,21 +53,105 @@ class TextPreprocessor:
         self.config = config or PreprocessConfig()
         self.stopwords = set(nltk.corpus.stopwords.words("english")) if self.config.remove_stopwords else set()
         self.stemmer = nltk.stem.PorterStemmer() if self.config.stem else None
-
-    def tokenize(self, text: str) -> List[str]:
+        self._word_bytes = _word_bytes(self.config.lowercase)
+        self._drop = frozenset(self.stopwords) | _SINGLE_LETTERS
+        # Surface form -> stem. Token frequencies are Zipfian, so a bounded memo absorbs
+        # nearly all stemmer calls; when full, the oldest inserted entry is evicted.
+        self._stem_cache: Dict[str, str] = {}
+        self._stem_hits = 0
+        self._stem_misses = 0
+        self._stem_evictions = 0
+
+    def _stem_miss(self, token: str) -> str:
+        assert self.stemmer is not None
+        stemmed = self.stemmer.stem(token)
+        self._stem_misses += 1
+        maxsize = self.config.stem_cache_size
+        if maxsize > 0:
+            cache = self._stem_cache
+            if len(cache) >= maxsize:
+                del cache[next(iter(cache))]
+                self._stem_evictions += 1
+            cache[token] = stemmed
+        return stemmed
+
+    def _stem_tokens(self, tokens: List[str]) -> List[str]:
+        cache = self._stem_cache
+        misses = self._stem_misses
+        out = [cache[t] if t in cache else self._stem_miss(t) for t in tokens]
+        self._stem_hits += len(tokens) - (self._stem_misses - misses)
+        return out
+
+    def stem_cache_info(self) -> Dict[str, int]:
+        return {
+            "hits": self._stem_hits,
+            "misses": self._stem_misses,
+            "evictions": self._stem_evictions,
+            "size": len(self._stem_cache),
+            "maxsize": self.config.stem_cache_size,
+        }
+
+    def _split(self, text: str) -> List[str]:
         if self.config.lowercase:
             text = text.lower()
         tokens = _WORD_RE.findall(text)
         if self.stopwords:
-            tokens = [t for t in tokens if t not in self.stopwords]
+            stop = self.stopwords
+            tokens = [t for t in tokens if t not in stop]
+        return tokens
+
+    def _split_batch(self, texts: Sequence[str]) -> List[List[str]]:
+        # Same as [_split(t) for t in texts], with lowercasing, tokenizing and stopword
+        # filtering done once over the whole batch
+        joined = " " + f" {_MARK} ".join(texts)
+        if joined.count(_MARK) != len(texts) - 1:
+            # A text holds the marker itself
+            return [self._split(t) for t in texts]
+        if self.config.lowercase:
+            joined = joined.lower()
+        # Non-ASCII characters end words, as in _WORD_RE; "replace" turns them into "?"
+        data = joined.encode("ascii", "replace").translate(self._word_bytes)
+        if b" -" in data or b" '" in data:
+            data = _LEAD_RE.sub(b" ", data)
+        tokens = list(filterfalse(self._drop.__contains__, data.decode("ascii").split()))
+        out: List[List[str]] = []
+        find = tokens.index
+        start = 0
+        for _ in range(len(texts) - 1):
+            end = find(_MARK, start)
+            out.append(tokens[start:end])
+            start = end + 1
+        out.append(tokens[start:])
+        return out
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = self._split(text)
         if self.stemmer is not None:
-            tokens = [self.stemmer.stem(t) for t in tokens]
+            tokens = self._stem_tokens(tokens)
         return tokens
 
-    def term_frequencies(self, docs: Iterable[str]) -> Counter:
+    def tokenize_batch(self, texts: Sequence[str]) -> List[List[str]]:
+        """Tokenizes many texts at once; same output as [tokenize(t) for t in texts].
+        Lowercasing, word splitting and stopword filtering run once over the whole batch.
+        """
+        if not texts:
+            return []
+        batch = self._split_batch(texts)
+        if self.stemmer is None:
+            return batch
+        return [self._stem_tokens(tokens) for tokens in batch]
+
+    def term_frequencies(self, docs: Iterable[str], batch_size: int = 256) -> Counter:
         tf: Counter = Counter()
+        batch: List[str] = []
         for doc in docs:
-            tf.update(self.tokenize(doc))
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                for tokens in self.tokenize_batch(batch):
+                    tf.update(tokens)
+                batch = []
+        for tokens in self.tokenize_batch(batch):
+            tf.update(tokens)
         return tf
 
 
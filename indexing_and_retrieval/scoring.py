@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+
+# Vectorized term weights. Every function takes the tfs of one term's postings (and,
+# for BM25, the length norms of those docs) and returns the per-doc contribution, so a
+# query's scores are a scatter-add of these arrays into a dense per-doc-code array.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class CollectionStats(NamedTuple):
+    """Statistics of a collection split over several indices (shards), so that each
+    index scores its docs as if it held the whole collection.
+    """
+    n_docs: int
+    df: Dict[str, int]  # per query term
+    avgdl: float
+
+
+def tfidf_idf(n_docs: int, df: int) -> float:
+    return math.log((n_docs + 1) / (df + 1)) + 1.0 if df else 0.0
+
+
+def bm25_idf(n_docs: int, df: int) -> float:
+    # Lucene-style idf, always positive
+    return math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+def tfidf_weights(tfs: np.ndarray, idf: float) -> np.ndarray:
+    return (1.0 + np.log(tfs)) * idf
+
+
+def bm25_norms(lengths: np.ndarray, avgdl: float) -> np.ndarray:
+    """Per-doc length normalization 1 - b + b * length / avgdl."""
+    return (1.0 - BM25_B + BM25_B * lengths / avgdl).astype(np.float32)
+
+
+def bm25_weights(tfs: np.ndarray, norms: np.ndarray, idf: float) -> np.ndarray:
+    # Norms may be stored as float32; compute in float64 like the scalar bm25_weight
+    tfs = tfs.astype(np.float64)
+    return idf * tfs * (BM25_K1 + 1.0) / (tfs + BM25_K1 * norms.astype(np.float64))
+
+
+def bm25_weight(tf: int, norm: float, idf: float) -> float:
+    """Scalar bm25_weights for document-at-a-time scoring."""
+    return idf * tf * (BM25_K1 + 1.0) / (tf + BM25_K1 * norm)
+
+
+def top_k(codes: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """The k best (code, score) by score, ties broken towards lower codes.
+    codes must be sorted ascending. Uses argpartition, so only the k winners get sorted.
+    """
+    if k <= 0:
+        return []
+    if len(codes) > k:
+        idx = np.argpartition(-scores, k - 1)[:k]
+        kth = scores[idx].min()
+        # argpartition picks arbitrary members of a tie at the cut; keep the lowest codes
+        above = idx[scores[idx] > kth]
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        idx = np.concatenate((above, ties))
+        codes, scores = codes[idx], scores[idx]
+    order = np.lexsort((codes, -scores))
+    return list(zip(codes[order].tolist(), scores[order].tolist()))
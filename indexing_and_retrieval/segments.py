@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from datastore import LocalStore
+from doctable import DocTableFile
+from lexicon import Lexicon
+
+
+# An index directory holds one or more immutable segments, listed oldest first in the
+# "segments" entry of its meta.json (the manifest). "." is the segment written by
+# create_index into the index directory itself; update_index adds seg-NNNNN/ segments.
+# Doc codes are never reused, so every segment covers a higher code range than the
+# segments before it, and deleted docs are only dropped (tombstones purged) when the
+# segments holding them are merged.
+ROOT_SEGMENT = "."
+# Segments smaller than this all count as the lowest merge tier
+MIN_MERGE_DOCS = 1000
+
+
+@dataclass
+class Segment:
+    name: str
+    store: LocalStore
+    lexicon: Lexicon
+    docs: DocTableFile
+    n_docs: int  # docs written to the segment, deleted ones included
+
+
+def segment_name(seq: int) -> str:
+    return f"seg-{seq:05d}"
+
+
+def _tier(n_docs: int, merge_factor: int) -> int:
+    n_docs = max(n_docs, MIN_MERGE_DOCS)
+    tier = 0
+    while n_docs >= merge_factor:
+        n_docs //= merge_factor
+        tier += 1
+    return tier
+
+
+def plan_merge(sizes: List[int], merge_factor: int) -> Tuple[int, int] | None:
+    """Tiered merge policy: segments are bucketed into tiers by log(size, merge_factor),
+    with everything under MIN_MERGE_DOCS in the lowest tier. A run of merge_factor
+    adjacent segments spanning at most two neighbouring tiers is merged, lowest tiers
+    first and oldest first among equals. Returns the [start, end) slice, or None.
+    Only adjacent segments are merged so doc code ranges stay in segment order.
+    """
+    if merge_factor < 2:
+        return None
+    tiers = [_tier(n, merge_factor) for n in sizes]
+    best: Tuple[int, int] | None = None
+    best_tier = 0
+    for start in range(len(tiers) - merge_factor + 1):
+        window = tiers[start:start + merge_factor]
+        if max(window) - min(window) <= 1 and (best is None or max(window) < best_tier):
+            best, best_tier = (start, start + merge_factor), max(window)
+    return best
@@ -1,22 +1,132 @@
 from __future__ import annotations
 
+import heapq
 import json
 import math
-from collections import defaultdict
-from dataclasses import dataclass
+import shutil
+import sys
+import threading
+from array import array
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import astuple, dataclass
+from functools import partial
+from itertools import groupby, islice
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import BinaryIO, Callable, Deque, Dict, Hashable, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
 
 from index_base import IndexBase
 from preprocess import TextPreprocessor, PreprocessConfig
 from datastore import LocalStore
-from compression import vbyte_encode, vbyte_decode, zlib_compress, zlib_decompress, add_skip_pointers
+from postings import END, POSTINGS_VERSION, ChainedPostings, PostingsCursor, PostingsList, PostingsWriter, phrase_in
+from daat import AndCursor, AndNotCursor, EmptyCursor, FilterCursor, ListCursor, OrCursor, PhraseCursor, TermCursor, top_k, wand_top_k
+from cache import LRUCache
+import tracing
+from bitmap import DocSet
+from doctable import DOCTABLE_VERSION, DocTable
+from lexicon import LEXICON_VERSION, TermInfo
+from planner import Plan, Planner
+from segments import ROOT_SEGMENT, Segment, plan_merge, segment_name
+from scoring import CollectionStats, bm25_idf, bm25_weight, bm25_weights, tfidf_idf, tfidf_weights, top_k as top_k_arrays
+
+# Rough in-memory cost of postings held as Python objects, used to decide when to flush
+# a build run: one list slot + int object per position, dict entry + list header per
+# (term, doc).
+_POSITION_BYTES = 36
+_DOC_ENTRY_BYTES = 160
+# Number of results returned by query
+_TOP_K = 50
+# Rough cost of a result cache key (plan tuples and term strings) on top of the response
+_RESULT_KEY_BYTES = 512
+# Maximum number of run files merged at once
+_MAX_MERGE_FANIN = 64
+# The inverted block is roughly this many times the size of the raw text it came from;
+# used to size the document chunks handed to parallel build workers.
+_TEXT_EXPANSION = 6
+# Documents handed to TextPreprocessor.tokenize_batch at once
+_TOKENIZE_BATCH = 256
+
+
+def _batched(items: Iterable, n: int) -> Iterator[list]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+def _plan_terms(plan: tuple) -> List[str]:
+    # Normalized terms a query plan reads postings for
+    if plan[0] == 'TERM':
+        return [plan[1]]
+    if plan[0] == 'PHRASE':
+        return list(plan[1])
+    return [t for child in plan[1:] for t in _plan_terms(child)]
+
+
+def _block_items(block: Dict[str, Dict[int, List[int]]]) -> Iterator[Tuple[str, int, List[Tuple[int, List[int]]]]]:
+    return ((term, len(block[term]), sorted(block[term].items())) for term in sorted(block))
+
+
+# --- Parallel build workers ---
+_worker_preprocessor: TextPreprocessor | None = None
+
+
+def _init_worker(config: PreprocessConfig) -> None:
+    global _worker_preprocessor
+    _worker_preprocessor = TextPreprocessor(config)
+
+
+def _invert_chunk(run_path: str, docs: List[Tuple[int, str]]) -> List[int]:
+    # Inverts (doc_code, text) pairs into one sorted run file, returns token count per doc
+    assert _worker_preprocessor is not None
+    block: Dict[str, Dict[int, List[int]]] = defaultdict(lambda: defaultdict(list))
+    lengths: List[int] = []
+    for start in range(0, len(docs), _TOKENIZE_BATCH):
+        batch = docs[start:start + _TOKENIZE_BATCH]
+        for (code, _), tokens in zip(batch, _worker_preprocessor.tokenize_batch([text for _, text in batch])):
+            lengths.append(len(tokens))
+            for pos, tok in enumerate(tokens):
+                block[tok][code].append(pos)
+    path = Path(run_path)
+    LocalStore(path.parent).write_run(path, _block_items(block))
+    return lengths
+
+
+# --- Parallel query_batch workers ---
+_worker_index: 'SelfIndex | None' = None
+
+
+def _init_query_worker(config: Tuple[str, ...], index_dir: str, postings_cache_mb: float) -> None:
+    # Each worker opens its own read-only view of the index; merges stay with the parent
+    global _worker_index
+    _worker_index = SelfIndex(*config, postings_cache_mb=postings_cache_mb, background_merge=False, result_cache_mb=0)
+    _worker_index.load_index(index_dir)
+
+
+def _query_shard(queries: List[str], k: int) -> List[str]:
+    assert _worker_index is not None
+    return _worker_index.query_batch(queries, k=k)
+
+
+class _View(NamedTuple):
+    """The committed index state a query reads. Updates and merges publish a new one
+    as a whole, so a query never pairs one version's segments with another's tombstones.
+    """
+    generation: int
+    segments: List[Segment]
+    deleted: DocSet
+    universe: DocSet
 
 
 @dataclass
 class SelfIndexConfig:
     core: str
-    info: str  # BOOLEAN | WORDCOUNT | TFIDF
+    info: str  # BOOLEAN | WORDCOUNT | TFIDF | BM25
     dstore: str  # CUSTOM (local store)
     qproc: str  # TERMatat | DOCatat
     compr: str  # NONE | CODE | CLIB
@@ -24,15 +134,91 @@ class SelfIndexConfig:
 
 
 class SelfIndex(IndexBase):
-    def __init__(self, core: str, info: str, dstore: str, qproc: str, compr: str, optim: str) -> None:
+    def __init__(self, core: str, info: str, dstore: str, qproc: str, compr: str, optim: str,
+                 memory_budget_mb: float = 512.0, workers: int = 1, mmap_postings: bool = True,
+                 postings_cache_mb: float = 64.0, skip_block_size: int | None = None,
+                 merge_factor: int = 10, background_merge: bool = True,
+                 result_cache_mb: float = 16.0, result_cache_ttl: float | None = 300.0,
+                 trace_queries: bool = True) -> None:
+        """
+        memory_budget_mb: approximate size of the in-memory inverted block during
+            create_index; once exceeded the block is flushed to a run file on disk.
+        workers: number of processes used by create_index to tokenize and invert
+            documents. With workers > 1 the input is split into chunks that are inverted
+            in parallel and merged; doc codes are identical to a single-process build.
+        mmap_postings: memory-map postings.bin in load_index instead of issuing a
+            seek + read per term lookup.
+        postings_cache_mb: byte budget of the LRU cache of decoded postings lists
+            (0 disables it). See postings_cache_info() for hit/miss/eviction counts.
+        skip_block_size: docs per skip block written for every optim other than Null;
+            None spaces skip pointers every sqrt(df) docs.
+        merge_factor: update_index writes each batch as a new segment; once merge_factor
+            adjacent segments of similar size exist they are merged into one, dropping
+            deleted docs (< 2 disables merging).
+        background_merge: run those merges on a background thread instead of inside
+            update_index. See wait_for_merges().
+        result_cache_mb: byte budget of the LRU cache of serialized query responses
+            (0 disables it), keyed by the normalized query plan. Entries expire after
+            result_cache_ttl seconds (None: never) and are invalidated whenever the
+            index generation changes. See result_cache_info().
+        trace_queries: time the stages of every query (parse, io, decode, match, score,
+            ...) and count bytes read, postings decoded and docs scored; the totals are
+            kept as cumulative histograms, see query_stats_info() and tracing.py.
+        """
         super().__init__(core, info, dstore, qproc, compr, optim)
         self.config = SelfIndexConfig(core, info, dstore, qproc, compr, optim)
         self.preprocessor = TextPreprocessor(PreprocessConfig(lowercase=True, remove_stopwords=True, stem=True))
         self.store: LocalStore | None = None
-        self.lexicon: Dict[str, Tuple[int, int]] = {}
-        self.docs: Dict[str, Dict] = {}
-        self.code_to_docid: Dict[int, str] = {}
-        self.N = 0
+        self.index_dir: Path | None = None
+        self.segments: List[Segment] = []
+        # Codes of deleted or replaced docs still present in some segment
+        self.deleted = DocSet()
+        # Doc ids, lengths and BM25 norms by doc code, see doctable.py
+        self.doc_table = DocTable([], np.zeros(0, dtype=np.int64))
+        self.universe = DocSet()
+        # (universe, its codes as a sorted list) for DAAT NOT, see _live_codes
+        self._live: Tuple[DocSet, List[int]] | None = None
+        self.memory_budget_mb = memory_budget_mb
+        self.workers = max(1, int(workers))
+        self.mmap_postings = mmap_postings
+        self.skip_block_size = skip_block_size
+        self.postings_cache: LRUCache = LRUCache(int(postings_cache_mb * 1024 * 1024))
+        self.result_cache: LRUCache[str] = LRUCache(int(result_cache_mb * 1024 * 1024), ttl=result_cache_ttl)
+        # Bumped whenever the loaded index changes; part of every result cache key
+        self.generation = 0
+        self.trace_queries = trace_queries
+        self.query_stats = tracing.QueryStats()
+        self.merge_factor = merge_factor
+        self.background_merge = background_merge
+        # Serializes manifest changes made by update_index and segment merges
+        self._commit_lock = threading.Lock()
+        # Guards publishing segments, deleted, universe and generation together, see _view()
+        self._state_lock = threading.Lock()
+        self._merge_thread: threading.Thread | None = None
+        # .working: postings shared by the queries of the current query_batch call
+        # .view: the _View pinned by the running query or batch
+        self._batch = threading.local()
+
+    @property
+    def N(self) -> int:
+        return self.doc_table.n_live
+
+    @property
+    def max_code(self) -> int:
+        return self.doc_table.max_code
+
+    @classmethod
+    def open(cls, index_dir: str | Path, **options) -> 'SelfIndex':
+        """Builds a SelfIndex with the variant config stored in index_dir/meta.json and
+        loads the index. options are passed to the constructor (e.g. postings_cache_mb).
+        """
+        meta = LocalStore(Path(index_dir)).read_meta()
+        config = meta.get("config")
+        if not config or config.get("core") != "SelfIndex":
+            raise ValueError(f"{index_dir} has no SelfIndex config in meta.json")
+        index = cls(**config, **options)
+        index.load_index(str(index_dir))
+        return index
 
     def _index_dir(self, index_id: str) -> Path:
         base = Path("indices")
@@ -42,169 +228,649 @@ class SelfIndex(IndexBase):
     def create_index(self, index_id: str, files: Iterable[tuple[str, str]]) -> None:
         index_dir = self._index_dir(index_id)
         store = LocalStore(index_dir)
+        with self._merges_stopped():
+            # A rebuild replaces every segment added by update_index
+            for p in index_dir.glob("seg-*"):
+                shutil.rmtree(p)
+            doc_codes = self._write_segment(store, files, 1)
+            store.write_meta({
+                "config": self.config.__dict__,
+                "N": len(doc_codes),
+                "postings_format": POSTINGS_VERSION,
+                "lexicon_format": LEXICON_VERSION,
+                "doctable_format": DOCTABLE_VERSION,
+                "segments": [{"name": ROOT_SEGMENT, "docs": len(doc_codes)}],
+                "deleted": [],
+                "next_code": len(doc_codes) + 1,
+                "segment_seq": 1,
+            })
 
-        postings: Dict[str, Dict[int, List[int]]] = defaultdict(lambda: defaultdict(list))
-        doc_lengths: Dict[str, int] = {}
+    def _write_segment(self, store: LocalStore, files: Iterable[tuple[str, str]], first_code: int) -> Dict[str, int]:
+        # SPIMI-style build: invert documents into an in-memory block until the memory
+        # budget is reached, flush the block as a sorted run file, then k-way merge runs.
+        # Docs get consecutive codes from first_code; returns doc_id -> code. A doc id
+        # given more than once keeps its first text.
+        store.clear_runs()
+        doc_lengths = array("I")
         doc_code_map: Dict[str, int] = {}
-        next_code = 1
-        for doc_id, text in files:
-            tokens = self.preprocessor.tokenize(text)
-            doc_lengths[doc_id] = len(tokens)
-            if doc_id not in doc_code_map:
-                doc_code_map[doc_id] = next_code
-                next_code += 1
-            code = doc_code_map[doc_id]
-            for pos, tok in enumerate(tokens):
-                postings[tok][code].append(pos)
+        if self.workers > 1:
+            runs = self._build_runs_parallel(store, files, doc_lengths, doc_code_map, first_code)
+        else:
+            runs = self._build_runs(store, files, doc_lengths, doc_code_map, first_code)
 
         # Persist
-        lexicon: Dict[str, Tuple[int, int]] = {}
-        for term, doc_map in postings.items():
-            # Build gaps for doc ids and positions for compression
-            doc_codes = sorted(doc_map.keys())
-            # Serialize as: [df, doc_id, tf, pos1, pos2, ...] for each doc
-            blob: List[int] = [len(doc_codes)]
-            for d in doc_codes:
-                positions = doc_map[d]
-                blob.append(int(d))
-                blob.append(len(positions))
-                blob.extend(positions)
-            raw = json.dumps(blob).encode("utf-8")
-            if self.config.compr == "CODE":
-                payload = vbyte_encode(blob)
-            elif self.config.compr == "CLIB":
-                payload = zlib_compress(raw)
-            else:
-                payload = raw
-            offset, length = store.append_postings(payload)
-            lexicon[term] = (offset, length)
-
-        store.write_lexicon(lexicon)
-        # Persist docs with code mapping
-        docs_payload = {d: {"length": l, "code": doc_code_map[d]} for d, l in doc_lengths.items()}
-        store.write_docs(docs_payload)
-        store.write_meta({
-            "config": self.config.__dict__,
-            "N": len(doc_lengths),
-        })
+        merged = self._merge_runs(store, runs)
+        store.write_postings(self._encode_terms(merged))
+        store.clear_runs()
+
+        # Codes were handed out in insertion order, so the rows are in code order
+        store.write_docs((code, doc_id, doc_lengths[code - first_code]) for doc_id, code in doc_code_map.items())
+        return doc_code_map
+
+    def _build_runs(self, store: LocalStore, files: Iterable[tuple[str, str]],
+                    doc_lengths: array, doc_code_map: Dict[str, int], first_code: int) -> List[Path]:
+        budget = int(self.memory_budget_mb * 1024 * 1024)
+        block: Dict[str, Dict[int, List[int]]] = defaultdict(lambda: defaultdict(list))
+        block_bytes = 0
+        runs: List[Path] = []
+        for batch in _batched(files, _TOKENIZE_BATCH):
+            token_lists = self.preprocessor.tokenize_batch([text for _, text in batch])
+            for (doc_id, _), tokens in zip(batch, token_lists):
+                if doc_id in doc_code_map:
+                    continue
+                code = doc_code_map[doc_id] = first_code + len(doc_code_map)
+                doc_lengths.append(len(tokens))
+                for pos, tok in enumerate(tokens):
+                    block[tok][code].append(pos)
+                block_bytes += len(tokens) * _POSITION_BYTES + len(set(tokens)) * _DOC_ENTRY_BYTES
+                if block_bytes >= budget:
+                    runs.append(self._flush_run(store, block, len(runs)))
+                    block = defaultdict(lambda: defaultdict(list))
+                    block_bytes = 0
+        if block or not runs:
+            runs.append(self._flush_run(store, block, len(runs)))
+        return runs
+
+    def _build_runs_parallel(self, store: LocalStore, files: Iterable[tuple[str, str]],
+                             doc_lengths: array, doc_code_map: Dict[str, int], first_code: int) -> List[Path]:
+        # Doc codes are assigned here in input order, so they match the serial build.
+        # Each chunk of documents is inverted by a worker into its own run file; results
+        # are collected in submission order with a bounded number of chunks in flight.
+        chunk_chars = max(1, int(self.memory_budget_mb * 1024 * 1024) // (self.workers * _TEXT_EXPANSION))
+        runs: List[Path] = []
+        pending: Deque[Future] = deque()
+
+        def collect() -> None:
+            # Chunks hold consecutive codes and are collected in order
+            doc_lengths.extend(pending.popleft().result())
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.preprocessor.config,)) as pool:
+            chunk: List[Tuple[int, str]] = []
+            chars = 0
+            for doc_id, text in files:
+                if doc_id in doc_code_map:
+                    continue
+                code = doc_code_map[doc_id] = first_code + len(doc_code_map)
+                chunk.append((code, text))
+                chars += len(text)
+                if chars >= chunk_chars:
+                    path = store.run_path(len(runs))
+                    runs.append(path)
+                    pending.append(pool.submit(_invert_chunk, str(path), chunk))
+                    chunk, chars = [], 0
+                    while len(pending) > 2 * self.workers:
+                        collect()
+            if chunk or not runs:
+                path = store.run_path(len(runs))
+                runs.append(path)
+                pending.append(pool.submit(_invert_chunk, str(path), chunk))
+            while pending:
+                collect()
+        return runs
+
+    def _encode_terms(self, items: Iterable[Tuple[str, int, Iterable[Tuple[int, List[int]]]]]
+                      ) -> Iterator[Tuple[str, int, Callable[[BinaryIO, BinaryIO], int]]]:
+        # (term, df, write) as taken by LocalStore.write_postings; each term's entries
+        # are encoded block by block as they stream in
+        for term, df, entries in items:
+            yield term, df, partial(self._write_postings, df, entries)
+
+    def _write_postings(self, df: int, entries: Iterable[Tuple[int, List[int]]], out: BinaryIO, pos_out: BinaryIO) -> int:
+        # Skipping, WAND and BMW all need per-block skip data; Null writes a single block
+        block_size = self.skip_block_size if self.config.optim != 'Null' else 0
+        writer = PostingsWriter(out, pos_out, self.config.compr, df, block_size)
+        for code, positions in entries:
+            writer.add(code, positions)
+        return writer.close()
+
+    def _flush_run(self, store: LocalStore, block: Dict[str, Dict[int, List[int]]], n: int) -> Path:
+        path = store.run_path(n)
+        store.write_run(path, _block_items(block))
+        return path
+
+    def _merge_runs(self, store: LocalStore, runs: List[Path]) -> Iterator[Tuple[str, int, Iterator[Tuple[int, List[int]]]]]:
+        # Runs cover increasing doc code ranges, so concatenating a term's entries in run
+        # order keeps doc codes sorted. Too many runs are merged in passes to bound open files.
+        n = len(runs)
+        while len(runs) > _MAX_MERGE_FANIN:
+            next_runs: List[Path] = []
+            for i in range(0, len(runs), _MAX_MERGE_FANIN):
+                group = runs[i:i + _MAX_MERGE_FANIN]
+                if len(group) == 1:
+                    next_runs.append(group[0])
+                    continue
+                path = store.run_path(n)
+                n += 1
+                store.write_run(path, self._merge_group(store, group))
+                for p in group:
+                    p.unlink()
+                next_runs.append(path)
+            runs = next_runs
+        return self._merge_group(store, runs)
+
+    def _merge_group(self, store: LocalStore, runs: List[Path]) -> Iterator[Tuple[str, int, Iterator[Tuple[int, List[int]]]]]:
+        # Yields (term, df, entries) in term order. entries streams the term's
+        # (code, positions) one run line at a time, so only the current line of each run
+        # is held; it must be consumed before the next term is taken.
+        streams = [store.iter_run(p) for p in runs]
+        heads: Dict[int, Tuple[str, int, List[Tuple[int, List[int]]]]] = {}
+        heap: List[Tuple[str, int]] = []
+        for i, stream in enumerate(streams):
+            head = next(stream, None)
+            if head is not None:
+                heads[i] = head
+                heap.append((head[0], i))
+        heapq.heapify(heap)
+
+        def entries(term: str, holders: List[int]) -> Iterator[Tuple[int, List[int]]]:
+            for i in holders:
+                head = heads.pop(i)
+                while head is not None and head[0] == term:
+                    yield from head[2]
+                    head = next(streams[i], None)
+                if head is not None:
+                    heads[i] = head
+                    heapq.heappush(heap, (head[0], i))
+
+        while heap:
+            term = heap[0][0]
+            holders: List[int] = []
+            while heap and heap[0][0] == term:
+                holders.append(heapq.heappop(heap)[1])
+            # Every run line of a term carries the run's df for it
+            it = entries(term, holders)
+            yield term, sum(heads[i][1] for i in holders), it
+            for _ in it:
+                pass
 
     def load_index(self, serialized_index_dump: str) -> None:
         index_dir = Path(serialized_index_dump)
         store = LocalStore(index_dir)
-        self.store = store
-        self.lexicon = store.read_lexicon()
-        self.docs = store.read_docs()
+        meta = self._read_manifest(store)
+        formats = (meta.get("postings_format"), meta.get("lexicon_format"), meta.get("doctable_format"))
+        if formats != (POSTINGS_VERSION, LEXICON_VERSION, DOCTABLE_VERSION):
+            raise ValueError(f"{index_dir} uses an old index format, rebuild it with create_index")
+        for seg in self.segments:
+            seg.store.unmap_postings()
+        segments = [self._open_segment(index_dir, entry) for entry in meta["segments"]]
+        doc_table = DocTable([seg.docs for seg in segments], np.array(meta["deleted"], dtype=np.int64))
+        with self._state_lock:
+            self.store = store
+            self.index_dir = index_dir.resolve()
+            self.segments = segments
+            self.deleted = DocSet.from_sorted(meta["deleted"])
+            self.doc_table = doc_table
+            self.universe = DocSet.from_array(doc_table.live_codes())
+            self.postings_cache.clear()
+            self._bump_generation()
+
+    @staticmethod
+    def _read_manifest(store: LocalStore) -> Dict:
         meta = store.read_meta()
-        self.N = int(meta.get("N", 0))
-        # Build reverse map code -> doc_id
-        self.code_to_docid = {}
-        for doc_id, info in self.docs.items():
-            code = int(info.get("code", 0))
-            if code:
-                self.code_to_docid[code] = doc_id
+        meta.setdefault("segments", [{"name": ROOT_SEGMENT, "docs": int(meta.get("N", 0))}])
+        meta.setdefault("deleted", [])
+        meta.setdefault("next_code", int(meta.get("N", 0)) + 1)
+        meta.setdefault("segment_seq", 1)
+        return meta
+
+    def _open_segment(self, index_dir: Path, entry: Dict) -> Segment:
+        store = LocalStore(index_dir / entry["name"])
+        if self.mmap_postings:
+            store.map_postings()
+        return Segment(entry["name"], store, store.read_lexicon(), store.read_docs(), int(entry["docs"]))
+
+    @staticmethod
+    def _read_doc_table(index_dir: Path, meta: Dict) -> DocTable:
+        files = [LocalStore(index_dir / entry["name"]).read_docs() for entry in meta["segments"]]
+        return DocTable(files, np.array(meta["deleted"], dtype=np.int64))
+
+    def _is_loaded(self, index_dir: Path) -> bool:
+        return self.index_dir is not None and self.index_dir == index_dir.resolve()
 
     def update_index(self, index_id: str, remove_files: Iterable[tuple[str, str]], add_files: Iterable[tuple[str, str]]) -> None:
-        # For simplicity, rebuild
-        remaining: Dict[str, str] = {}
-        if self.store and (self._index_dir(index_id)).exists():
-            # Cannot list original raw docs; caller should pass all
-            pass
-        self.create_index(index_id, add_files)
-
-    def _decode_postings(self, payload: bytes) -> List[int]:
-        if self.config.compr == "CODE":
-            return vbyte_decode(payload)
-        elif self.config.compr == "CLIB":
-            raw = zlib_decompress(payload)
-            return json.loads(raw.decode("utf-8"))
+        # Log-structured update: add_files become a new immutable segment and removed or
+        # replaced docs are tombstoned in the manifest. Existing segments are untouched;
+        # they are compacted later by the merge policy.
+        index_dir = self._index_dir(index_id)
+        root = LocalStore(index_dir)
+        if not root.meta_path.exists():
+            self.create_index(index_id, add_files)
+            return
+        with self._commit_lock:
+            meta = self._read_manifest(root)
+            table = self.doc_table if self._is_loaded(index_dir) else self._read_doc_table(index_dir, meta)
+            removed = {table.code_of(doc_id) for doc_id, _ in remove_files}
+            name = segment_name(meta["segment_seq"])
+            added = self._write_segment(LocalStore(index_dir / name), add_files, meta["next_code"])
+            # Re-added doc ids replace the live version
+            removed |= {table.code_of(doc_id) for doc_id in added}
+            removed.discard(None)
+            meta["segments"].append({"name": name, "docs": len(added)})
+            meta["deleted"] = sorted(set(meta["deleted"]) | removed)
+            meta["next_code"] += len(added)
+            meta["segment_seq"] += 1
+            meta["N"] = len(table) - len(removed) + len(added)
+            root.write_meta(meta)  # commit point
+            if self._is_loaded(index_dir):
+                self._apply_update(self._open_segment(index_dir, meta["segments"][-1]), added, sorted(removed))
+        self._schedule_merge(index_dir)
+
+    def _apply_update(self, segment: Segment, added: Dict[str, int], removed: List[int]) -> None:
+        # Brings the loaded index in line with a committed update without reloading it
+        removed_set = DocSet.from_sorted(removed)
+        self.doc_table.add_segment(segment.docs, removed)
+        with self._state_lock:
+            self.deleted = self.deleted | removed_set
+            self.universe = (self.universe - removed_set) | DocSet.from_sorted(sorted(added.values()))
+            self.segments = self.segments + [segment]
+            self.postings_cache.clear()
+            self._bump_generation()
+
+    # --- Segment merging ---
+    def _schedule_merge(self, index_dir: Path) -> None:
+        if self.merge_factor < 2:
+            return
+        if not self.background_merge:
+            self._merge_loop(index_dir)
+            return
+        with self._commit_lock:
+            if self._merge_thread is not None:
+                return  # the running merge re-plans after each merge
+            self._merge_thread = threading.Thread(target=self._merge_loop, args=(index_dir,), daemon=True)
+            self._merge_thread.start()
+
+    def wait_for_merges(self) -> None:
+        """Blocks until background segment merges have finished."""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    @contextmanager
+    def _merges_stopped(self) -> Iterator[None]:
+        # Holds the commit lock with no background merge running, for changes that
+        # replace segment files a merge could be reading or committing over
+        while True:
+            self.wait_for_merges()
+            self._commit_lock.acquire()
+            if self._merge_thread is None:
+                break
+            # An update scheduled another merge in between
+            self._commit_lock.release()
+        try:
+            yield
+        finally:
+            self._commit_lock.release()
+
+    def _merge_loop(self, index_dir: Path) -> None:
+        try:
+            while self._merge_once(index_dir):
+                pass
+        except BaseException:
+            with self._commit_lock:
+                self._merge_thread = None
+            raise
+
+    def force_merge(self, index_id: str) -> None:
+        """Merges every segment of the index into one, purging all deleted docs so
+        collection statistics match a fresh build."""
+        self.wait_for_merges()
+        index_dir = self._index_dir(index_id)
+        meta = self._read_manifest(LocalStore(index_dir))
+        if len(meta["segments"]) > 1 or meta["deleted"]:
+            self._merge_once(index_dir, merge_all=True)
+
+    def _merge_once(self, index_dir: Path, merge_all: bool = False) -> bool:
+        root = LocalStore(index_dir)
+        with self._commit_lock:
+            meta = self._read_manifest(root)
+            if merge_all:
+                plan = (0, len(meta["segments"]))
+            else:
+                plan = plan_merge([entry["docs"] for entry in meta["segments"]], self.merge_factor)
+            if plan is None:
+                self._merge_thread = None
+                return False
+            merging = meta["segments"][plan[0]:plan[1]]
+            name = segment_name(meta["segment_seq"])
+            meta["segment_seq"] += 1
+            root.write_meta(meta)
+            deleted = DocSet.from_sorted(meta["deleted"])
+
+        # Queries and updates keep running while the merged segment is written
+        n_docs, purged = self._merge_segments(index_dir, [entry["name"] for entry in merging], deleted, name)
+
+        with self._commit_lock:
+            meta = self._read_manifest(root)
+            names = [entry["name"] for entry in meta["segments"]]
+            start = names.index(merging[0]["name"])
+            merged_entry = {"name": name, "docs": n_docs}
+            meta["segments"][start:start + len(merging)] = [merged_entry]
+            # Tombstones added while merging still apply to the merged segment
+            meta["deleted"] = sorted(set(meta["deleted"]).difference(purged))
+            root.write_meta(meta)  # commit point
+            if self._is_loaded(index_dir):
+                replaced = [seg for seg in self.segments if seg.name in names[start:start + len(merging)]]
+                merged_seg = self._open_segment(index_dir, merged_entry)
+                segments = [seg for seg in self.segments if seg not in replaced]
+                segments.insert(start, merged_seg)
+                # Purged codes stay out of the doc table's live docs, and queries still
+                # on the old view have them tombstoned
+                self.doc_table.replace_files([seg.docs for seg in replaced], merged_seg.docs)
+                with self._state_lock:
+                    self.segments = segments
+                    self.deleted = self.deleted - DocSet.from_sorted(purged)
+                    self.postings_cache.clear()
+                    # Purging deleted docs changes dfs and so scores
+                    self._bump_generation()
+        for entry in merging:
+            self._drop_segment_files(index_dir, entry["name"])
+        return True
+
+    def _merge_segments(self, index_dir: Path, names: List[str], deleted: DocSet,
+                        name: str) -> Tuple[int, List[int]]:
+        # Segments are adjacent, so concatenating each term's postings keeps doc codes
+        # sorted. Returns the number of merged docs and the deleted codes dropped.
+        sources = [LocalStore(index_dir / n) for n in names]
+        lexicons = [src.read_lexicon() for src in sources]
+        for src in sources:
+            src.map_postings()
+
+        def tagged(i: int) -> Iterator[Tuple[str, int, TermInfo]]:
+            return ((term, i, info) for term, info in lexicons[i].items())
+
+        def live(plists: List[PostingsList]) -> Iterator[Tuple[int, List[int]]]:
+            for plist in plists:
+                for b in range(plist.n_blocks):
+                    docs, tfs = plist.decode_block(b)
+                    for d, positions in zip(docs, plist.block_positions(b, tfs)):
+                        if d not in deleted:
+                            yield d, positions
+
+        def merged_terms() -> Iterator[Tuple[str, int, Iterator[Tuple[int, List[int]]]]]:
+            # Lexicons are sorted, so a term's entries arrive together and in segment order
+            for term, group in groupby(heapq.merge(*(tagged(i) for i in range(len(sources)))), key=lambda x: x[0]):
+                plists = [self._open_postings(sources[i], info) for _, i, info in group]
+                df = sum(len(plist) for plist in plists)
+                if deleted:
+                    # Deleted docs are dropped, so count the live ones before encoding
+                    df = sum(1 for plist in plists for b in range(plist.n_blocks)
+                             for d in plist.decode_block(b)[0] if d not in deleted)
+                if df:
+                    yield term, df, live(plists)
+
+        store = LocalStore(index_dir / name)
+        store.write_postings(self._encode_terms(merged_terms()))
+        rows: List[Tuple[int, str, int]] = []
+        purged: List[int] = []
+        for src in sources:
+            table = src.read_docs()
+            for i in np.flatnonzero(table.present).tolist():
+                code = table.first_code + i
+                if code in deleted:
+                    purged.append(code)
+                else:
+                    rows.append((code, table.doc_id(code), int(table.lengths[i])))
+            src.unmap_postings()
+        return store.write_docs(rows), purged
+
+    @staticmethod
+    def _drop_segment_files(index_dir: Path, name: str) -> None:
+        if name == ROOT_SEGMENT:
+            # The index directory itself also holds the manifest
+            store = LocalStore(index_dir)
+            for p in (store.postings_path, store.positions_path, store.lexicon_path, store.docs_path):
+                p.unlink(missing_ok=True)
         else:
-            return json.loads(payload.decode("utf-8"))
+            shutil.rmtree(index_dir / name, ignore_errors=True)
+
+    def _open_postings(self, store: LocalStore, info: TermInfo) -> PostingsList:
+        # positions.bin is only touched if the caller asks for positions. bytes_read
+        # counts the payload bytes referenced; with mmap the pages are only faulted in
+        # as blocks are decoded.
+        def read_positions() -> bytes | memoryview:
+            tracing.push("io")
+            positions = store.read_positions(info.pos_offset, info.pos_length)
+            tracing.pop()
+            tracing.count("bytes_read", info.pos_length)
+            return positions
 
-    def _get_term_postings(self, term: str) -> Dict[int, List[int]]:
+        tracing.count("bytes_read", info.length)
+        return PostingsList(store.read_postings(info.offset, info.length), self.config.compr, read_positions)
+
+    def _working_set(self) -> Dict[Hashable, object] | None:
+        return getattr(self._batch, "working", None)
+
+    def _get_term_list(self, term: str) -> PostingsList | None:
+        # Lazily decoded postings; only the header and skip table are read here. Terms
+        # found in several segments are chained. df/cf count deleted docs until their
+        # segments are merged, as in Lucene.
+        ws = self._working_set()
+        if ws is not None:
+            key = ("list", term)
+            if key not in ws:
+                plist = ws[key] = self._open_term_list(term)
+                if plist is not None:
+                    # Cursors of every query in the batch reuse the blocks decoded so far
+                    plist.keep_blocks = True
+            return ws[key]
+        return self._open_term_list(term)
+
+    def _open_term_list(self, term: str) -> PostingsList | None:
         assert self.store is not None
-        if term not in self.lexicon:
-            return {}
-        offset, length = self.lexicon[term]
-        payload = self.store.read_postings(offset, length)
-        blob = self._decode_postings(payload)
-        # Parse blob back to dict
-        i = 0
-        df = blob[i]; i += 1
-        postings: Dict[int, List[int]] = {}
-        for _ in range(df):
-            doc_code = int(blob[i]); i += 1
-            tf = blob[i]; i += 1
-            positions = blob[i:i+tf]; i += tf
-            postings[doc_code] = positions
-        return postings
-
-    def _boolean_and(self, a: List[int], b: List[int]) -> List[int]:
-        i = j = 0
-        out: List[int] = []
-        a_sorted = sorted(a)
-        b_sorted = sorted(b)
-        while i < len(a_sorted) and j < len(b_sorted):
-            if a_sorted[i] == b_sorted[j]:
-                out.append(a_sorted[i]); i += 1; j += 1
-            elif a_sorted[i] < b_sorted[j]:
-                i += 1
-            else:
-                j += 1
-        return out
+        parts = []
+        tracing.push("io")
+        for seg in self._view().segments:
+            info = seg.lexicon.get(term)
+            if info is not None:
+                parts.append(self._open_postings(seg.store, info))
+        tracing.pop()
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else ChainedPostings(parts)
+
+    def _get_term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray] | None:
+        # (doc codes, tfs) as NumPy arrays for vectorized scoring; positions are not decoded
+        key = ("arrays", self._view().generation, term)
+        ws = self._working_set()
+        if ws is not None and key in ws:
+            return ws[key]
+        cached = self.postings_cache.get(key)
+        if cached is None:
+            plist = self._get_term_list(term)
+            if plist is not None:
+                cached = plist.arrays()
+                self.postings_cache.put(key, cached, cached[0].nbytes + cached[1].nbytes)
+        if ws is not None:
+            ws[key] = cached
+        return cached
+
+    def _get_term_docset(self, term: str) -> DocSet:
+        key = ("docset", self._view().generation, term)
+        ws = self._working_set()
+        if ws is not None and key in ws:
+            return ws[key]
+        docs = self.postings_cache.get(key)
+        if docs is None:
+            plist = self._get_term_list(term)
+            if plist is None:
+                return DocSet()
+            docs = DocSet.from_sorted(plist.docs())
+            self.postings_cache.put(key, docs, docs.nbytes())
+        if ws is not None:
+            ws[key] = docs
+        return docs
+
+    def postings_cache_info(self) -> Dict[str, float]:
+        return self.postings_cache.stats()
+
+    def result_cache_info(self) -> Dict[str, float]:
+        return self.result_cache.stats()
+
+    def query_stats_info(self) -> Dict:
+        """Cumulative histograms of the per-stage times (ms) and counters of the queries
+        traced so far (see trace_queries); query_stats.prometheus() gives the same in
+        the Prometheus text format.
+        """
+        return self.query_stats.histograms()
+
+    def _start_trace(self, explain: bool = False) -> tracing.QueryTrace | None:
+        return tracing.start() if self.trace_queries or explain else None
+
+    def _finish_trace(self) -> None:
+        trace = tracing.finish()
+        if trace is not None:
+            self.query_stats.record(trace)
+
+    def _bump_generation(self) -> None:
+        # Entries of older generations can no longer be hit; they age out of the LRU
+        self.generation += 1
+
+    def _view(self) -> _View:
+        # The view pinned by the running query, else the current one
+        view = getattr(self._batch, "view", None)
+        if view is not None:
+            return view
+        with self._state_lock:
+            return _View(self.generation, self.segments, self.deleted, self.universe)
 
-    def _boolean_or(self, a: List[int], b: List[int]) -> List[int]:
-        return sorted(set(a) | set(b))
+    @contextmanager
+    def _pinned_view(self) -> Iterator[_View]:
+        # Evaluates a query (or a whole batch) against one view, however many updates
+        # and merges are committed meanwhile; nested calls keep the outer view
+        view = getattr(self._batch, "view", None)
+        if view is not None:
+            yield view
+            return
+        self._batch.view = view = self._view()
+        try:
+            yield view
+        finally:
+            self._batch.view = None
 
-    def _boolean_not(self, a: List[int]) -> List[int]:
-        universe = set(int(info.get("code", 0)) for info in self.docs.values() if int(info.get("code", 0)) != 0)
-        return sorted(universe - set(a))
+    def _boolean_and(self, a: DocSet, b: DocSet) -> DocSet:
+        return a & b
 
-    def _phrase_match(self, term_postings: List[Dict[int, List[int]]]) -> List[int]:
-        # Intersect docs then check positional adjacency
-        if not term_postings:
+    def _phrase_skipping(self, terms: List[str], within: List[int] | None = None) -> List[int]:
+        # Candidate docs come from skip-aware intersection; positions are then decoded
+        # only for the blocks holding those candidates. within (sorted codes matched by
+        # the rest of an AND) seeds the candidates, so every term's blocks are skipped
+        # over instead of the rarest one being decoded in full.
+        lists = [self._get_term_list(t) for t in terms]
+        if not lists or any(pl is None for pl in lists):
             return []
-        common_docs = set(term_postings[0].keys())
-        for p in term_postings[1:]:
-            common_docs &= set(p.keys())
-        result: List[int] = []
-        for d in common_docs:
-            pos_lists = [p[d] for p in term_postings]
-            # Check if any position p0 has p1=p0+1, p2=p0+2, ...
-            first = pos_lists[0]
-            rest = pos_lists[1:]
-            ok = False
-            s_rest = [set(pl) for pl in rest]
-            for p0 in first:
-                ok = True
-                for k, s in enumerate(s_rest, start=1):
-                    if (p0 + k) not in s:
-                        ok = False
-                        break
-                if ok:
-                    break
-            if ok:
-                result.append(d)
-        return sorted(result)
+        by_df = sorted(lists, key=len)
+        if within is None:
+            cands = by_df[0].docs()
+            by_df = by_df[1:]
+        else:
+            cands = within
+        for plist in by_df:
+            if not cands:
+                return []
+            cands = plist.intersect(cands)
+        return self._phrase_match(lists, cands)
 
-    def _score(self, doc_ids: List[int], terms: List[str]) -> List[tuple[int, float]]:
+    def _phrase_docs(self, terms: List[str]) -> List[int]:
+        # Candidates are the intersection of the terms' cached doc sets
+        lists = [self._get_term_list(t) for t in terms]
+        if not lists or any(pl is None for pl in lists):
+            return []
+        cands = self._get_term_docset(terms[0])
+        for t in terms[1:]:
+            if not cands:
+                return []
+            cands = cands & self._get_term_docset(t)
+        return self._phrase_match(lists, cands.to_list())
+
+    def _boolean_or(self, a: DocSet, b: DocSet) -> DocSet:
+        return a | b
+
+    def _boolean_not(self, a: DocSet) -> DocSet:
+        return a.complement(self._view().universe)
+
+    def _phrase_match(self, lists: List[PostingsList], cands: List[int]) -> List[int]:
+        # Positions are decoded only for the candidate docs, then checked for adjacency
+        # with a merge over the sorted position lists
+        if not cands:
+            return []
+        positions = [pl.positions_for(cands) for pl in lists]
+        return [d for d in cands if phrase_in([p[d] for p in positions])]
+
+    def _idf(self, term: str, df: int, stats: CollectionStats | None = None) -> float:
+        n = self.N
+        if stats is not None:
+            n, df = stats.n_docs, stats.df.get(term, df)
+        if self.config.info == "BM25":
+            return bm25_idf(n, df)
+        return tfidf_idf(n, df)
+
+    def _norms(self, stats: CollectionStats | None = None) -> Tuple[np.ndarray, float]:
+        # BM25 length norms by doc code and their smallest live value
+        if stats is not None:
+            return self.doc_table.norms_for(stats.avgdl)
+        return self.doc_table.norm, self.doc_table.min_norm
+
+    def _weights(self, docs: np.ndarray, tfs: np.ndarray, idf: float, norms: np.ndarray) -> np.ndarray:
+        if self.config.info == "WORDCOUNT":
+            return tfs.astype(np.float64)
+        if self.config.info == "BM25":
+            return bm25_weights(tfs, norms[docs], idf)
+        return tfidf_weights(tfs, idf)
+
+    def term_stats(self, terms: Iterable[str]) -> Tuple[int, Dict[str, int], int]:
+        """(live docs, df per term, total length of live docs): what this index adds to
+        the CollectionStats of a collection it is one shard of.
+        """
+        return self.N, {t: self._term_df(t) for t in terms}, self.doc_table.total_length()
+
+    def _score(self, doc_ids: np.ndarray, terms: List[str], k: int = _TOP_K,
+               stats: CollectionStats | None = None) -> List[tuple[int, float]]:
+        # Scatter-adds each query term's weights into a dense per-doc-code array, then
+        # ranks the matched docs that contain at least one query term.
         if self.config.info == "BOOLEAN":
-            return [(d, 1.0) for d in doc_ids]
-        scores = defaultdict(float)
-        # Preload postings
-        postings = {t: self._get_term_postings(t) for t in terms}
+            return [(d, 1.0) for d in doc_ids[:k].tolist()]
+        scores = np.zeros(self.max_code + 1)
+        hit = np.zeros(self.max_code + 1, dtype=bool)
+        norms, _ = self._norms(stats)
+        weights: Dict[str, Tuple[np.ndarray, np.ndarray] | None] = {}
         for t in terms:
-            p = postings[t]
-            df = len(p)
-            idf = math.log((self.N + 1) / (df + 1)) + 1.0 if df else 0.0
-            for d in doc_ids:
-                tf = len(p.get(d, []))
-                if tf == 0:
+            if t not in weights:
+                arrays = self._get_term_arrays(t)
+                if arrays is None:
+                    weights[t] = None
                     continue
-                if self.config.info == "WORDCOUNT":
-                    scores[d] += tf
-                else:  # TFIDF
-                    scores[d] += (1 + math.log(tf)) * idf
-        return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+                idf = self._idf(t, len(arrays[0]), stats)
+                weights[t] = (arrays[0], self._weights(arrays[0], arrays[1], idf, norms))
+            if weights[t] is None:
+                continue
+            docs, w = weights[t]
+            # Doc codes are unique within a postings list, so fancy-index += is safe
+            scores[docs] += w
+            hit[docs] = True
+        candidates = doc_ids[hit[doc_ids]]
+        tracing.count("docs_scored", len(candidates))
+        return top_k_arrays(candidates, scores[candidates], k)
 
     # --- Boolean query parsing (AND/OR/NOT, parentheses, phrases) ---
     class _Tok:
@@ -250,16 +916,17 @@ class SelfIndex(IndexBase):
 
     # Recursive descent with precedence: PHRASE/TERM (atom) > NOT > AND > OR
     def _parse(self, toks: List['_Tok']):
-        self._pos = 0
-        self._toks = toks
+        # The cursor is local: one index parses queries from many threads at once
+        pos = 0
 
         def peek(kind: str) -> bool:
-            return self._pos < len(self._toks) and self._toks[self._pos].kind == kind
+            return pos < len(toks) and toks[pos].kind == kind
 
         def eat(kind: str) -> SelfIndex._Tok:
-            tok = self._toks[self._pos]
+            nonlocal pos
+            tok = toks[pos]
             assert tok.kind == kind
-            self._pos += 1
+            pos += 1
             return tok
 
         def parse_atom():
@@ -285,7 +952,7 @@ class SelfIndex(IndexBase):
 
         def parse_and():
             node = parse_not()
-            while self._pos < len(self._toks) and peek('AND'):
+            while peek('AND'):
                 eat('AND')
                 rhs = parse_not()
                 node = ('AND', node, rhs)
@@ -293,7 +960,7 @@ class SelfIndex(IndexBase):
 
         def parse_or():
             node = parse_and()
-            while self._pos < len(self._toks) and peek('OR'):
+            while peek('OR'):
                 eat('OR')
                 rhs = parse_and()
                 node = ('OR', node, rhs)
@@ -301,64 +968,355 @@ class SelfIndex(IndexBase):
 
         return parse_or()
 
-    def _eval_node(self, node) -> List[int]:
+    def _term_key(self, text: str) -> str | None:
+        # A TERM node stands for the first normalized token of its text
+        toks = self.preprocessor.tokenize(text)
+        return toks[0] if toks else None
+
+    def _term_df(self, term: str) -> int:
+        # From the lexicons alone; deleted docs count until their segments are merged.
+        # Read from the pinned view, so the plan and the postings it runs on agree
+        df = 0
+        for seg in self._view().segments:
+            info = seg.lexicon.get(term)
+            if info is not None:
+                df += info.df
+        return df
+
+    def _planner(self) -> Planner:
+        return Planner(self._term_key, self.preprocessor.tokenize, self._term_df, self.N)
+
+    def _eval_node(self, node: Plan, memo: Dict[Plan, DocSet]) -> DocSet:
+        # Evaluates a plan from Planner; memo shares the result of repeated subexpressions
+        if node in memo:
+            return memo[node]
         kind = node[0]
-        if kind == 'EMPTY':
-            return []
         if kind == 'TERM':
-            term = node[1]
-            toks = self.preprocessor.tokenize(term)
-            if not toks:
-                return []
-            p = self._get_term_postings(toks[0])
-            return sorted(p.keys())
+            result = self._get_term_docset(node[1])
+        elif kind == 'PHRASE':
+            terms = list(node[1])
+            if self.config.optim == 'Skipping':
+                result = DocSet.from_sorted(self._phrase_skipping(terms))
+            else:
+                result = DocSet.from_sorted(self._phrase_docs(terms))
+        elif kind == 'NOT':
+            result = self._boolean_not(self._eval_node(node[1], memo))
+        elif kind == 'AND':
+            result = self._eval_and(node[1:], memo)
+        elif kind == 'OR':
+            result = self._eval_node(node[1], memo)
+            for child in node[2:]:
+                result = self._boolean_or(result, self._eval_node(child, memo))
+        elif kind == 'ANDNOT':
+            result = self._eval_node(node[1], memo)
+            if result:
+                result = result - self._eval_node(node[2], memo)
+        else:
+            result = DocSet()
+        memo[node] = result
+        return result
+
+    def _eval_and(self, children: Sequence[Plan], memo: Dict[Plan, DocSet]) -> DocSet:
+        # Children come rarest first. With Skipping, TERM and PHRASE operands after the
+        # first are intersected through their skip tables instead of being decoded in full.
+        acc = self._eval_node(children[0], memo)
+        for child in children[1:]:
+            if not acc:
+                break
+            if self.config.optim == 'Skipping' and child[0] == 'TERM' and child not in memo:
+                plist = self._get_term_list(child[1])
+                acc = DocSet.from_sorted(plist.intersect(acc.to_list())) if plist is not None else DocSet()
+            elif self.config.optim == 'Skipping' and child[0] == 'PHRASE' and child not in memo:
+                acc = DocSet.from_sorted(self._phrase_skipping(list(child[1]), acc.to_list()))
+            else:
+                acc = self._boolean_and(acc, self._eval_node(child, memo))
+        return acc
+
+    def explain(self, query: str) -> str:
+        """Returns the evaluation plan chosen for query as JSON: the rewritten operator
+        tree with estimated matching docs and cost (postings entries touched) per node.
+        """
+        planner = self._planner()
+        plan = planner.plan(self._parse(self._tokenize(query)))
+        return json.dumps({"query": query, "plan": planner.explain(plan)})
+
+    # --- Document-at-a-time evaluation ---
+    def _build_cursor(self, node: Plan):
+        kind = node[0]
+        if kind == 'TERM':
+            plist = self._get_term_list(node[1])
+            return TermCursor(plist.cursor()) if plist is not None else EmptyCursor()
         if kind == 'PHRASE':
-            phrase_text = node[1]
-            terms = [t for t in self.preprocessor.tokenize(phrase_text)]
-            ph_postings = [self._get_term_postings(t) for t in terms]
-            return self._phrase_match(ph_postings)
+            lists = [self._get_term_list(t) for t in node[1]]
+            if any(pl is None for pl in lists):
+                return EmptyCursor()
+            return PhraseCursor([pl.cursor() for pl in lists])
         if kind == 'NOT':
-            a = self._eval_node(node[1])
-            return self._boolean_not(a)
+            # Complement within the live docs, as in _boolean_not: codes purged by a
+            # merge are no longer tombstoned and must not match
+            return AndNotCursor(ListCursor(self._live_codes()), self._build_cursor(node[1]))
         if kind == 'AND':
-            a = self._eval_node(node[1])
-            b = self._eval_node(node[2])
-            return self._boolean_and(a, b)
+            return AndCursor([self._build_cursor(c) for c in node[1:]])
         if kind == 'OR':
-            a = self._eval_node(node[1])
-            b = self._eval_node(node[2])
-            return self._boolean_or(a, b)
-        return []
+            return OrCursor([self._build_cursor(c) for c in node[1:]])
+        if kind == 'ANDNOT':
+            return AndNotCursor(self._build_cursor(node[1]), self._build_cursor(node[2]))
+        return EmptyCursor()
+
+    def _live_codes(self) -> List[int]:
+        # Sorted codes of the view's universe, rebuilt when an update or reload replaces it
+        universe = self._view().universe
+        live = self._live
+        if live is None or live[0] is not universe:
+            live = self._live = (universe, universe.to_list())
+        return live[1]
+
+    def _query_daat(self, plan: Plan, terms: List[str], k: int = _TOP_K,
+                    stats: CollectionStats | None = None) -> List[tuple[int, float]]:
+        # Boolean matching and scoring in one pass over the cursors in doc-code order;
+        # only the current top-k is kept instead of candidate lists and score dicts.
+        deleted = self._view().deleted
+        root = self._build_cursor(plan)
+        if deleted:
+            root = FilterCursor(root, deleted)
+        if self.config.info == "BOOLEAN":
+            ranked: List[tuple[int, float]] = []
+            d = root.doc
+            while d < END and len(ranked) < k:
+                ranked.append((d, 1.0))
+                d = root.next()
+            return ranked
+        # One scorer per query term occurrence, as in _score; repeated terms share a cursor
+        shared: Dict[str, tuple[PostingsCursor, float] | None] = {}
+        scorers: List[tuple[PostingsCursor, float]] = []
+        for t in terms:
+            if t not in shared:
+                plist = self._get_term_list(t)
+                shared[t] = (plist.cursor(), self._idf(t, plist.df, stats)) if plist is not None else None
+            if shared[t] is not None:
+                scorers.append(shared[t])
+        info = self.config.info
+        norms, min_norm = self._norms(stats)
+
+        # BM25 weights fall as the norm grows, so the smallest norm gives the WAND upper bound
+        def weight(tf: int, idf: float, norm: float = min_norm) -> float:
+            if info == "WORDCOUNT":
+                return tf
+            if info == "BM25":
+                return bm25_weight(tf, norm, idf)
+            return (1 + math.log(tf)) * idf
+
+        scored = 0
 
-    def query(self, query: str) -> str:
+        def score(d: int) -> float | None:
+            nonlocal scored
+            scored += 1
+            s = 0.0
+            hit = False
+            for cur, idf in scorers:
+                if cur.seek(d) == d:
+                    hit = True
+                    s += weight(cur.tf(), idf, float(norms[d]))
+            return s if hit else None
+
+        if self._uses_dynamic_pruning():
+            # Repeated terms contribute once per occurrence, so their bound scales too
+            counts = Counter(terms)
+            wand_terms = []
+            for t, entry in shared.items():
+                if entry is not None:
+                    cur, idf = entry
+                    wand_terms.append((cur, lambda tf, idf=idf, n=counts[t]: n * weight(tf, idf)))
+            ranked = wand_top_k(root, wand_terms, score, k, block_max=self.config.optim == 'EarlyStopping')
+        else:
+            ranked = top_k(root, score, k)
+        tracing.count("docs_scored", scored)
+        return ranked
+
+    def _uses_dynamic_pruning(self) -> bool:
+        # Thresholding -> WAND, EarlyStopping -> Block-Max WAND; both are document-at-a-time
+        return self.config.info != "BOOLEAN" and self.config.optim in ('Thresholding', 'EarlyStopping')
+
+    def _prepare(self, query: str) -> Tuple[Plan, List[str]]:
+        tracing.push("parse")
         toks = self._tokenize(query)
-        ast = self._parse(toks)
-        matched_codes = self._eval_node(ast)
+        tree = self._parse(toks)
+        tracing.pop()
+        tracing.push("plan")
+        plan = self._planner().plan(tree)
+        tracing.pop()
         # For scoring, collect normalized terms present (exclude phrases; tokens from terms and phrases both contribute)
         norm_terms: List[str] = []
-        for t in toks:
+        text_toks = [t for t in toks if t.kind in ('TERM', 'PHRASE')]
+        tracing.push("preprocess")
+        norms = self.preprocessor.tokenize_batch([t.value for t in text_toks])
+        tracing.pop()
+        for t, norm in zip(text_toks, norms):
             if t.kind == 'TERM':
-                norm = self.preprocessor.tokenize(t.value)
                 if norm:
                     norm_terms.append(norm[0])
-            elif t.kind == 'PHRASE':
-                for w in self.preprocessor.tokenize(t.value):
-                    norm_terms.append(w)
+            else:
+                norm_terms.extend(norm)
+        return plan, norm_terms
 
-        if self.config.qproc.startswith('T'):
-            ranked = self._score(matched_codes, norm_terms)
-        else:
-            ranked = self._score(matched_codes, norm_terms)
+    def _ranked(self, plan: Plan, norm_terms: List[str], k: int,
+                stats: CollectionStats | None = None) -> List[tuple[int, float]]:
+        if k <= 0:
+            return []
+        if self.config.qproc.startswith('T') and not self._uses_dynamic_pruning():
+            # In a batch, subexpressions (e.g. phrases) repeated across queries are shared
+            ws = self._working_set()
+            memo = ws.setdefault("memo", {}) if ws is not None else {}
+            deleted = self._view().deleted
+            tracing.push("match")
+            matched = self._eval_node(plan, memo)
+            if deleted:
+                matched = matched - deleted
+            matched_codes = matched.to_array()
+            tracing.pop()
+            tracing.count("docs_matched", len(matched_codes))
+            tracing.push("score")
+            ranked = self._score(matched_codes, norm_terms, k, stats)
+            tracing.pop()
+            return ranked
+        # Matching and scoring are interleaved, so they share one stage
+        tracing.push("daat")
+        ranked = self._query_daat(plan, norm_terms, k, stats)
+        tracing.pop()
+        return ranked
+
+    def _doc_ids(self, ranked: List[tuple[int, float]], k: int) -> List[Tuple[str, float]]:
+        # External ids of the top k ranked codes. Only live codes are looked up: one an
+        # update deleted while the query ran is skipped instead of reaching doc_id
+        table = self.doc_table
+        live = table.live
+        out: List[Tuple[str, float]] = []
+        for d, s in ranked:
+            d = int(d)
+            if d < len(live) and live[d]:
+                out.append((table.doc_id(d), s))
+                if len(out) == k:
+                    break
+        return out
+
+    def _execute(self, plan: Plan, norm_terms: List[str], k: int) -> str:
+        ranked = self._ranked(plan, norm_terms, k)
+        tracing.push("serialize")
+        response = json.dumps({"results": [{"doc_id": d, "score": s} for d, s in self._doc_ids(ranked, k)]})
+        tracing.pop()
+        return response
+
+    def query_terms(self, query: str) -> List[str]:
+        """Normalized terms of query that take part in scoring."""
+        return self._prepare(query)[1]
+
+    def search(self, query: str, k: int = _TOP_K, stats: CollectionStats | None = None) -> List[Tuple[str, float]]:
+        """Top k (doc id, score) of query, uncached. stats replaces this index's own N,
+        dfs and average doc length when it is one shard of a larger collection.
+        """
+        self._start_trace()
+        try:
+            plan, norm_terms = self._prepare(query)
+            with self._pinned_view():
+                ranked = self._ranked(plan, norm_terms, k, stats)
+            return self._doc_ids(ranked, k)
+        finally:
+            self._finish_trace()
+
+    def _cached_execute(self, plan: Plan, norm_terms: List[str], k: int) -> str:
+        # Same plan and scoring terms give the same response, however the query was
+        # spelled ("Running" AND dogs vs run AND "dog")
+        key = (self._view().generation, plan, tuple(norm_terms), k)
+        tracing.push("result_cache")
+        response = self.result_cache.get(key)
+        tracing.pop()
+        if response is not None:
+            tracing.count("result_cache_hits")
+            return response
+        response = self._execute(plan, norm_terms, k)
+        tracing.push("result_cache")
+        self.result_cache.put(key, response, sys.getsizeof(response) + _RESULT_KEY_BYTES)
+        tracing.pop()
+        return response
+
+    def query(self, query: str, explain: bool = False) -> str:
+        """Top results of query as JSON. With explain=True the response also has an
+        "explain" object: the evaluation plan (as in explain()) and this query's time
+        per stage and counters. Explained queries skip the result cache, so the breakdown
+        covers every stage of the evaluation.
+        """
+        trace = self._start_trace(explain)
+        try:
+            plan, norm_terms = self._prepare(query)
+            with self._pinned_view():
+                if explain:
+                    response = self._execute(plan, norm_terms, _TOP_K)
+                else:
+                    response = self._cached_execute(plan, norm_terms, _TOP_K)
+        finally:
+            self._finish_trace()
+        if not explain:
+            return response
+        assert trace is not None
+        out = json.loads(response)
+        out["explain"] = {"plan": self._planner().explain(plan), **trace.breakdown()}
+        return json.dumps(out)
+
+    def query_batch(self, queries: Sequence[str], k: int = _TOP_K, workers: int = 1) -> List[str]:
+        """Runs many queries, returning the same responses as query() (top k each).
+        The queries share one working set: each distinct term's postings are opened and
+        decoded once for the whole batch instead of once per query. With workers > 1 the
+        batch is split into contiguous shards run by that many processes, each with its
+        own view of the loaded index.
+        """
+        queries = list(queries)
+        if workers > 1 and len(queries) > workers:
+            return self._query_batch_parallel(queries, k, workers)
+        prepared = []
+        traces = []
+        for q in queries:
+            traces.append(self._start_trace())
+            try:
+                prepared.append(self._prepare(q))
+            finally:
+                tracing.finish()
+        # The working set is only valid for one view, so the batch pins one
+        with self._pinned_view():
+            self._batch.working = {}
+            try:
+                # Open every distinct term once up front; decoded doc sets, score arrays
+                # and blocks are added to the working set as the queries first need them.
+                # This shared work is not traced as part of any query.
+                for term in sorted({t for plan, terms in prepared for t in _plan_terms(plan) + terms}):
+                    self._get_term_list(term)
+                responses = []
+                for (plan, terms), trace in zip(prepared, traces):
+                    if trace is not None:
+                        tracing.start(trace)
+                    try:
+                        responses.append(self._cached_execute(plan, terms, k))
+                    finally:
+                        if trace is not None:
+                            self._finish_trace()
+                return responses
+            finally:
+                self._batch.working = None
 
-        results = [{"doc_id": self.code_to_docid.get(int(d), str(d)), "score": s} for d, s in ranked[:50]]
-        return json.dumps({"results": results})
+    def _query_batch_parallel(self, queries: List[str], k: int, workers: int) -> List[str]:
+        if self.index_dir is None:
+            raise RuntimeError("query_batch with workers > 1 needs an index loaded with load_index")
+        step = -(-len(queries) // workers)
+        shards = [queries[i:i + step] for i in range(0, len(queries), step)]
+        with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_query_worker,
+                                 initargs=(astuple(self.config), str(self.index_dir),
+                                           self.postings_cache.max_bytes / (1024 * 1024))) as pool:
+            return [r for shard in pool.map(_query_shard, shards, [k] * len(shards)) for r in shard]
 
     def delete_index(self, index_id: str) -> None:
         d = self._index_dir(index_id)
-        if d.exists():
-            for p in d.iterdir():
-                p.unlink()
-            d.rmdir()
+        with self._merges_stopped():
+            if d.exists():
+                shutil.rmtree(d)
 
     def list_indices(self) -> Iterable[str]:
         base = Path("indices")
@@ -367,10 +1325,8 @@ class SelfIndex(IndexBase):
         return [p.name for p in base.iterdir() if p.is_dir()]
 
     def list_indexed_files(self, index_id: str) -> Iterable[str]:
-        # We store only metadata; return doc ids
+        # We store only metadata; return live doc ids across segments
         d = self._index_dir(index_id)
-        store = LocalStore(d)
-        docs = store.read_docs()
-        return list(docs.keys())
+        return list(self._read_doc_table(d, self._read_manifest(LocalStore(d))))
 
 
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from self_index import SelfIndex
+from sharded_index import ShardedIndex
+
+
+# Local HTTP query service over every index persisted under an indices/ directory.
+# An asyncio front end parses requests and hands query evaluation to a worker pool;
+# with processes, every worker opens its own (memory-mapped) copy of each index.
+#   GET  /ready                      -> 200 once all indices are loaded, else 503
+#   GET  /indices                    -> {"indices": [...]}
+#   GET  /indices/<id>/query?q=...   -> the SelfIndex.query response (&explain=1: with
+#                                       its plan and per-stage breakdown)
+#   POST /indices/<id>/query         -> body {"query": "...", "explain": false} or
+#                                       {"queries": [...], "k": 50}
+# Evaluation that exceeds the request timeout gets 504 (the worker finishes it anyway).
+logger = logging.getLogger(__name__)
+
+_MAX_BODY = 16 * 1024 * 1024
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+            504: "Gateway Timeout"}
+
+
+def discover_indices(base: str | Path = "indices", **options) -> Dict[str, SelfIndex | ShardedIndex]:
+    """Opens every SelfIndex (or ShardedIndex) under base with the config stored in its
+    meta.json. Directories that are not such indices (or use an old format) are skipped.
+    """
+    indices: Dict[str, SelfIndex | ShardedIndex] = {}
+    base = Path(base)
+    if not base.exists():
+        return indices
+    for d in sorted(p for p in base.iterdir() if (p / "meta.json").exists()):
+        try:
+            if "sharded" in json.loads((d / "meta.json").read_text()):
+                # Shards are searched one after the other inside the worker
+                indices[d.name] = ShardedIndex.open(d, **options)
+            else:
+                indices[d.name] = SelfIndex.open(d, **options)
+        except (ValueError, KeyError, OSError) as e:
+            logger.warning("skipping index %s: %s", d.name, e)
+    return indices
+
+
+# --- Worker side: one set of loaded indices per process (or shared by the threads) ---
+_worker_indices: Dict[str, SelfIndex | ShardedIndex] = {}
+
+
+def _init_worker(base: str, options: Dict) -> None:
+    global _worker_indices
+    _worker_indices = discover_indices(base, **{**options, "background_merge": False})
+
+
+def _ready() -> List[str]:
+    return sorted(_worker_indices)
+
+
+def _run_query(index_id: str, query: str, explain: bool = False) -> str:
+    index = _worker_indices[index_id]
+    if explain:
+        if not isinstance(index, SelfIndex):
+            raise ValueError(f"explain is not supported by {type(index).__name__}")
+        return index.query(query, explain=True)
+    return index.query(query)
+
+
+def _run_batch(index_id: str, queries: List[str], k: int) -> str:
+    # Responses are JSON already; the batch is wrapped without re-serializing them
+    return '{"responses": [' + ", ".join(_worker_indices[index_id].query_batch(queries, k=k)) + "]}"
+
+
+class QueryServer:
+    """asyncio HTTP/1.1 front end (keep-alive) over a pool of query workers."""
+
+    def __init__(self, base: str | Path = "indices", workers: int = 0, timeout: float = 10.0,
+                 postings_cache_mb: float = 64.0) -> None:
+        """
+        workers: number of worker processes evaluating queries; 0 evaluates them on a
+            single thread in this process.
+        timeout: seconds a request may wait for its result before getting a 504.
+        """
+        self.base = str(base)
+        self.workers = workers
+        self.timeout = timeout
+        self.options = {"postings_cache_mb": postings_cache_mb}
+        self.indices: List[str] = []
+        self.ready = False
+        self._pool: Executor | None = None
+
+    async def start_pool(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.workers > 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self.base, self.options))
+            # Touch every worker so all indices are loaded before reporting ready
+            loaded = await asyncio.gather(*(loop.run_in_executor(self._pool, _ready) for _ in range(self.workers)))
+            self.indices = loaded[0]
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=1, initializer=_init_worker,
+                                            initargs=(self.base, self.options))
+            self.indices = await loop.run_in_executor(self._pool, _ready)
+        self.ready = True
+        logger.info("loaded %d indices: %s", len(self.indices), ", ".join(self.indices))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        server = await asyncio.start_server(self._handle, host, port)
+        # Accept connections (and answer /ready with 503) while the indices load
+        await self.start_pool()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                try:
+                    status, payload = await self._dispatch(method, target, body)
+                except _HTTPError as e:
+                    # The request was read whole, so the connection stays usable
+                    status, payload = e.status, json.dumps({"error": str(e)})
+                keep_alive = headers.get("connection", "").lower() != "close"
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except _HTTPError as e:
+            _write_response(writer, e.status, json.dumps({"error": str(e)}), False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, str]:
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+        if parts == ["ready"]:
+            return (200 if self.ready else 503), json.dumps({"ready": self.ready, "indices": self.indices})
+        if not self.ready:
+            return 503, json.dumps({"error": "indices are still loading"})
+        if parts == ["indices"]:
+            return 200, json.dumps({"indices": self.indices})
+        if len(parts) != 3 or parts[0] != "indices" or parts[2] != "query":
+            return 404, json.dumps({"error": f"no route for {url.path}"})
+        index_id = parts[1]
+        if index_id not in self.indices:
+            return 404, json.dumps({"error": f"unknown index {index_id}"})
+        if method == "GET":
+            params = parse_qs(url.query)
+            q = params.get("q")
+            if not q:
+                return 400, json.dumps({"error": "missing q parameter"})
+            explain = params.get("explain", ["0"])[0].lower() in ("1", "true")
+            call: Tuple = (_run_query, index_id, q[0], explain)
+        elif method == "POST":
+            try:
+                req = json.loads(body or b"{}")
+            except ValueError:
+                return 400, json.dumps({"error": "body is not valid JSON"})
+            if not isinstance(req, dict):
+                raise _HTTPError(400, "body must be a JSON object")
+            if isinstance(req.get("query"), str):
+                call = (_run_query, index_id, req["query"], bool(req.get("explain", False)))
+            elif isinstance(req.get("queries"), list):
+                call = (_run_batch, index_id, [str(q) for q in req["queries"]], _positive_int(req.get("k", 50), "k"))
+            else:
+                return 400, json.dumps({"error": "body needs a query string or a queries list"})
+        else:
+            return 405, json.dumps({"error": f"method {method} not allowed"})
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(self._pool, *call), self.timeout)
+        except asyncio.TimeoutError:
+            return 504, json.dumps({"error": f"query timed out after {self.timeout}s"})
+        except Exception as e:
+            logger.exception("query on %s failed", index_id)
+            return 500, json.dumps({"error": str(e)})
+        return 200, result
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _positive_int(value: object, name: str) -> int:
+    # bool is an int subclass, but {"k": true} is a client error
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise _HTTPError(400, f"{name} must be an integer >= 1")
+    try:
+        n = int(value)
+    except ValueError:
+        raise _HTTPError(400, f"{name} must be an integer >= 1")
+    if n < 1:
+        raise _HTTPError(400, f"{name} must be an integer >= 1")
+    return n
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise _HTTPError(400, "malformed request line")
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0) or 0)
+    if length > _MAX_BODY:
+        raise _HTTPError(413, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, payload: str, keep_alive: bool) -> None:
+    body = payload.encode("utf-8")
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve queries over every SelfIndex under an indices directory.")
+    parser.add_argument("--indices", default="indices", help="directory holding the persisted indices")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="query worker processes (0: evaluate on one thread in the server process)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="per-request timeout in seconds")
+    parser.add_argument("--postings-cache-mb", type=float, default=64.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    server = QueryServer(args.indices, args.workers, args.timeout, args.postings_cache_mb)
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
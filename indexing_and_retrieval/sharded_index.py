@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import heapq
+import json
+import shutil
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import astuple
+from pathlib import Path
+from typing import Dict, IO, Iterable, List, Tuple
+
+from index_base import IndexBase
+from scoring import CollectionStats
+from self_index import SelfIndex, SelfIndexConfig, _TOP_K
+
+
+# A sharded index splits the collection over n SelfIndex shards, each a complete index
+# directory of its own:
+#   indices/<id>/meta.json      -> variant config plus {"sharded": {shards, partition, sizes}}
+#   indices/<id>/shard-NN/      -> SelfIndex layout (meta.json, segments, ...)
+# Docs go to a shard by a stable hash of their id, or (partition="size") to the shard
+# holding the least text so far. Queries are scattered to every shard with collection-wide
+# N, dfs and average doc length, so per-shard scores are comparable and the coordinator
+# only merges the shards' top k.
+PARTITIONS = ("hash", "size")
+
+
+def shard_name(i: int) -> str:
+    return f"shard-{i:02d}"
+
+
+def hash_shard(doc_id: str, n_shards: int) -> int:
+    # crc32 rather than hash(): str hashes are salted per process
+    return zlib.crc32(doc_id.encode("utf-8")) % n_shards
+
+
+# --- Worker side: every worker process opens all shards and serves any of them ---
+_worker_shards: List[SelfIndex] = []
+
+
+def _init_worker(shard_dirs: List[str], options: Dict) -> None:
+    global _worker_shards
+    _worker_shards = [SelfIndex.open(d, **{**options, "background_merge": False}) for d in shard_dirs]
+
+
+def _search_shard(i: int, query: str, k: int, stats: CollectionStats) -> List[Tuple[str, float]]:
+    return _worker_shards[i].search(query, k, stats)
+
+
+def _build_shard(config: Tuple[str, ...], options: Dict, index_id: str, docs_path: str) -> None:
+    SelfIndex(*config, **{**options, "background_merge": False}).create_index(index_id, _read_docs(Path(docs_path)))
+
+
+def _read_docs(path: Path) -> Iterable[Tuple[str, str]]:
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            doc_id, text = json.loads(line)
+            yield doc_id, text
+
+
+class ShardedIndex(IndexBase):
+    """SelfIndex partitioned over several shards, searched by scatter-gather."""
+
+    def __init__(self, core: str, info: str, dstore: str, qproc: str, compr: str, optim: str,
+                 shards: int = 4, partition: str = "hash", workers: int = 0, **index_options) -> None:
+        """
+        shards: number of shards written by create_index (a loaded index keeps its own).
+        partition: "hash" places docs by a hash of their id, "size" on the shard holding
+            the least text so far.
+        workers: processes that build shards in parallel and search them in parallel
+            (each opens every shard); 0 builds and searches them one after the other here.
+        index_options: passed to each shard's SelfIndex (e.g. postings_cache_mb).
+        """
+        super().__init__(core, info, dstore, qproc, compr, optim)
+        if partition not in PARTITIONS:
+            raise ValueError(f"partition must be one of {PARTITIONS}, got {partition!r}")
+        self.config = SelfIndexConfig(core, info, dstore, qproc, compr, optim)
+        self.n_shards = max(1, int(shards))
+        self.partition = partition
+        self.workers = max(0, int(workers))
+        self.index_options = index_options
+        self.index_dir: Path | None = None
+        # Text length placed on each shard, for partition="size"
+        self.sizes: List[int] = []
+        self.shards: List[SelfIndex] = []
+        self._pool: Executor | None = None
+
+    @classmethod
+    def open(cls, index_dir: str | Path, **options) -> 'ShardedIndex':
+        """Builds a ShardedIndex from index_dir/meta.json and loads it."""
+        meta = json.loads((Path(index_dir) / "meta.json").read_text())
+        if "sharded" not in meta:
+            raise ValueError(f"{index_dir} is not a sharded index")
+        index = cls(**meta["config"], shards=meta["sharded"]["shards"],
+                    partition=meta["sharded"]["partition"], **options)
+        index.load_index(str(index_dir))
+        return index
+
+    def _index_dir(self, index_id: str) -> Path:
+        base = Path("indices")
+        base.mkdir(exist_ok=True)
+        return base / index_id
+
+    def _shard_id(self, index_id: str, i: int) -> str:
+        # SelfIndex ids are paths relative to indices/
+        return f"{index_id}/{shard_name(i)}"
+
+    def _new_shard(self) -> SelfIndex:
+        return SelfIndex(*astuple(self.config), **self.index_options)
+
+    def _write_meta(self, index_dir: Path) -> None:
+        meta = {
+            "config": self.config.__dict__,
+            "sharded": {"shards": self.n_shards, "partition": self.partition, "sizes": self.sizes},
+        }
+        tmp = index_dir / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta))
+        tmp.replace(index_dir / "meta.json")
+
+    def _place(self, doc_id: str, text: str) -> int:
+        if self.partition == "hash":
+            i = hash_shard(doc_id, self.n_shards)
+        else:
+            i = min(range(self.n_shards), key=self.sizes.__getitem__)
+        self.sizes[i] += len(text)
+        return i
+
+    def create_index(self, index_id: str, files: Iterable[tuple[str, str]]) -> None:
+        index_dir = self._index_dir(index_id)
+        if index_dir.exists():
+            shutil.rmtree(index_dir)
+        index_dir.mkdir(parents=True)
+        self.sizes = [0] * self.n_shards
+        # Partition in one streaming pass into per-shard spill files, then build each shard
+        paths = [index_dir / f"{shard_name(i)}.jsonl.tmp" for i in range(self.n_shards)]
+        outs: List[IO[str]] = [p.open("w", encoding="utf-8") for p in paths]
+        try:
+            for doc_id, text in files:
+                outs[self._place(doc_id, text)].write(json.dumps([doc_id, text]) + "\n")
+        finally:
+            for f in outs:
+                f.close()
+        if self.workers > 0:
+            with ProcessPoolExecutor(max_workers=min(self.workers, self.n_shards)) as pool:
+                futures = [pool.submit(_build_shard, astuple(self.config), self.index_options,
+                                       self._shard_id(index_id, i), str(p))
+                           for i, p in enumerate(paths)]
+                for fut in futures:
+                    fut.result()
+        else:
+            for i, p in enumerate(paths):
+                self._new_shard().create_index(self._shard_id(index_id, i), _read_docs(p))
+        for p in paths:
+            p.unlink()
+        self._write_meta(index_dir)
+
+    def load_index(self, serialized_index_dump: str) -> None:
+        index_dir = Path(serialized_index_dump)
+        meta = json.loads((index_dir / "meta.json").read_text())
+        sharded = meta["sharded"]
+        self.close()
+        self.n_shards = sharded["shards"]
+        self.partition = sharded["partition"]
+        self.sizes = list(sharded["sizes"])
+        shards = []
+        for i in range(self.n_shards):
+            shard = self._new_shard()
+            shard.load_index(str(index_dir / shard_name(i)))
+            shards.append(shard)
+        self.shards = shards
+        self.index_dir = index_dir
+
+    def update_index(self, index_id: str, remove_files: Iterable[tuple[str, str]], add_files: Iterable[tuple[str, str]]) -> None:
+        index_dir = self._index_dir(index_id)
+        if not (index_dir / "meta.json").exists():
+            self.create_index(index_id, add_files)
+            return
+        if self.index_dir is None or self.index_dir.resolve() != index_dir.resolve():
+            self.load_index(str(index_dir))
+        removed = [doc_id for doc_id, _ in remove_files]
+        adds: List[List[Tuple[str, str]]] = [[] for _ in range(self.n_shards)]
+        for doc_id, text in add_files:
+            adds[self._place(doc_id, text)].append((doc_id, text))
+        for i, shard in enumerate(self.shards):
+            if self.partition == "hash":
+                drop = [d for d in removed if hash_shard(d, self.n_shards) == i]
+            else:
+                # A re-added doc may land on another shard than its old version
+                drop = removed + [d for j, a in enumerate(adds) if j != i for d, _ in a]
+            if drop or adds[i]:
+                shard.update_index(self._shard_id(index_id, i), [(d, "") for d in drop], adds[i])
+        self._write_meta(index_dir)
+        # Worker processes hold the shards as they were; start fresh ones on the next query
+        self.close()
+
+    def force_merge(self, index_id: str) -> None:
+        """Compacts every shard into a single segment (see SelfIndex.force_merge)."""
+        if self.index_dir is None or self.index_dir.resolve() != self._index_dir(index_id).resolve():
+            self.load_index(str(self._index_dir(index_id)))
+        for i, shard in enumerate(self.shards):
+            shard.force_merge(self._shard_id(index_id, i))
+        self.close()
+
+    def collection_stats(self, terms: Iterable[str]) -> CollectionStats:
+        terms = sorted(set(terms))
+        n_docs = total = 0
+        df: Dict[str, int] = dict.fromkeys(terms, 0)
+        for shard in self.shards:
+            n, shard_df, length = shard.term_stats(terms)
+            n_docs += n
+            total += length
+            for t, v in shard_df.items():
+                df[t] += v
+        return CollectionStats(n_docs, df, total / n_docs if n_docs else 1.0)
+
+    def _executor(self) -> Executor | None:
+        if self.workers > 0 and self._pool is None:
+            assert self.index_dir is not None
+            dirs = [str(self.index_dir / shard_name(i)) for i in range(self.n_shards)]
+            self._pool = ProcessPoolExecutor(max_workers=min(self.workers, self.n_shards),
+                                             initializer=_init_worker, initargs=(dirs, self.index_options))
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def search(self, query: str, k: int = _TOP_K) -> List[Tuple[str, float]]:
+        """Top k (doc id, score) over all shards."""
+        if not self.shards:
+            return []
+        stats = self.collection_stats(self.shards[0].query_terms(query))
+        pool = self._executor()
+        if pool is not None:
+            futures = [pool.submit(_search_shard, i, query, k, stats) for i in range(self.n_shards)]
+            per_shard = [f.result() for f in futures]
+        else:
+            per_shard = [shard.search(query, k, stats) for shard in self.shards]
+        # Each shard's list is sorted by score; ties keep shard order
+        merged = heapq.merge(*per_shard, key=lambda r: -r[1])
+        return [r for _, r in zip(range(k), merged)]
+
+    def query(self, query: str) -> str:
+        results = [{"doc_id": doc_id, "score": score} for doc_id, score in self.search(query)]
+        return json.dumps({"results": results})
+
+    def query_batch(self, queries: Iterable[str], k: int = _TOP_K) -> List[str]:
+        return [json.dumps({"results": [{"doc_id": d, "score": s} for d, s in self.search(q, k)]}) for q in queries]
+
+    def delete_index(self, index_id: str) -> None:
+        d = self._index_dir(index_id)
+        if self.index_dir is not None and self.index_dir.resolve() == d.resolve():
+            self.close()
+            self.shards = []
+            self.index_dir = None
+        if d.exists():
+            shutil.rmtree(d)
+
+    def list_indices(self) -> Iterable[str]:
+        base = Path("indices")
+        if not base.exists():
+            return []
+        return [p.name for p in base.iterdir() if p.is_dir()]
+
+    def list_indexed_files(self, index_id: str) -> Iterable[str]:
+        d = self._index_dir(index_id)
+        n = json.loads((d / "meta.json").read_text())["sharded"]["shards"]
+        files: List[str] = []
+        for i in range(n):
+            files.extend(self._new_shard().list_indexed_files(self._shard_id(index_id, i)))
+        return files
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+# The modules import each other as top-level modules (run from indexing_and_retrieval/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers import make_docs  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # SelfIndex keeps its indices under ./indices
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def docs() -> List[Tuple[str, str]]:
+    return make_docs()
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+# Minimal in-memory stand-in for the Elasticsearch REST endpoints es_index uses: index
+# create / delete / exists, _mapping, _settings, _refresh, _bulk, _search (with scroll)
+# and _msearch. Matching is a plain AND over the query's words; scores are made up but
+# deterministic. Bulk requests can be rejected with 429 to exercise the retries.
+
+
+class StubState:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # name -> {"settings", "mappings", "docs": {id: source}}
+        self.indices: Dict[str, Dict] = {}
+        self.settings_log: List[Dict] = []
+        # Docs per accepted _bulk request
+        self.bulk_sizes: List[int] = []
+        self.msearch_calls = 0
+        # The next reject_requests bulk requests get a whole-request 429, the
+        # reject_items after them a 429 for every third item
+        self.reject_requests = 0
+        self.reject_items = 0
+        # Seconds each bulk request takes, and the most seen in flight at once
+        self.bulk_delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def _words(query: str) -> List[str]:
+    return [w.lower() for w in re.findall(r"\w+", query) if w not in ("AND", "OR", "NOT")]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; keep-alive requests would wait on delayed ACKs
+    disable_nagle_algorithm = True
+    server: "StubServer"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, obj: object = None) -> None:
+        data = json.dumps(obj).encode() if obj is not None else b""
+        self.send_response(status)
+        # The client refuses servers that do not identify as Elasticsearch
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def _route(self) -> None:
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        n = int(self.headers.get("Content-Length", 0) or 0)
+        raw = self.rfile.read(n) if n else b""
+        state = self.server.state
+        if parts and parts[-1] == "_bulk":
+            with state.lock:
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            time.sleep(state.bulk_delay)
+            try:
+                with state.lock:
+                    status, body = self._bulk(state, raw)
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+            return self._send(status, body)
+        with state.lock:
+            status, body = self._dispatch(state, parts, raw, parse_qs(url.query))
+        self._send(status, body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _route
+
+    def _bulk(self, state: StubState, raw: bytes):
+        if state.reject_requests > 0:
+            state.reject_requests -= 1
+            return 429, {"error": {"type": "es_rejected_execution_exception"}, "status": 429}
+        reject = state.reject_items > 0
+        if reject:
+            state.reject_items -= 1
+        lines = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+        items: List[Dict] = []
+        errors = False
+        i = 0
+        while i < len(lines):
+            op, meta = next(iter(lines[i].items()))
+            i += 1
+            source = None
+            if op != "delete":
+                source = lines[i]
+                i += 1
+            docs = state.indices.setdefault(meta["_index"], {"settings": {}, "mappings": {}, "docs": {}})["docs"]
+            item = {"_index": meta["_index"], "_id": meta["_id"]}
+            if reject and len(items) % 3 == 2:
+                item.update(status=429, error={"type": "es_rejected_execution_exception"})
+            elif op == "delete":
+                item["status"] = 200 if docs.pop(meta["_id"], None) is not None else 404
+            else:
+                docs[meta["_id"]] = source
+                item["status"] = 201
+            errors = errors or item["status"] >= 300
+            items.append({op: item})
+        state.bulk_sizes.append(len(items))
+        return 200, {"took": 1, "errors": errors, "items": items}
+
+    def _dispatch(self, state: StubState, parts: List[str], raw: bytes, qs: Dict):
+        method = self.command
+        if parts and parts[-1] == "_msearch":
+            state.msearch_calls += 1
+            lines = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+            responses = []
+            for head, body in zip(lines[0::2], lines[1::2]):
+                if "error" in _words(json.dumps(body["query"])):
+                    responses.append({"error": {"type": "query_shard_exception", "reason": "bad query"}, "status": 400})
+                else:
+                    responses.append({**_hits(state, head.get("index", parts[0]), body), "status": 200})
+            return 200, {"took": 1, "responses": responses}
+        if parts == ["_search", "scroll"]:
+            if method == "DELETE":
+                return 200, {"succeeded": True, "num_freed": 1}
+            return 200, {"_scroll_id": "s", "hits": {"hits": []}, "_shards": _SHARDS}
+        if len(parts) == 2 and parts[1] == "_search":
+            name = parts[0]
+            if "scroll" in qs:
+                hits = [{"_index": name, "_id": d, "_score": None} for d in state.indices[name]["docs"]]
+                return 200, {"_scroll_id": "s", "hits": {"hits": hits}, "_shards": _SHARDS}
+            return 200, _hits(state, name, json.loads(raw or b"{}"))
+        if len(parts) == 2 and parts[1] == "_refresh":
+            return 200, {"_shards": _SHARDS}
+        if len(parts) == 2 and parts[1] == "_settings":
+            state.settings_log.append(json.loads(raw))
+            return 200, {"acknowledged": True}
+        if len(parts) == 2 and parts[1] == "_mapping":
+            if parts[0] == "*":
+                names = list(state.indices)
+            elif parts[0] in state.indices:
+                names = [parts[0]]
+            else:
+                return 404, {"error": {"type": "index_not_found_exception", "reason": parts[0]}, "status": 404}
+            return 200, {n: {"mappings": state.indices[n]["mappings"]} for n in names}
+        if len(parts) == 1:
+            name = parts[0]
+            if method == "HEAD":
+                return (200 if name in state.indices else 404), None
+            if method == "DELETE":
+                state.indices.pop(name, None)
+                return 200, {"acknowledged": True}
+            if method == "PUT":
+                body = json.loads(raw)
+                state.indices[name] = {"settings": body.get("settings"), "mappings": body.get("mappings", {}), "docs": {}}
+                state.settings_log.append(body.get("settings"))
+                return 200, {"acknowledged": True, "index": name}
+        return 400, {"error": f"unhandled {method} {'/'.join(parts)}"}
+
+
+_SHARDS = {"total": 1, "successful": 1, "skipped": 0, "failed": 0}
+
+
+def _hits(state: StubState, name: str, body: Dict) -> Dict:
+    query = body["query"]
+    constant = "constant_score" in query
+    if constant:
+        query = query["constant_score"]["filter"]
+    words = _words(query["query_string"]["query"])
+    hits = []
+    for doc_id, source in state.indices[name]["docs"].items():
+        text = f"{source.get('title') or ''} {source.get('text') or ''}".lower().split()
+        if all(w in text for w in words):
+            score = 1.0 if constant else float(len(source.get("text", "")) % 7 + 1)
+            hits.append({"_index": name, "_id": doc_id, "_score": score})
+    hits.sort(key=lambda h: (-h["_score"], h["_id"]))
+    return {"took": 1, "timed_out": False, "hits": {"hits": hits[:body.get("size", 10)]}}
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.state = StubState()
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import random
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from self_index import SelfIndex
+
+# Synthetic corpus and index helpers shared by the tests
+
+WORDS = ("apple banana cherry grape orange lemon melon peach river mountain forest ocean "
+         "castle dragon wizard knight market engine rocket planet signal garden winter summer").split()
+
+QUERIES = [
+    '"apple"',
+    '"banana" AND "cherry"',
+    '"apple" OR "dragon"',
+    'NOT "banana"',
+    '"apple" AND NOT "banana"',
+    '("apple" OR "grape") AND NOT ("river" OR "ocean")',
+    '"red dragon"',
+    '"castle" AND "knight" AND "wizard"',
+    'NOT ("apple" OR "banana")',
+    '"nosuchword"',
+]
+
+
+def make_docs(n: int = 300, seed: int = 7, prefix: str = "d") -> List[Tuple[str, str]]:
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n):
+        words = rng.choices(WORDS, k=rng.randint(3, 40))
+        if i % 10 == 0:
+            words += ["red", "dragon"]
+        docs.append((f"{prefix}{i}", " ".join(words)))
+    return docs
+
+
+def build(index_id: str, docs: Iterable[Tuple[str, str]], info: str = "TFIDF", qproc: str = "TERMatat",
+          compr: str = "CODE", optim: str = "Null", **options) -> SelfIndex:
+    """Builds indices/index_id (relative to the test's working directory) and loads it."""
+    options.setdefault("background_merge", False)
+    idx = SelfIndex("SelfIndex", info, "CUSTOM", qproc, compr, optim, **options)
+    idx.create_index(index_id, docs)
+    idx.load_index(f"indices/{index_id}")
+    return idx
+
+
+def index_files(index_dir: Path) -> dict:
+    return {str(p.relative_to(index_dir)): p.read_bytes() for p in sorted(index_dir.rglob("*.bin"))}
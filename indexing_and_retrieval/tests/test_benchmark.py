@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import benchmark
+from benchmark import TRACKED, compare, read_docs, run_variant, variant_matrix
+from helpers import QUERIES
+
+
+def _result(id_: str, **metrics) -> dict:
+    return {"id": id_, **{m: 1.0 for m in TRACKED}, **metrics}
+
+
+def test_variant_matrix():
+    variants = list(variant_matrix(infos=["BOOLEAN", "BM25"], optims=["Null", "Skipping"]))
+    assert len(variants) == 2 * 2 * len(list(variant_matrix(infos=["BOOLEAN"], optims=["Null"])))
+    assert {v["dstore"] for v in variants} == {"CUSTOM"}
+    assert len({tuple(v.values()) for v in variants}) == len(variants)
+
+
+def test_read_docs_prepends_title(tmp_path):
+    path = tmp_path / "docs.jsonl"
+    rows = [{"doc_id": "a", "title": "Head", "text": "body"}, {"id": 7, "text": "plain"}]
+    path.write_text("\n".join(json.dumps(r) for r in rows) + "\n\n")
+    assert read_docs(path) == [("a", "Head\nbody"), ("7", "plain")]
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = [_result("x"), _result("y")]
+    results = [_result("x", p95_ms=1.05, qps=0.5, size_bytes=0.5), _result("y", build_s=2.0), _result("new", qps=0.0)]
+    regressions = compare(results, baseline, tolerance=0.10)
+    assert sorted((r["id"], r["metric"]) for r in regressions) == [("x", "qps"), ("y", "build_s")]
+    assert compare(results, baseline, tolerance=1.5) == []
+
+
+def test_run_variant(docs):
+    variant = {"info": "BM25", "dstore": "CUSTOM", "compr": "CODE", "qproc": "DOCatat", "optim": "EarlyStopping"}
+    result = run_variant(variant, docs, QUERIES, repeat=2)
+    assert set(TRACKED) <= set(result)
+    assert result["docs"] == len(docs) and result["queries"] == len(QUERIES)
+    assert result["size_bytes"] == sum(result["files"].values()) > 0
+    assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+    # The index is deleted once measured
+    assert not (Path("indices") / "bench" / result["id"]).exists()
+
+
+def test_main_writes_results_and_fails_on_regression(docs):
+    Path("docs.jsonl").write_text("".join(json.dumps({"doc_id": d, "text": t}) + "\n" for d, t in docs[:50]))
+    Path("queries.txt").write_text("\n".join(QUERIES))
+    args = ["--docs", "docs.jsonl", "--queries", "queries.txt", "--info", "BOOLEAN", "--compr", "CODE",
+            "--qproc", "TERMatat", "--optim", "Null"]
+    assert benchmark.main(args + ["--out", "a.json"]) == 0
+    run = json.loads(Path("a.json").read_text())
+    assert len(run["results"]) == 1
+    # A baseline that was far faster makes the run fail
+    for metric, higher_is_better in TRACKED.items():
+        run["results"][0][metric] *= 1000 if higher_is_better else 0.001
+    Path("base.json").write_text(json.dumps(run))
+    assert benchmark.main(args + ["--out", "b.json", "--baseline", "base.json"]) == 1
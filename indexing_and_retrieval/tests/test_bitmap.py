@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import random
+
+import numpy as np
+import pytest
+
+from bitmap import ARRAY_MAX, CHUNK_SIZE, DocSet
+
+
+def _sample(rng: random.Random, dense: bool) -> set:
+    # Spans several chunks, with array or bitmap containers
+    n = ARRAY_MAX * 3 if dense else 300
+    return set(rng.sample(range(3 * CHUNK_SIZE), n))
+
+
+@pytest.mark.parametrize("dense_a, dense_b", [(False, False), (True, False), (False, True), (True, True)])
+def test_set_algebra_matches_python_sets(dense_a, dense_b):
+    rng = random.Random(hash((dense_a, dense_b)))
+    a, b = _sample(rng, dense_a), _sample(rng, dense_b)
+    da, db = DocSet.from_sorted(sorted(a)), DocSet.from_sorted(sorted(b))
+    assert (da & db).to_list() == sorted(a & b)
+    assert (da | db).to_list() == sorted(a | b)
+    assert (da - db).to_list() == sorted(a - b)
+    assert len(da | db) == len(a | b)
+
+
+def test_constructors_agree():
+    codes = sorted(random.Random(1).sample(range(200_000), 9000))
+    from_sorted = DocSet.from_sorted(codes)
+    from_array = DocSet.from_array(np.array(codes))
+    assert from_sorted.to_list() == from_array.to_list() == codes
+    assert from_array.to_array().tolist() == codes
+    assert list(from_array) == codes
+
+
+def test_range_and_complement():
+    universe = DocSet.range(5, CHUNK_SIZE + 10)
+    assert universe.to_list() == list(range(5, CHUNK_SIZE + 10))
+    some = DocSet.from_sorted([5, 6, CHUNK_SIZE + 9])
+    rest = some.complement(universe)
+    assert len(rest) == len(universe) - 3
+    assert 5 not in rest and 7 in rest and CHUNK_SIZE + 9 not in rest
+    assert not DocSet.range(3, 3)
+
+
+def test_containers_follow_cardinality():
+    sparse = DocSet.from_sorted(range(0, 100))
+    dense = DocSet.from_sorted(range(0, ARRAY_MAX + 1))
+    assert sparse.nbytes() == 8 * 100
+    assert dense.nbytes() == CHUNK_SIZE // 8
+    # Shrinking a bitmap below ARRAY_MAX turns it back into an array
+    assert (dense - DocSet.from_sorted(range(10, ARRAY_MAX + 1))).nbytes() == 8 * 10
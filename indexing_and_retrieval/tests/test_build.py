@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import self_index
+from helpers import QUERIES, build, index_files
+
+
+def test_small_memory_budget_builds_the_same_index(docs):
+    big = build("big", docs, memory_budget_mb=512)
+    small = build("small", docs, memory_budget_mb=0.01)
+    assert index_files(Path("indices/small")) == index_files(Path("indices/big"))
+    assert [small.query(q) for q in QUERIES] == [big.query(q) for q in QUERIES]
+
+
+def test_runs_are_merged_in_passes_and_removed(docs, monkeypatch):
+    build("ref", docs)
+    monkeypatch.setattr(self_index, "_MAX_MERGE_FANIN", 2)
+    build("passes", docs, memory_budget_mb=0.005)
+    assert index_files(Path("indices/passes")) == index_files(Path("indices/ref"))
+    assert not list(Path("indices/passes").glob("run-*.tmp"))
+
+
+def test_query_results(docs):
+    idx = build("q", docs, info="BOOLEAN")
+    apple = {d for d, text in docs if "apple" in text.split()}
+    banana = {d for d, text in docs if "banana" in text.split()}
+    got = {r["doc_id"] for r in json.loads(idx.query('"apple" AND NOT "banana"'))["results"]}
+    assert len(got) == min(50, len(apple - banana))
+    assert got <= apple - banana
+
+
+def test_parallel_build_matches_serial_build(docs):
+    serial = build("serial", docs)
+    # A small budget splits the input into many chunks inverted by different workers
+    parallel = build("parallel", docs, workers=2, memory_budget_mb=0.05)
+    assert index_files(Path("indices/parallel")) == index_files(Path("indices/serial"))
+    assert [parallel.query(q) for q in QUERIES] == [serial.query(q) for q in QUERIES]
+
+
+def test_duplicate_doc_ids_keep_their_first_text():
+    idx = build("dup", [("a", "apple"), ("b", "banana"), ("a", "cherry")], info="BOOLEAN")
+    assert [r["doc_id"] for r in json.loads(idx.query('"apple"'))["results"]] == ["a"]
+    assert json.loads(idx.query('"cherry"'))["results"] == []
+    assert len(idx.doc_table) == 2
+
+
+# Peak RSS growth of building one index, in a fresh process so earlier tests don't count
+_PEAK_RSS = """
+import resource, sys
+sys.path.insert(0, sys.argv[1])
+from self_index import SelfIndex
+idx = SelfIndex("SelfIndex", "TFIDF", "CUSTOM", "TERMatat", "CODE", "Null", memory_budget_mb=1,
+                background_merge=False)
+idx.create_index("warm", [("w", "heavy light")])
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+idx.create_index("heavy", ((f"d{i}", "heavy " * 200) for i in range(int(sys.argv[2]))))
+print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024)
+"""
+
+
+def test_one_heavy_term_builds_in_bounded_memory():
+    # 2M positions of a single term spread over many runs; held at once they take ~60 MB
+    root = str(Path(self_index.__file__).resolve().parent)
+    out = subprocess.run([sys.executable, "-c", _PEAK_RSS, root, "10000"], capture_output=True, text=True, check=True)
+    assert float(out.stdout) < 25
+    idx = self_index.SelfIndex.open("indices/heavy", background_merge=False)
+    [term] = idx.query_terms("heavy")
+    assert idx.term_stats([term])[1] == {term: 10000}
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import time
+
+from cache import LRUCache
+from helpers import build
+
+
+def test_evicts_least_recently_used_within_budget():
+    cache: LRUCache[str] = LRUCache(max_bytes=10)
+    cache.put("a", "A", 4)
+    cache.put("b", "B", 4)
+    assert cache.get("a") == "A"  # b is now the least recently used
+    cache.put("c", "C", 4)
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 8
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_oversized_entries_are_not_cached():
+    cache: LRUCache[str] = LRUCache(max_bytes=10)
+    cache.put("big", "x", 11)
+    assert cache.get("big") is None and len(cache) == 0
+
+
+def test_replacing_a_key_recharges_it():
+    cache: LRUCache[str] = LRUCache(max_bytes=10)
+    cache.put("a", "A", 8)
+    cache.put("a", "A2", 2)
+    assert cache.stats()["bytes"] == 2 and cache.get("a") == "A2"
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache: LRUCache[str] = LRUCache(max_bytes=10, ttl=5)
+    cache.put("a", "A", 1)
+    now[0] += 4.9
+    assert cache.get("a") == "A"
+    now[0] += 0.2
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["bytes"] == 0
+
+
+def test_index_reuses_decoded_postings(docs):
+    idx = build("c", docs, result_cache_mb=0)
+    idx.query('"apple" AND "banana"')
+    misses = idx.postings_cache_info()["misses"]
+    idx.query('"apple" AND "banana"')
+    info = idx.postings_cache_info()
+    assert info["misses"] == misses and info["hits"] > 0
+
+
+def test_index_postings_cache_can_be_disabled(docs):
+    idx = build("c", docs, result_cache_mb=0, postings_cache_mb=0)
+    idx.query('"apple"')
+    idx.query('"apple"')
+    assert idx.postings_cache_info()["entries"] == 0
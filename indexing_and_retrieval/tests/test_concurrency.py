@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from helpers import QUERIES, build
+
+MORE = QUERIES + ['("castle" OR "knight") AND ("wizard" OR NOT "market")', '"apple" "banana" OR "cherry"',
+                  'NOT NOT "winter" AND ("summer" OR "garden")']
+
+
+@pytest.mark.parametrize("info, qproc", [("BOOLEAN", "TERMatat"), ("BM25", "DOCatat")])
+def test_concurrent_queries_match_single_thread(docs, info, qproc):
+    idx = build("c", docs, info=info, qproc=qproc, result_cache_mb=0)
+    expected = {q: idx.query(q) for q in MORE}
+    queries = MORE * 40
+    interval = sys.getswitchinterval()
+    # Switch threads as often as possible so interleavings inside query() are exercised
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(idx.query, queries))
+    finally:
+        sys.setswitchinterval(interval)
+    assert [r == expected[q] for q, r in zip(queries, results)] == [True] * len(queries)
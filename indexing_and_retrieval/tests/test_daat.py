@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from daat import AndCursor, AndNotCursor, EmptyCursor, OrCursor, TermCursor, top_k
+from helpers import QUERIES, build
+from postings import END, PostingsList, encode_postings
+
+
+def _cursor(codes):
+    payload, positions = encode_postings({d: [0] for d in codes}, "CODE", 2)
+    return TermCursor(PostingsList(payload, "CODE", lambda: positions).cursor())
+
+
+def _walk(cursor):
+    out = []
+    while cursor.doc < END:
+        out.append(cursor.doc)
+        cursor.next()
+    return out
+
+
+A = [1, 3, 5, 7, 9, 11, 20]
+B = [2, 3, 4, 9, 10, 20, 30]
+C = [3, 9, 15, 20]
+
+
+def test_and_or_andnot():
+    assert _walk(AndCursor([_cursor(A), _cursor(B), _cursor(C)])) == [3, 9, 20]
+    assert _walk(OrCursor([_cursor(A), _cursor(B)])) == sorted(set(A) | set(B))
+    assert _walk(AndNotCursor(_cursor(A), _cursor(B))) == [1, 5, 7, 11]
+    assert _walk(AndCursor([_cursor(A), EmptyCursor()])) == []
+
+
+def test_seek_only_moves_forward():
+    cur = OrCursor([_cursor(A), _cursor(C)])
+    assert cur.seek(8) == 9
+    assert cur.seek(4) == 9
+    assert cur.seek(16) == 20
+
+
+def test_top_k_keeps_best_and_breaks_ties_by_doc():
+    scores = {1: 0.5, 3: 2.0, 5: 2.0, 7: None, 9: 1.0}
+    assert top_k(_cursor([1, 3, 5, 7, 9]), scores.get, 3) == [(3, 2.0), (5, 2.0), (9, 1.0)]
+
+
+def _results(response: str):
+    return [(r["doc_id"], r["score"]) for r in json.loads(response)["results"]]
+
+
+@pytest.mark.parametrize("info", ["BOOLEAN", "WORDCOUNT", "TFIDF", "BM25"])
+def test_docatat_matches_termatat(docs, info):
+    taat = build("taat", docs, info=info)
+    daat = build("daat", docs, info=info, qproc="DOCatat")
+    for q in QUERIES:
+        got, expected = _results(daat.query(q)), _results(taat.query(q))
+        assert [d for d, _ in got] == [d for d, _ in expected], q
+        assert [s for _, s in got] == pytest.approx([s for _, s in expected]), q
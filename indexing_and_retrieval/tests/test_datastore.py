@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from datastore import LocalStore
+from helpers import QUERIES, build, make_docs
+
+
+def test_mapped_reads_match_file_reads(docs):
+    build("m", docs)
+    mapped = LocalStore(Path("indices/m"))
+    mapped.map_postings()
+    plain = LocalStore(Path("indices/m"))
+    for term, info in mapped.read_lexicon().items():
+        view = mapped.read_postings(info.offset, info.length)
+        assert isinstance(view, memoryview)
+        assert bytes(view) == plain.read_postings(info.offset, info.length)
+        assert bytes(mapped.read_positions(info.pos_offset, info.pos_length)) == \
+            plain.read_positions(info.pos_offset, info.pos_length)
+
+
+def test_unmapped_index_gives_the_same_results(docs):
+    mapped = build("m", docs)
+    plain = build("p", docs, mmap_postings=False)
+    assert [plain.query(q) for q in QUERIES] == [mapped.query(q) for q in QUERIES]
+
+
+def test_rebuild_does_not_disturb_a_mapped_index(docs):
+    idx = build("r", docs)
+    before = [idx.query(q) for q in QUERIES]
+    # Another writer replaces the files via rename while idx keeps its mapping
+    build("r", make_docs(seed=99))
+    assert [idx.query(q) for q in QUERIES] == before
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pytest
+
+from doctable import DOCTABLE_VERSION, DocTable, DocTableFile, write_doc_table
+from helpers import build
+
+
+def _file(path, rows):
+    write_doc_table(path, rows)
+    return DocTableFile(path)
+
+
+def test_file_round_trip(tmp_path):
+    # Codes 5..9 with a hole at 7 (dropped by a merge)
+    rows = [(5, "b", 3), (6, "ä-doc", 0), (8, "a", 12), (9, "c", 4)]
+    f = _file(tmp_path / "docs.bin", rows)
+    assert (f.first_code, f.n) == (5, 5)
+    assert f.lengths.tolist() == [3, 0, 0, 12, 4]
+    assert f.present.tolist() == [1, 1, 0, 1, 1]
+    for code, doc_id, _ in rows:
+        assert f.doc_id(code) == doc_id
+        assert f.code_of(doc_id) == code
+    assert f.code_of("zz") is None
+
+
+def test_table_over_segments(tmp_path):
+    a = _file(tmp_path / "a.bin", [(1, "x", 2), (2, "y", 4)])
+    b = _file(tmp_path / "b.bin", [(3, "x", 6), (4, "z", 8)])
+    table = DocTable([a, b], np.array([1]))
+    assert table.max_code == 4
+    assert table.live_codes().tolist() == [2, 3, 4]
+    # The live version of a re-added id wins
+    assert table.code_of("x") == 3
+    assert list(table) == ["y", "x", "z"]
+    assert table.total_length() == 18 and table.avgdl == 6.0
+    merged = _file(tmp_path / "m.bin", [(2, "y", 4), (3, "x", 6), (4, "z", 8)])
+    table.replace_files([a, b], merged)
+    assert [table.doc_id(c) for c in (2, 3, 4)] == ["y", "x", "z"]
+    with pytest.raises(KeyError):
+        table.doc_id(1)
+
+
+def test_rejects_other_versions(tmp_path):
+    path = tmp_path / "docs.bin"
+    write_doc_table(path, [(1, "a", 1)])
+    data = bytearray(path.read_bytes())
+    data[0:4] = (DOCTABLE_VERSION + 1).to_bytes(4, "little")
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="version"):
+        DocTableFile(path)
+
+
+@pytest.mark.parametrize("qproc", ["TERMatat", "DOCatat"])
+def test_codes_that_are_not_live_never_reach_doc_id(docs, qproc, monkeypatch):
+    idx = build("t", docs, info="BOOLEAN", qproc=qproc)
+    idx.update_index("t", [("d0", ""), ("d1", "")], [])
+    idx.force_merge("t")
+    # As if the ranking had run on a view from before the merge purged codes 1 and 2
+    monkeypatch.setattr(idx, "_ranked", lambda *a, **kw: [(1, 1.0), (2, 1.0), (3, 1.0)])
+    assert json.loads(idx.query('"anything"'))["results"] == [{"doc_id": "d2", "score": 1.0}]
+    assert idx.search('"anything"') == [("d2", 1.0)]
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from es_index import ESIndex, bulk_index, get_es, search
+from es_stub import StubServer
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+def _docs(n: int):
+    return [(f"D{i}", f"Title {i}\napple banana {'cherry' if i % 2 else 'grape'} w{i}") for i in range(n)]
+
+
+def _index(stub: StubServer, info: str = "BM25", **options) -> ESIndex:
+    options = {"initial_backoff": 0.01, "chunk_size": 100, **options}
+    return ESIndex("ESIndex", info, "DB1", "TERMatat", "CLIB", "Null", host=stub.url, **options)
+
+
+def test_parallel_bulk_retries_rejections(stub):
+    stub.state.reject_requests = 2
+    stub.state.reject_items = 4
+    stub.state.bulk_delay = 0.01
+    idx = _index(stub, bulk_threads=4)
+    idx.create_index("bench/Run1", _docs(1000))
+    docs = stub.state.indices["bench-run1"]["docs"]
+    assert sorted(docs) == sorted(d for d, _ in _docs(1000))
+    assert stub.state.max_in_flight > 1
+    # Rejected items were sent again in later, smaller requests
+    assert sum(stub.state.bulk_sizes) > 1000
+    # Loaded without refreshes or replicas, then restored
+    assert stub.state.settings_log[0]["refresh_interval"] == "-1"
+    assert stub.state.settings_log[-1] == {"refresh_interval": "1s", "number_of_replicas": 0}
+
+
+def test_title_is_indexed(stub):
+    idx = _index(stub)
+    idx.create_index("t", [("a", "Red Dragon\nthe castle"), ("b", "no title line")])
+    docs = stub.state.indices["t"]["docs"]
+    assert (docs["a"]["title"], docs["a"]["text"]) == ("Red Dragon", "the castle")
+    assert (docs["b"]["title"], docs["b"]["text"]) == ("", "no title line")
+    assert [r["doc_id"] for r in json.loads(idx.query("dragon"))["results"]] == ["a"]
+
+
+def test_query_batch_uses_msearch(stub):
+    idx = _index(stub, msearch_size=25)
+    idx.create_index("q", _docs(200))
+    queries = ['"cherry" AND w1', "apple", "grape", "error"] * 15
+    responses = idx.query_batch(queries, k=50)
+    assert stub.state.msearch_calls == 3
+    assert len(responses) == len(queries)
+    for q, r in zip(queries, responses):
+        if q == "error":
+            assert json.loads(r)["results"] == [] and "error" in json.loads(r)
+        else:
+            assert r == idx.query(q), q
+
+
+def test_update_and_open(stub):
+    idx = _index(stub, info="BOOLEAN")
+    idx.create_index("bench/u", _docs(50))
+    idx.update_index("bench/u", [("D1", ""), ("D3", ""), ("missing", "")], [("D3", "New\nzebra")])
+    assert sorted(idx.list_indexed_files("bench/u")) == sorted(d for d, _ in _docs(50) if d != "D1")
+    opened = ESIndex.open("indices/bench/u", host=stub.url)
+    assert opened.config == idx.config and opened.index_name == "bench-u"
+    assert json.loads(opened.query("zebra")) == {"results": [{"doc_id": "D3", "score": 1.0}]}
+    assert opened.list_indices() == ["bench-u"]
+    opened.delete_index("bench/u")
+    assert opened.list_indices() == []
+
+
+def test_bulk_index_batch_size(stub):
+    es = get_es(stub.url)
+    records = [{"doc_id": f"r{i}", "title": "", "text": "hello"} for i in range(2500)]
+    assert bulk_index(es, "nb", records) == (2500, 0)
+    assert stub.state.bulk_sizes == [2000, 500]
+    assert len(search(es, "nb", "hello", size=5)) == 5
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import json
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from helpers import QUERIES, build
+from ingest import iter_batches, iter_documents, iter_records
+from self_index import SelfIndex
+
+
+def _table(rows: int, start: int = 0) -> pa.Table:
+    return pa.table({
+        "doc_id": [f"d{i}" for i in range(start, start + rows)],
+        "title": [f"Title {i}" if i % 3 else None for i in range(start, start + rows)],
+        "text": [f"apple banana {'cherry' if i % 2 else 'grape'} {i}" for i in range(start, start + rows)],
+        "source": ["wiki"] * rows,
+    })
+
+
+def _write(table: pa.Table, path, fmt: str) -> None:
+    if fmt == "parquet":
+        pq.write_table(table, path, row_group_size=100)
+    elif fmt == "arrow":
+        with pa.ipc.new_file(str(path), table.schema) as w:
+            w.write_table(table, max_chunksize=100)
+    else:
+        with pa.ipc.new_stream(str(path), table.schema) as w:
+            w.write_table(table, max_chunksize=100)
+
+
+def _expected(table: pa.Table):
+    return [(r["doc_id"], "\n".join(v for v in (r["title"], r["text"]) if v)) for r in table.to_pylist()]
+
+
+@pytest.mark.parametrize("fmt, suffix", [("parquet", ".parquet"), ("arrow", ".arrow"), ("stream", ".arrows")])
+def test_round_trip(tmp_path, fmt, suffix):
+    tables = [_table(250), _table(120, start=250)]
+    paths = [tmp_path / f"part-{i}{suffix}" for i in range(2)]
+    for t, p in zip(tables, paths):
+        _write(t, p, fmt)
+    seen = []
+    docs = list(iter_documents(paths, batch_rows=64, progress=seen.append))
+    assert docs == _expected(tables[0]) + _expected(tables[1])
+    assert seen[-1].rows == 370 and seen[-1].files_done == seen[-1].files == 2
+    assert seen[-1].total_rows == (370 if fmt == "parquet" else None)
+    assert list(iter_records(paths, batch_rows=64)) == tables[0].to_pylist() + tables[1].to_pylist()
+
+
+def test_batches_are_bounded(tmp_path):
+    _write(_table(1000), tmp_path / "a.parquet", "parquet")
+    sizes = [len(cols["doc_id"]) for _, cols in iter_batches([tmp_path / "a.parquet"], ["doc_id"], batch_rows=64)]
+    assert max(sizes) <= 64 and sum(sizes) == 1000
+
+
+def test_missing_columns(tmp_path):
+    _write(pa.table({"doc_id": ["a", "b"], "text": ["x", ""]}), tmp_path / "a.arrow", "arrow")
+    assert list(iter_documents([tmp_path / "a.arrow"])) == [("a", "x"), ("b", "")]
+    assert list(iter_records([tmp_path / "a.arrow"])) == [{"doc_id": "a", "text": "x"}, {"doc_id": "b", "text": ""}]
+    with pytest.raises(ValueError, match="no 'id'"):
+        list(iter_documents([tmp_path / "a.arrow"], id_column="id"))
+
+
+def test_early_stop_ends_the_reader(tmp_path):
+    _write(_table(2000), tmp_path / "a.parquet", "parquet")
+    it = iter_documents([tmp_path / "a.parquet"], batch_rows=16, prefetch=2)
+    assert [next(it) for _ in range(3)] == _expected(_table(3))
+    # Closing the generator joins the reader thread instead of leaving it blocked
+    it.close()
+    assert not any(t.name == "ingest-reader" for t in threading.enumerate())
+
+
+def test_builds_same_index_as_tuples(tmp_path):
+    table = _table(400)
+    _write(table, tmp_path / "a.parquet", "parquet")
+    streamed = SelfIndex("SelfIndex", "BM25", "CUSTOM", "TERMatat", "CODE", "Null", background_merge=False)
+    streamed.create_index("s", iter_documents([tmp_path / "a.parquet"], batch_rows=50))
+    streamed.load_index("indices/s")
+    direct = build("d", _expected(table), info="BM25")
+    for q in QUERIES + ['"cherry"', '"title"']:
+        assert json.loads(streamed.query(q)) == json.loads(direct.query(q)), q
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import random
+import struct
+
+import pytest
+
+from lexicon import LEXICON_VERSION, Lexicon, LexiconWriter, TermInfo
+
+
+def _terms(n: int = 1000) -> list:
+    rng = random.Random(2)
+    words = {"".join(rng.choices("abcdefgh", k=rng.randint(1, 9))) for _ in range(n)}
+    # Non-ASCII terms sort by their UTF-8 bytes, like str order
+    return sorted(words | {"café", "cafe", "naïve", "z" * 300})
+
+
+def _write(path, terms, block_size=16):
+    w = LexiconWriter(path, block_size)
+    infos = {}
+    for i, t in enumerate(terms):
+        infos[t] = TermInfo(i + 1, 2 * i + 1, 10 * i, 7, 5 * i, 3)
+        w.add(t, infos[t])
+    w.close()
+    return infos
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 16])
+def test_lookup_and_iteration(tmp_path, block_size):
+    terms = _terms()
+    infos = _write(tmp_path / "lexicon.bin", terms, block_size)
+    lex = Lexicon(tmp_path / "lexicon.bin")
+    assert len(lex) == len(terms)
+    assert list(lex) == terms
+    assert dict(lex.items()) == infos
+    for t in terms:
+        assert lex.get(t) == infos[t]
+    for missing in ("", "a" * 20, "zz", "cafè", "~"):
+        assert missing in infos or lex.get(missing) is None
+
+
+def test_empty_lexicon(tmp_path):
+    _write(tmp_path / "lexicon.bin", [])
+    lex = Lexicon(tmp_path / "lexicon.bin")
+    assert len(lex) == 0 and lex.get("a") is None and list(lex) == []
+
+
+def test_terms_must_be_sorted_and_unique(tmp_path):
+    w = LexiconWriter(tmp_path / "lexicon.bin")
+    w.add("b", TermInfo(1, 1, 0, 1, 0, 1))
+    with pytest.raises(ValueError):
+        w.add("a", TermInfo(1, 1, 0, 1, 0, 1))
+    with pytest.raises(ValueError):
+        w.add("b", TermInfo(1, 1, 0, 1, 0, 1))
+
+
+def test_rejects_other_versions(tmp_path):
+    path = tmp_path / "lexicon.bin"
+    _write(path, ["a"])
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<B", data, 0, LEXICON_VERSION + 1)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="version"):
+        Lexicon(path)
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import random
+import time
+
+import pytest
+
+from helpers import QUERIES, build
+from loadgen import LatencyHistogram, arrival_offsets, open_target, run_load, saturation_point
+
+
+def test_histogram_precision():
+    rng = random.Random(1)
+    values = sorted(rng.randint(0, 5_000_000) for _ in range(5000))
+    h = LatencyHistogram()
+    for v in values:
+        h.record(v)
+    assert h.total == len(values) and h.min == values[0] and h.max == values[-1]
+    for p in (50, 90, 99, 99.9):
+        exact = values[max(0, int(-(-len(values) * p // 100)) - 1)]
+        assert exact <= h.value_at(p) <= exact * (1 + 2 ** -10)
+    assert h.value_at(100) == values[-1]
+
+
+def test_small_values_are_exact():
+    h = LatencyHistogram()
+    for v in (3, 3, 7, 2047):
+        h.record(v)
+    assert [h.value_at(p) for p in (25, 50, 75, 100)] == [3, 3, 7, 2047]
+    assert h.export() == {"bits": 11, "buckets": [[3, 2], [7, 1], [2047, 1]]}
+
+
+def test_merge_matches_recording_once():
+    a, b, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, v in enumerate(random.Random(2).sample(range(1, 10 ** 6), 500)):
+        (a if i % 2 else b).record(v)
+        both.record(v)
+    a.merge(b)
+    assert a.summary_ms() == both.summary_ms()
+
+
+def test_arrival_offsets():
+    assert arrival_offsets(4, 2.0, "constant") == [0.0, 0.5, 1.0, 1.5]
+    poisson = arrival_offsets(20000, 100.0, seed=3)
+    assert poisson == arrival_offsets(20000, 100.0, seed=3)
+    assert poisson == sorted(poisson) and poisson[0] == 0.0
+    assert poisson[-1] / len(poisson) == pytest.approx(0.01, rel=0.05)
+    with pytest.raises(ValueError):
+        arrival_offsets(3, 1.0, "bursty")
+
+
+def test_response_time_includes_queueing():
+    # One worker, a 20ms service time and arrivals every 5ms: queries queue up and
+    # their response time (from the scheduled send) grows well past the service time
+    r = run_load(lambda q: time.sleep(0.02), ["q"], rate=200, n=20, arrivals="constant", concurrency=1)
+    assert r["completed"] == 20 and r["errors"] == 0
+    assert r["service_ms"]["p50"] >= 19
+    assert r["response_ms"]["p100"] > 3 * r["service_ms"]["p100"]
+    assert r["achieved_qps"] < r["sent_qps"] / 2
+    assert saturation_point([r]) is None
+
+
+def test_errors_are_counted():
+    def flaky(q):
+        if q == "bad":
+            raise RuntimeError("boom")
+    r = run_load(flaky, ["ok", "bad"], rate=500, n=10, arrivals="constant")
+    assert (r["completed"], r["errors"]) == (5, 5)
+    assert "boom" in r["first_errors"][0]
+
+
+def test_self_index_target(docs):
+    build("lg", docs, info="BM25")
+    target = {"kind": "self", "location": "indices/lg", "background_merge": True}
+    assert open_target(**target)('"apple"').startswith('{"results"')
+    results = [run_load(target, QUERIES, rate, n=20, warmup=5) for rate in (50, 100)]
+    assert all(r["completed"] == 20 and r["errors"] == 0 for r in results)
+    assert saturation_point(results, tolerance=0.5) in (50, 100)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import json
+import random
+
+import pytest
+
+from helpers import WORDS, build
+from planner import Planner
+from preprocess import TextPreprocessor
+
+DF = {"common": 900, "mid": 100, "rare": 3, "other": 50}
+
+
+def _planner() -> Planner:
+    return Planner(lambda t: t if t != "the" else None, str.split, lambda t: DF.get(t, 0), n_docs=1000)
+
+
+def test_and_operands_go_rarest_first():
+    plan = _planner().plan(('AND', ('TERM', 'common'), ('AND', ('TERM', 'rare'), ('TERM', 'mid'))))
+    assert plan == ('AND', ('TERM', 'rare'), ('TERM', 'mid'), ('TERM', 'common'))
+
+
+def test_negations_become_one_andnot():
+    plan = _planner().plan(('AND', ('TERM', 'mid'), ('AND', ('NOT', ('TERM', 'rare')), ('NOT', ('TERM', 'other')))))
+    assert plan == ('ANDNOT', ('TERM', 'mid'), ('OR', ('TERM', 'rare'), ('TERM', 'other')))
+
+
+def test_simplifications():
+    p = _planner()
+    assert p.plan(('NOT', ('NOT', ('TERM', 'mid')))) == ('TERM', 'mid')
+    assert p.plan(('AND', ('TERM', 'mid'), ('TERM', 'missing'))) == ('EMPTY',)
+    assert p.plan(('OR', ('TERM', 'mid'), ('TERM', 'the'))) == ('TERM', 'mid')
+    assert p.plan(('OR', ('TERM', 'mid'), ('TERM', 'mid'))) == ('TERM', 'mid')
+    assert p.plan(('PHRASE', 'rare missing')) == ('EMPTY',)
+    assert p.plan(('PHRASE', 'rare mid')) == ('PHRASE', ('rare', 'mid'))
+
+
+def test_explain_reports_estimates():
+    p = _planner()
+    out = p.explain(p.plan(('AND', ('TERM', 'rare'), ('TERM', 'mid'))))
+    assert out["op"] == "AND" and [c["term"] for c in out["children"]] == ["rare", "mid"]
+    assert out["est_cost"] == 103 and 0 < out["est_docs"] <= 3
+
+
+# --- Planned evaluation against a brute-force evaluation of the query tree ---
+def _random_query(rng: random.Random, depth: int = 0):
+    # (query text, predicate over a doc's normalized tokens)
+    r = rng.random()
+    if depth >= 3 or r < 0.3:
+        if rng.random() < 0.2:
+            a, b = rng.sample(WORDS, 2)
+            return f'"{a} {b}"', ('PHRASE', (a, b))
+        w = rng.choice(WORDS)
+        return f'"{w}"', ('TERM', w)
+    if r < 0.45:
+        text, node = _random_query(rng, depth + 1)
+        return f'NOT {text}', ('NOT', node)
+    op = rng.choice(['AND', 'OR'])
+    (lt, ln), (rt, rn) = _random_query(rng, depth + 1), _random_query(rng, depth + 1)
+    return f'({lt} {op} {rt})', (op, ln, rn)
+
+
+def _matches(node, tokens) -> bool:
+    kind = node[0]
+    if kind == 'TERM':
+        return node[1] in tokens
+    if kind == 'PHRASE':
+        a, b = node[1]
+        return any(x == a and y == b for x, y in zip(tokens, tokens[1:]))
+    if kind == 'NOT':
+        return not _matches(node[1], tokens)
+    if kind == 'AND':
+        return _matches(node[1], tokens) and _matches(node[2], tokens)
+    return _matches(node[1], tokens) or _matches(node[2], tokens)
+
+
+@pytest.mark.parametrize("qproc, optim", [("TERMatat", "Null"), ("TERMatat", "Skipping"), ("DOCatat", "Null")])
+def test_plans_match_brute_force(docs, qproc, optim):
+    idx = build("p", docs, info="BOOLEAN", qproc=qproc, optim=optim)
+    pre = TextPreprocessor()
+    stem = {w: pre.tokenize(w)[0] for w in WORDS}
+    tokens = [pre.tokenize(text) for _, text in docs]
+    rng = random.Random(42)
+    for _ in range(150):
+        text, node = _random_query(rng)
+        node = _stemmed(node, stem)
+        expected = [docs[i][0] for i, toks in enumerate(tokens) if _matches(node, toks)][:50]
+        got = [r["doc_id"] for r in json.loads(idx.query(text))["results"]]
+        assert got == expected, text
+
+
+def _stemmed(node, stem):
+    if node[0] == 'TERM':
+        return ('TERM', stem[node[1]])
+    if node[0] == 'PHRASE':
+        return ('PHRASE', tuple(stem[w] for w in node[1]))
+    return (node[0],) + tuple(_stemmed(c, stem) for c in node[1:])
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from datastore import LocalStore
+from helpers import build
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    calls = []
+    original = LocalStore.read_positions
+
+    def read_positions(self, offset, length):
+        calls.append(length)
+        return original(self, offset, length)
+
+    monkeypatch.setattr(LocalStore, "read_positions", read_positions)
+    return calls
+
+
+@pytest.mark.parametrize("qproc, optim", [("TERMatat", "Null"), ("TERMatat", "Skipping"),
+                                          ("DOCatat", "Null"), ("DOCatat", "EarlyStopping")])
+def test_only_phrases_read_positions(docs, reads, qproc, optim):
+    idx = build("pos", docs, info="BM25", qproc=qproc, optim=optim, result_cache_mb=0)
+    for q in ('"apple"', '"apple" AND NOT "banana"', '"apple" OR "river" OR "castle"', 'NOT "apple"'):
+        idx.query(q)
+    assert reads == []
+    results = json.loads(idx.query('"red dragon"'))["results"]
+    assert reads and {r["doc_id"] for r in results} >= {"d0", "d10", "d20"}
+
+
+def test_positions_file_holds_the_positions(docs):
+    build("pos", docs)
+    store = LocalStore(Path("indices/pos"))
+    lexicon = store.read_lexicon()
+    info = lexicon.get("dragon")
+    assert info.pos_length > 0
+    assert store.positions_path.stat().st_size == sum(i.pos_length for _, i in lexicon.items())
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import random
+import struct
+
+import numpy as np
+import pytest
+
+from compression import vbyte_decode, vbyte_encode
+from postings import POSTINGS_VERSION, PostingsList, encode_postings, read_header
+
+
+def _doc_map(seed: int = 1, n: int = 200) -> dict:
+    rng = random.Random(seed)
+    codes = sorted(rng.sample(range(1, 100_000), n))
+    return {d: sorted(rng.sample(range(500), rng.randint(1, 6))) for d in codes}
+
+
+def _open(doc_map: dict, compr: str, block_size: int | None) -> PostingsList:
+    payload, positions = encode_postings(doc_map, compr, block_size)
+    return PostingsList(payload, compr, lambda: positions)
+
+
+@pytest.mark.parametrize("compr", ["NONE", "CODE", "CLIB"])
+@pytest.mark.parametrize("block_size", [0, None, 7])
+def test_round_trip(compr, block_size):
+    doc_map = _doc_map()
+    plist = _open(doc_map, compr, block_size)
+    assert plist.to_dict() == doc_map
+    assert plist.docs() == sorted(doc_map)
+    docs, tfs = plist.arrays()
+    assert docs.tolist() == sorted(doc_map)
+    assert tfs.tolist() == [len(doc_map[d]) for d in sorted(doc_map)]
+
+
+def test_header():
+    doc_map = _doc_map()
+    payload, _ = encode_postings(doc_map, "CODE", 0)
+    assert read_header(payload) == (len(doc_map), sum(map(len, doc_map.values())), max(map(len, doc_map.values())))
+
+
+def test_rejects_other_versions():
+    payload, _ = encode_postings(_doc_map(), "CODE", 0)
+    stale = struct.pack("<B", POSTINGS_VERSION - 1) + bytes(payload[1:])
+    with pytest.raises(ValueError, match="version"):
+        read_header(stale)
+
+
+def test_gaps_make_payloads_compact():
+    # Dense codes give one-byte gaps under vbyte
+    dense = {d: [0] for d in range(1_000_000, 1_001_000)}
+    payload, _ = encode_postings(dense, "CODE", 0)
+    assert len(payload) < 2 * 1000 + 64
+
+
+def test_vbyte_round_trip():
+    numbers = [0, 1, 127, 128, 16383, 16384, 2 ** 32 - 1, 2 ** 40]
+    assert vbyte_decode(vbyte_encode(numbers)) == numbers
+    with pytest.raises(ValueError):
+        vbyte_encode([-1])
+
+
+def test_empty_list_arrays():
+    plist = _open({}, "CODE", 0)
+    docs, tfs = plist.arrays()
+    assert len(plist) == 0 and docs.dtype == np.int64 and not len(tfs)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import pytest
+from nltk.stem import PorterStemmer
+
+from preprocess import PreprocessConfig, TextPreprocessor
+
+TEXTS = [
+    "The Running dogs were running across the rivers",
+    "A dog runs; rivers run. Well-known runners' shoes",
+    "",
+    "Connection connected connecting connections",
+]
+
+
+def test_tokenize_batch_matches_tokenize():
+    p = TextPreprocessor()
+    assert p.tokenize_batch(TEXTS) == [TextPreprocessor().tokenize(t) for t in TEXTS]
+
+
+def test_memoized_stems_match_the_stemmer():
+    p = TextPreprocessor()
+    stemmer = PorterStemmer()
+    tokens = p.tokenize(TEXTS[0] + " " + TEXTS[0])
+    assert tokens == [stemmer.stem(t) for t in p._split(TEXTS[0] + " " + TEXTS[0])]
+    info = p.stem_cache_info()
+    assert info["misses"] == len(set(tokens))
+    assert info["hits"] + info["misses"] == len(tokens)
+
+
+def test_stem_cache_is_bounded():
+    p = TextPreprocessor(PreprocessConfig(stem_cache_size=2))
+    assert p.tokenize("apples bananas cherries apples") == ["appl", "banana", "cherri", "appl"]
+    info = p.stem_cache_info()
+    assert info["size"] == 2
+    assert info["evictions"] == 2
+
+
+def test_stem_cache_can_be_disabled():
+    p = TextPreprocessor(PreprocessConfig(stem_cache_size=0))
+    assert p.tokenize_batch(TEXTS) == TextPreprocessor().tokenize_batch(TEXTS)
+    assert p.stem_cache_info()["size"] == 0
+
+
+TRICKY = [
+    "Don't -stop 'til --dawn a-b x'y",
+    "Ünïcödé café naïve KELVIN K",
+    "a",
+    "",
+    "e-mail co-op 'quoted' -",
+    "x1y2zz3 ab_cd I A",
+    "--'--' -'a ab- x'-",
+    "THE The the",
+]
+
+
+@pytest.mark.parametrize("config", [PreprocessConfig(), PreprocessConfig(lowercase=False),
+                                    PreprocessConfig(remove_stopwords=False, stem=False)])
+@pytest.mark.parametrize("texts", [TRICKY, TRICKY + ["holds \x00 the marker"], [""], ["one"]])
+def test_batch_split_matches_per_text(config, texts):
+    p = TextPreprocessor(config)
+    assert p._split_batch(texts) == [p._split(t) for t in texts]
+    assert p.tokenize_batch(texts) == [TextPreprocessor(config).tokenize(t) for t in texts]
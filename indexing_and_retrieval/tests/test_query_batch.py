@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import pytest
+
+from helpers import QUERIES, build
+
+VARIANTS = [("BOOLEAN", "TERMatat", "Null"), ("TFIDF", "TERMatat", "Skipping"), ("BM25", "DOCatat", "Null"),
+            ("BM25", "DOCatat", "EarlyStopping")]
+
+
+@pytest.mark.parametrize("info, qproc, optim", VARIANTS)
+def test_batch_matches_single_queries(docs, info, qproc, optim):
+    idx = build("b", docs, info=info, qproc=qproc, optim=optim, result_cache_mb=0)
+    queries = QUERIES * 2
+    assert idx.query_batch(queries) == [idx.query(q) for q in queries]
+    assert idx.query_batch(queries, k=5) == [idx.query_batch([q], k=5)[0] for q in queries]
+
+
+def test_parallel_batch_matches(docs):
+    idx = build("b", docs, info="BM25")
+    assert idx.query_batch(QUERIES, workers=2) == [idx.query(q) for q in QUERIES]
+
+
+def test_batch_decodes_shared_terms_once(docs):
+    queries = ['"apple" AND "banana"', '"apple" OR "banana"', '"banana" AND NOT "apple"'] * 3
+    idx = build("b", docs, info="BM25", qproc="DOCatat", result_cache_mb=0)
+    for q in queries:
+        idx.query(q)
+    single = idx.query_stats_info()["counters"]["blocks_decoded"]["sum"]
+    idx.query_stats.reset()
+    idx.query_batch(queries)
+    batched = idx.query_stats_info()["counters"].get("blocks_decoded", {"sum": 0})["sum"]
+    assert batched < single
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import json
+
+from helpers import build
+
+
+def test_equivalent_queries_share_an_entry(docs):
+    idx = build("rc", docs)
+    first = idx.query('"Apples" AND "bananas"')
+    assert idx.query('("apple" AND "banana")') == first
+    info = idx.result_cache_info()
+    assert (info["hits"], info["entries"]) == (1, 1)
+
+
+def test_updates_and_merges_invalidate_entries(docs):
+    idx = build("rc", docs, info="BOOLEAN")
+    assert json.loads(idx.query('"zebra"'))["results"] == []
+    idx.update_index("rc", [], [("z", "zebra")])
+    assert json.loads(idx.query('"zebra"'))["results"] == [{"doc_id": "z", "score": 1.0}]
+    idx.update_index("rc", [("z", "")], [])
+    assert json.loads(idx.query('"zebra"'))["results"] == []
+    idx.query('"apple"')
+    idx.force_merge("rc")
+    hits = idx.result_cache_info()["hits"]
+    idx.query('"apple"')
+    assert idx.result_cache_info()["hits"] == hits
+
+
+def test_reload_invalidates_entries(docs):
+    idx = build("rc", docs)
+    idx.query('"apple"')
+    idx.load_index("indices/rc")
+    idx.query('"apple"')
+    assert idx.result_cache_info()["hits"] == 0
+
+
+def test_disabled_cache(docs):
+    idx = build("rc", docs, result_cache_mb=0)
+    assert idx.query('"apple"') == idx.query('"apple"')
+    assert idx.result_cache_info()["entries"] == 0
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import json
+import math
+import random
+
+import numpy as np
+import pytest
+
+from helpers import build
+from preprocess import TextPreprocessor
+from scoring import BM25_B, BM25_K1, bm25_idf, bm25_norms, bm25_weight, bm25_weights, tfidf_idf, top_k
+
+
+def test_top_k_matches_a_full_sort():
+    rng = random.Random(5)
+    codes = np.arange(1, 2001)
+    # Few distinct scores, so the cut falls inside a tie
+    scores = np.array([rng.choice([0.5, 1.0, 1.5, 2.0]) for _ in codes])
+    expected = sorted(zip(codes.tolist(), scores.tolist()), key=lambda x: (-x[1], x[0]))
+    for k in (1, 10, 333, 2000, 5000):
+        assert top_k(codes, scores, k) == expected[:k]
+    assert top_k(codes, scores, 0) == []
+
+
+@pytest.mark.parametrize("info, qproc, optim", [("TFIDF", "TERMatat", "Null"), ("BM25", "DOCatat", "Null"),
+                                                ("BM25", "DOCatat", "EarlyStopping")])
+def test_k_zero_returns_no_results(docs, info, qproc, optim):
+    idx = build("k0", docs, info=info, qproc=qproc, optim=optim)
+    assert idx.query_batch(['"apple"', '"apple" OR "dragon"'], k=0) == ['{"results": []}'] * 2
+    assert idx.search('"apple"', 0) == []
+
+
+def test_vector_and_scalar_bm25_agree():
+    tfs = np.array([1, 2, 5, 40])
+    norms = bm25_norms(np.array([3, 10, 50, 400]), avgdl=20.0)
+    idf = bm25_idf(1000, 17)
+    vec = bm25_weights(tfs, norms, idf)
+    assert vec.tolist() == pytest.approx([bm25_weight(int(t), float(n), idf) for t, n in zip(tfs, norms)])
+
+
+def _brute_force(docs, terms, info):
+    pre = TextPreprocessor()
+    tokens = {d: pre.tokenize(text) for d, text in docs}
+    n = len(docs)
+    avgdl = sum(map(len, tokens.values())) / n
+    scores = {}
+    for d, toks in tokens.items():
+        s, hit = 0.0, False
+        for t in terms:
+            tf = toks.count(t)
+            if not tf:
+                continue
+            hit = True
+            df = sum(t in other for other in tokens.values())
+            if info == "WORDCOUNT":
+                s += tf
+            elif info == "TFIDF":
+                s += (1 + math.log(tf)) * tfidf_idf(n, df)
+            else:
+                norm = 1 - BM25_B + BM25_B * len(toks) / avgdl
+                s += bm25_idf(n, df) * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        if hit:
+            scores[d] = s
+    return scores
+
+
+@pytest.mark.parametrize("info", ["WORDCOUNT", "TFIDF", "BM25"])
+def test_scores_match_the_formulas(docs, info):
+    idx = build("s", docs, info=info)
+    expected = _brute_force(docs, ["appl", "banana"], info)
+    results = json.loads(idx.query('"apples" OR "banana"'))["results"]
+    assert len(results) == 50
+    for r in results:
+        assert r["score"] == pytest.approx(expected[r["doc_id"]], rel=1e-5)
+    best = sorted(expected.values(), reverse=True)[:50]
+    assert [r["score"] for r in results] == pytest.approx(best, rel=1e-5)
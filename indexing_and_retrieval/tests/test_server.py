@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+import server
+from helpers import build
+from server import QueryServer, discover_indices
+from sharded_index import ShardedIndex
+
+
+def _request(srv: QueryServer, method: str, target: str, body: bytes = b""):
+    status, payload = asyncio.run(srv._dispatch(method, target, body))
+    return status, json.loads(payload)
+
+
+def _started(**kwargs) -> QueryServer:
+    srv = QueryServer("indices", workers=0, **kwargs)
+    asyncio.run(srv.start_pool())
+    return srv
+
+
+def test_discover_indices_skips_non_indices(docs):
+    build("a", docs)
+    ShardedIndex("SelfIndex", "BM25", "CUSTOM", "TERMatat", "CODE", "Null", shards=2,
+                 background_merge=False).create_index("s", docs)
+    (Path("indices") / "junk").mkdir()
+    found = discover_indices("indices", background_merge=False)
+    assert sorted(found) == ["a", "s"]
+    assert isinstance(found["s"], ShardedIndex)
+
+
+def test_worker_options_may_set_background_merge(docs):
+    build("a", docs)
+    server._init_worker("indices", {"background_merge": True, "postings_cache_mb": 1.0})
+    assert server._ready() == ["a"]
+
+
+def test_routes(docs):
+    idx = build("a", docs)
+    srv = _started()
+    try:
+        assert _request(srv, "GET", "/ready") == (200, {"ready": True, "indices": ["a"]})
+        assert _request(srv, "GET", "/indices") == (200, {"indices": ["a"]})
+        status, body = _request(srv, "GET", "/indices/a/query?q=%22apple%22")
+        assert status == 200 and body == json.loads(idx.query('"apple"'))
+        status, body = _request(srv, "POST", "/indices/a/query",
+                                json.dumps({"queries": ['"apple"', '"banana"'], "k": 3}).encode())
+        assert status == 200 and body["responses"] == [json.loads(r) for r in idx.query_batch(['"apple"', '"banana"'], k=3)]
+        assert _request(srv, "GET", "/indices/a/query")[0] == 400
+        assert _request(srv, "POST", "/indices/a/query", b"{not json")[0] == 400
+        assert _request(srv, "DELETE", "/indices/a/query")[0] == 405
+        assert _request(srv, "GET", "/indices/nope/query?q=x")[0] == 404
+        assert _request(srv, "GET", "/elsewhere")[0] == 404
+    finally:
+        srv.close()
+
+
+def test_not_ready_until_loaded():
+    srv = QueryServer("indices", workers=0)
+    assert _request(srv, "GET", "/ready")[0] == 503
+    assert _request(srv, "GET", "/indices")[0] == 503
+
+
+def _exchange(srv: QueryServer, requests):
+    # Sends raw requests over one keep-alive connection; (status, body) per response
+    async def run():
+        listener = await asyncio.start_server(srv._handle, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection("127.0.0.1", listener.sockets[0].getsockname()[1])
+        out = []
+        for raw in requests:
+            writer.write(raw)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while (line := await reader.readline()) != b"\r\n":
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            out.append((status, json.loads(await reader.readexactly(length))))
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return out
+
+    return asyncio.run(run())
+
+
+def _post(body: bytes) -> bytes:
+    return f"POST /indices/a/query HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+def test_keep_alive_over_http(docs):
+    build("a", docs)
+    srv = _started()
+    try:
+        responses = _exchange(srv, [f"GET /indices/a/query?q={q} HTTP/1.1\r\nHost: x\r\n\r\n".encode()
+                                    for q in ("%22apple%22", "%22banana%22")])
+        assert [status for status, _ in responses] == [200, 200]
+    finally:
+        srv.close()
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b'"q"', b'{"queries": ["\\"apple\\""], "k": "x"}',
+                                  b'{"queries": ["\\"apple\\""], "k": 0}', b'{"queries": [], "k": true}'])
+def test_bad_post_bodies_get_400(docs, body):
+    build("a", docs)
+    srv = _started()
+    try:
+        # The connection stays open for the next request
+        (status, error), (after, _) = _exchange(srv, [_post(body), _post(b'{"queries": ["x"], "k": "3"}')])
+        assert status == 400 and error["error"]
+        assert after == 200
+    finally:
+        srv.close()
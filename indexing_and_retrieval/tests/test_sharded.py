@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from helpers import QUERIES, build, make_docs
+from sharded_index import ShardedIndex, hash_shard
+
+RANKED = ['"apple"', '"apple" OR "dragon"', '"castle" AND "knight"', '"red dragon"', '"apple" AND NOT "banana"']
+
+
+def _sharded(docs, partition="hash", info="BM25", workers=0, **options) -> ShardedIndex:
+    options.setdefault("background_merge", False)
+    idx = ShardedIndex("SelfIndex", info, "CUSTOM", "TERMatat", "CODE", "Null", shards=3,
+                       partition=partition, workers=workers, **options)
+    idx.create_index("s", docs)
+    idx.load_index("indices/s")
+    return idx
+
+
+def _scores(index, query: str):
+    # Every match, so ties at the top-k cutoff cannot pick different docs
+    return sorted((d, round(s, 6)) for d, s in index.search(query, k=1000))
+
+
+@pytest.mark.parametrize("partition", ["hash", "size"])
+@pytest.mark.parametrize("info", ["BOOLEAN", "BM25"])
+def test_matches_single_index(docs, partition, info):
+    single = build("one", docs, info=info)
+    sharded = _sharded(docs, partition, info)
+    assert sorted(sharded.list_indexed_files("s")) == sorted(d for d, _ in docs)
+    for q in QUERIES if info == "BOOLEAN" else RANKED:
+        assert _scores(sharded, q) == _scores(single, q), q
+
+
+def test_hash_placement(docs):
+    idx = _sharded(docs)
+    for i, shard in enumerate(idx.shards):
+        assert all(hash_shard(d, 3) == i for d in shard.list_indexed_files(f"s/shard-{i:02d}"))
+
+
+def test_update_moves_docs(docs):
+    idx = _sharded(docs, partition="size")
+    extra = make_docs(20, seed=3, prefix="x")
+    idx.update_index("s", docs[:10], extra + [(docs[20][0], "zebra zebra")])
+    files = list(idx.list_indexed_files("s"))
+    assert len(files) == len(set(files)) == len(docs) - 10 + 20
+    assert [r["doc_id"] for r in json.loads(idx.query('"zebra"'))["results"]] == [docs[20][0]]
+
+
+def test_worker_processes(docs):
+    _sharded(docs, workers=2)
+    single = build("one", docs, info="BM25")
+    opened = ShardedIndex.open("indices/s", workers=2, background_merge=False)
+    try:
+        for q in RANKED:
+            assert _scores(opened, q) == _scores(single, q), q
+    finally:
+        opened.close()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import json
+import random
+
+import pytest
+
+from helpers import QUERIES, build
+from postings import END, PostingsList, encode_postings
+
+
+def _plist(doc_map: dict, block_size: int | None) -> PostingsList:
+    payload, positions = encode_postings(doc_map, "CODE", block_size)
+    return PostingsList(payload, "CODE", lambda: positions)
+
+
+@pytest.fixture
+def doc_map() -> dict:
+    rng = random.Random(3)
+    return {d: sorted(rng.sample(range(100), 3)) for d in sorted(rng.sample(range(1, 5000), 400))}
+
+
+@pytest.mark.parametrize("block_size", [None, 1, 16])
+def test_intersect_decodes_only_needed_blocks(doc_map, block_size):
+    plist = _plist(doc_map, block_size)
+    candidates = sorted(random.Random(4).sample(range(1, 5000), 30))
+    assert plist.intersect(candidates) == [d for d in candidates if d in doc_map]
+    assert plist.blocks_decoded <= len(candidates)
+
+
+@pytest.mark.parametrize("block_size", [None, 16])
+def test_cursor_seek(doc_map, block_size):
+    plist = _plist(doc_map, block_size)
+    docs = sorted(doc_map)
+    cur = plist.cursor()
+    for target in range(0, 5100, 37):
+        expected = next((d for d in docs if d >= max(target, cur.doc)), END)
+        assert cur.seek(target) == expected
+        if expected < END:
+            assert cur.positions() == doc_map[expected]
+
+
+def test_positions_for(doc_map):
+    plist = _plist(doc_map, 16)
+    wanted = sorted(doc_map)[::7]
+    assert plist.positions_for(wanted) == {d: doc_map[d] for d in wanted}
+
+
+@pytest.mark.parametrize("qproc", ["TERMatat", "DOCatat"])
+def test_skipping_index_gives_the_same_results(docs, qproc):
+    plain = build("plain", docs, qproc=qproc)
+    skips = build("skips", docs, qproc=qproc, optim="Skipping", skip_block_size=4)
+    assert [skips.query(q) for q in QUERIES] == [plain.query(q) for q in QUERIES]
+
+
+def test_phrase_conjunct_is_seeded_from_the_other_operands():
+    # Every doc has the phrase; only a few have the rare word
+    rng = random.Random(6)
+    docs = [(f"d{i}", " ".join(rng.choices(["alpha", "beta", "gamma"], k=8) + ["common", "filler"]
+                               + (["rareword"] if i % 200 == 0 else []))) for i in range(4000)]
+    plain = build("plain", docs, info="BOOLEAN", result_cache_mb=0)
+    # BOOLEAN, so no scoring stage reads the terms' postings
+    skips = build("skips", docs, info="BOOLEAN", optim="Skipping", skip_block_size=16, result_cache_mb=0,
+                  postings_cache_mb=0)
+    query = '"common filler" AND rareword'
+    assert skips.query(query) == plain.query(query)
+    phrase_only = json.loads(skips.query('"common filler"', explain=True))["explain"]["counters"]
+    both = json.loads(skips.query(query, explain=True))["explain"]["counters"]
+    # Only the blocks holding the rare word's 20 docs are decoded, not the phrase terms' 250 each
+    assert both["blocks_decoded"] <= 3 * 20 < phrase_only["blocks_decoded"] / 4
+    assert both["positions_decoded"] < phrase_only["positions_decoded"] / 10
+
+
+def test_phrase_and_queries_match_without_skipping(docs):
+    plain = build("plain", docs)
+    skips = build("skips", docs, optim="Skipping", skip_block_size=4)
+    queries = ['"red dragon" AND "apple"', '"apple" AND "red dragon" AND NOT "banana"',
+               '("castle" OR "knight") AND "red dragon"', '"red dragon" AND "nosuchword"']
+    assert [skips.query(q) for q in queries] == [plain.query(q) for q in queries]
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+import server
+import tracing
+from helpers import build
+from tracing import Histogram, QueryStats, QueryTrace
+
+
+def test_stage_times_are_exclusive():
+    trace = tracing.start(QueryTrace())
+    tracing.push("match")
+    tracing.push("decode")
+    tracing.count("blocks_decoded", 3)
+    tracing.pop()
+    tracing.push("io")
+    assert tracing.finish() is trace
+    # finish() closes stages left open
+    assert set(trace.stages) == {"match", "decode", "io"}
+    assert sum(trace.stages.values()) <= trace.elapsed_ns
+    assert trace.counters == {"blocks_decoded": 3}
+    # Without a bound trace the hooks do nothing
+    tracing.push("match")
+    tracing.count("x")
+    tracing.pop()
+    assert tracing.current() is None
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram((1, 10))
+    for v in (0.5, 1, 5, 50):
+        h.observe(v)
+    assert h.export() == {"buckets": [(1, 2), (10, 3), ("+Inf", 4)], "sum": 56.5, "count": 4}
+
+
+def test_prometheus_format():
+    stats = QueryStats()
+    trace = tracing.start()
+    tracing.push("score")
+    tracing.count("docs_scored", 12)
+    stats.record(tracing.finish())
+    text = stats.prometheus()
+    assert "# TYPE selfindex_query_stage_milliseconds histogram" in text
+    assert 'selfindex_query_stage_milliseconds_count{stage="score"} 1' in text
+    assert 'selfindex_query_counter_count_bucket{counter="docs_scored",le="10.0"} 0' in text
+    assert 'selfindex_query_counter_count_sum{counter="docs_scored"} 12' in text
+    assert text.endswith("\n")
+
+
+# DAAT matches and scores in one stage
+@pytest.mark.parametrize("qproc, stages", [("TERMatat", {"match", "score"}), ("DOCatat", {"daat"})])
+def test_explain_skips_result_cache(docs, qproc, stages):
+    idx = build("t", docs, info="BM25", qproc=qproc)
+    q = '"apple" AND NOT "banana"'
+    plain = idx.query(q)
+    assert json.loads(idx.query(q))["results"] == json.loads(plain)["results"]
+    hits = idx.result_cache_info()["hits"]
+    explained = json.loads(idx.query(q, explain=True))
+    assert idx.result_cache_info()["hits"] == hits
+    assert explained["results"] == json.loads(plain)["results"]
+    assert explained["explain"]["plan"]["op"] == "ANDNOT"
+    assert {"parse", "plan", "serialize"} | stages <= set(explained["explain"]["stages_ms"])
+    assert "result_cache" not in explained["explain"]["stages_ms"]
+    assert "result_cache_hits" not in explained["explain"]["counters"]
+
+
+def test_server_explain_skips_result_cache(docs):
+    idx = build("t", docs, info="BM25")
+    idx.query('"apple"')
+    server._init_worker("indices", {})
+    server._worker_indices["t"].query('"apple"')
+    explained = json.loads(server._run_query("t", '"apple"', explain=True))
+    assert "match" in explained["explain"]["stages_ms"]
+    assert "result_cache" not in explained["explain"]["stages_ms"]
+
+
+def test_query_stats_accumulate(docs):
+    idx = build("t", docs, info="BM25", result_cache_mb=0)
+    for q in ('"apple"', '"banana" OR "cherry"', '"red dragon"'):
+        idx.query(q)
+    info = idx.query_stats_info()
+    assert info["queries"] == 3
+    assert info["stages_ms"]["total"]["count"] == 3
+    assert info["counters"]["docs_matched"]["count"] == 3
+    assert idx.query_stats.prometheus().count("# TYPE") == 2
+    idx.query_stats.reset()
+    assert idx.query_stats_info()["queries"] == 0
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+import threading
+
+import pytest
+
+from helpers import QUERIES, build, make_docs
+from self_index import SelfIndex
+
+QPROCS = ["TERMatat", "DOCatat"]
+
+
+def _ids(response: str):
+    return [r["doc_id"] for r in json.loads(response)["results"]]
+
+
+def _updated(docs, removed, added):
+    # The collection after an update, in the doc code order an index would give it
+    gone = set(removed) | {d for d, _ in added}
+    return [(d, t) for d, t in docs if d not in gone] + list(added)
+
+
+@pytest.mark.parametrize("qproc", QPROCS)
+def test_not_after_a_merge_purges_tombstones(qproc):
+    docs = [("a", "apple banana"), ("b", "banana cherry"), ("c", "cherry grape")]
+    idx = build("n", docs, info="BOOLEAN", qproc=qproc)
+    idx.update_index("n", [("a", "")], [])
+    assert _ids(idx.query('NOT "banana"')) == ["c"]
+    idx.force_merge("n")
+    assert _ids(idx.query('NOT "banana"')) == ["c"]
+    assert _ids(idx.query('NOT "grape"')) == ["b"]
+    reopened = SelfIndex.open("indices/n")
+    assert _ids(reopened.query('NOT "banana"')) == ["c"]
+
+
+@pytest.mark.parametrize("qproc", QPROCS)
+def test_boolean_results_follow_updates(docs, qproc):
+    idx = build("u", docs, info="BOOLEAN", qproc=qproc)
+    removed = [d for d, _ in docs[:40]]
+    added = [("d5", "apple apple dragon"), ("new1", "banana river"), ("new2", "apple red dragon")]
+    idx.update_index("u", [(d, "") for d in removed], added)
+    expected = build("fresh", _updated(docs, removed, added), info="BOOLEAN", qproc=qproc)
+    for q in QUERIES:
+        assert _ids(idx.query(q)) == _ids(expected.query(q)), q
+    idx.force_merge("u")
+    for q in QUERIES:
+        assert _ids(idx.query(q)) == _ids(expected.query(q)), q
+
+
+@pytest.mark.parametrize("qproc", QPROCS)
+@pytest.mark.parametrize("info", ["TFIDF", "BM25"])
+def test_merged_index_scores_like_a_fresh_build(docs, qproc, info):
+    idx = build("u", docs, info=info, qproc=qproc)
+    removed = [d for d, _ in docs[::3]]
+    added = [(f"x{i}", text) for i, (_, text) in enumerate(make_docs(n=50, seed=11))]
+    idx.update_index("u", [(d, "") for d in removed[:50]], added[:25])
+    idx.update_index("u", [(d, "") for d in removed[50:]], added[25:])
+    idx.force_merge("u")
+    assert len(idx.segments) == 1 and not idx.deleted
+    expected = build("fresh", _updated(docs, removed, added), info=info, qproc=qproc)
+    for q in QUERIES:
+        assert idx.query(q) == expected.query(q), q
+
+
+def test_background_merges_keep_results_and_reload(docs):
+    idx = build("bg", docs, info="BOOLEAN", merge_factor=2, background_merge=True)
+    collection = list(docs)
+    for i in range(6):
+        batch = make_docs(n=20, seed=100 + i, prefix=f"b{i}-")
+        removed = [d for d, _ in collection[i * 10:i * 10 + 5]]
+        idx.update_index("bg", [(d, "") for d in removed], batch)
+        collection = _updated(collection, removed, batch)
+    idx.wait_for_merges()
+    assert len(idx.segments) < 7
+    expected = build("fresh", collection, info="BOOLEAN")
+    reopened = SelfIndex.open("indices/bg")
+    for q in QUERIES:
+        assert _ids(idx.query(q)) == _ids(expected.query(q)), q
+        assert _ids(reopened.query(q)) == _ids(expected.query(q)), q
+    assert sorted(idx.list_indexed_files("bg")) == sorted(d for d, _ in collection)
+
+
+def test_updates_invalidate_cached_results(docs):
+    idx = build("inv", docs, info="BOOLEAN")
+    before = _ids(idx.query('"nosuchword" OR "zebra"'))
+    idx.update_index("inv", [], [("z1", "zebra")])
+    assert before == [] and _ids(idx.query('"nosuchword" OR "zebra"')) == ["z1"]
+    idx.update_index("inv", [("z1", "")], [])
+    assert _ids(idx.query('"zebra"')) == []
+
+
+@pytest.mark.parametrize("qproc", QPROCS)
+def test_queries_run_during_background_merges(docs, qproc):
+    idx = build("live", docs, info="BOOLEAN", qproc=qproc, merge_factor=2, background_merge=True,
+                result_cache_mb=0)
+    errors = []
+    stop = threading.Event()
+
+    def reader() -> None:
+        while not stop.is_set():
+            try:
+                for q in QUERIES:
+                    idx.query(q)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+                return
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        for i in range(8):
+            idx.update_index("live", [(d, "") for d, _ in docs[i * 5:i * 5 + 5]],
+                             make_docs(n=15, seed=200 + i, prefix=f"l{i}-"))
+        idx.wait_for_merges()
+    finally:
+        stop.set()
+        thread.join()
+    assert not errors
+
+
+def test_rebuild_waits_for_background_merges(docs, monkeypatch):
+    idx = build("re", docs, info="BOOLEAN", merge_factor=2, background_merge=True)
+    merging = threading.Event()
+    merge_segments = idx._merge_segments
+
+    def slow_merge(*args):
+        merging.set()
+        # Long enough for the rebuild below to start while this merge runs
+        stop = threading.Event()
+        stop.wait(0.3)
+        return merge_segments(*args)
+
+    monkeypatch.setattr(idx, "_merge_segments", slow_merge)
+    failures = []
+    monkeypatch.setattr(threading, "excepthook", failures.append)
+    for i in range(2):
+        idx.update_index("re", [], make_docs(n=10, seed=300 + i, prefix=f"r{i}-"))
+    assert merging.wait(5)
+    rebuilt = make_docs(n=80, seed=9, prefix="n")
+    idx.create_index("re", rebuilt)
+    idx.wait_for_merges()
+    meta = json.loads(open("indices/re/meta.json").read())
+    assert not failures
+    assert [s["name"] for s in meta["segments"]] == ["."]
+    idx.load_index("indices/re")
+    expected = build("fresh", rebuilt, info="BOOLEAN")
+    for q in QUERIES:
+        assert _ids(idx.query(q)) == _ids(expected.query(q)), q
+    assert sorted(idx.list_indexed_files("re")) == sorted(d for d, _ in rebuilt)
+
+
+def test_planner_dfs_come_from_the_pinned_view(docs):
+    idx = build("pin", docs, info="BOOLEAN")
+    before = idx._term_df("zebra")
+    with idx._pinned_view():
+        idx.update_index("pin", [], [("z1", "zebra"), ("z2", "zebra")])
+        assert idx._term_df("zebra") == before
+    assert idx._term_df("zebra") == before + 2
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from helpers import QUERIES, build, make_docs
+
+RANKED = QUERIES + [
+    '"apple" OR "banana" OR "cherry" OR "dragon"',
+    '"river" OR "river" OR "ocean"',
+    '"red dragon" OR "castle"',
+]
+
+
+def _results(response: str):
+    return [(r["doc_id"], r["score"]) for r in json.loads(response)["results"]]
+
+
+@pytest.mark.parametrize("optim", ["Thresholding", "EarlyStopping"])
+@pytest.mark.parametrize("info", ["WORDCOUNT", "TFIDF", "BM25"])
+def test_pruned_top_k_matches_exhaustive(optim, info):
+    # Enough docs that the top 50 fill up early and most candidates can be pruned
+    docs = make_docs(n=1500)
+    exhaustive = build("full", docs, info=info, qproc="DOCatat", optim="Skipping", skip_block_size=16)
+    pruned = build("pruned", docs, info=info, qproc="DOCatat", optim=optim, skip_block_size=16)
+    for q in RANKED:
+        got, expected = _results(pruned.query(q)), _results(exhaustive.query(q))
+        assert [s for _, s in got] == pytest.approx([s for _, s in expected]), q
+        assert [d for d, _ in got] == [d for d, _ in expected], q
+
+
+def test_block_max_wand_scores_fewer_docs():
+    docs = make_docs(n=1500)
+    q = '"apple" OR "banana" OR "cherry" OR "dragon"'
+    scored = {}
+    for optim in ("Skipping", "EarlyStopping"):
+        idx = build(optim, docs, info="BM25", qproc="DOCatat", optim=optim, skip_block_size=16, result_cache_mb=0)
+        trace = json.loads(idx.query(q, explain=True))["explain"]
+        scored[optim] = trace["counters"]["docs_scored"]
+    assert scored["EarlyStopping"] < scored["Skipping"]
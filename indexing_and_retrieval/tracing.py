@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+
+# Lightweight per-query instrumentation. A QueryTrace is bound to the current thread
+# while a query runs; the hot paths call push()/pop() around a stage and count() for
+# counters (or look the trace up once with current() and call its methods), and do
+# nothing but a thread-local lookup when no trace is active. Stage
+# times are exclusive: time spent in a nested stage (e.g. decode inside match) is
+# charged to the nested stage only, so the stages of a query add up to its total
+# less the glue code between them.
+#   stages:   parse, plan, preprocess, result_cache, io, decode, match, score, daat, serialize
+#   counters: bytes_read, blocks_decoded, postings_decoded, positions_decoded,
+#             docs_matched, docs_scored, result_cache_hits
+# A trace can be bound and finished several times (query_batch prepares all queries
+# before evaluating them); its total is the time it spent bound. Finished traces are
+# folded into QueryStats: cumulative histograms per stage and counter.
+
+# Upper bucket bounds: stage times in ms, counters in units per query
+TIME_BOUNDS_MS: Tuple[float, ...] = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50,
+                                     100, 250, 500, 1000, 2500, 5000, 10000)
+COUNT_BOUNDS: Tuple[float, ...] = tuple(float(10 ** i) for i in range(10))
+
+_local = threading.local()
+
+
+class QueryTrace:
+    """Stage timers (ns, exclusive) and counters of one query."""
+
+    __slots__ = ("stages", "counters", "elapsed_ns", "_stack", "_t", "_bound")
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.elapsed_ns = 0
+        self._stack: List[str] = []
+        self._bound = self._t = 0
+
+    def push(self, stage: str) -> None:
+        now = time.perf_counter_ns()
+        if self._stack:
+            top = self._stack[-1]
+            self.stages[top] = self.stages.get(top, 0) + now - self._t
+        self._stack.append(stage)
+        self._t = now
+
+    def pop(self) -> None:
+        now = time.perf_counter_ns()
+        top = self._stack.pop()
+        self.stages[top] = self.stages.get(top, 0) + now - self._t
+        self._t = now
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def breakdown(self) -> Dict:
+        return {
+            "total_ms": self.elapsed_ns / 1e6,
+            "stages_ms": {s: ns / 1e6 for s, ns in sorted(self.stages.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+
+def current() -> QueryTrace | None:
+    return getattr(_local, "trace", None)
+
+
+def start(trace: QueryTrace | None = None) -> QueryTrace:
+    """Binds trace (a fresh one by default) to this thread, replacing any active one."""
+    if trace is None:
+        trace = QueryTrace()
+    trace._bound = trace._t = time.perf_counter_ns()
+    _local.trace = trace
+    return trace
+
+
+def finish() -> QueryTrace | None:
+    """Unbinds and returns this thread's trace; stages left open are closed."""
+    trace = current()
+    _local.trace = None
+    if trace is not None:
+        while trace._stack:
+            trace.pop()
+        trace.elapsed_ns += time.perf_counter_ns() - trace._bound
+    return trace
+
+
+def push(stage: str) -> None:
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.push(stage)
+
+
+def pop() -> None:
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.pop()
+
+
+def count(name: str, n: int = 1) -> None:
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.count(name, n)
+
+
+class Histogram:
+    """Fixed-bucket histogram; exported with cumulative counts (Prometheus 'le')."""
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = tuple(bounds)
+        # One slot per bound plus the overflow (+Inf) slot
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def export(self) -> Dict:
+        cumulative: List[Tuple[float | str, int]] = []
+        total = 0
+        for le, n in zip(self.bounds + ("+Inf",), self.counts):
+            total += n
+            cumulative.append((le, total))
+        return {"buckets": cumulative, "sum": self.sum, "count": total}
+
+
+class QueryStats:
+    """Cumulative histograms of per-query stage times (ms) and counters."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.queries = 0
+            self.stages: Dict[str, Histogram] = {"total": Histogram(TIME_BOUNDS_MS)}
+            self.counters: Dict[str, Histogram] = {}
+
+    def record(self, trace: QueryTrace) -> None:
+        total_ms = trace.elapsed_ns / 1e6
+        with self._lock:
+            self.queries += 1
+            self.stages["total"].observe(total_ms)
+            for stage, ns in trace.stages.items():
+                hist = self.stages.get(stage)
+                if hist is None:
+                    hist = self.stages[stage] = Histogram(TIME_BOUNDS_MS)
+                hist.observe(ns / 1e6)
+            for name, n in trace.counters.items():
+                hist = self.counters.get(name)
+                if hist is None:
+                    hist = self.counters[name] = Histogram(COUNT_BOUNDS)
+                hist.observe(n)
+
+    def histograms(self) -> Dict:
+        # A stage or counter missing from a query is not observed for it, so each
+        # histogram's count is the number of queries that went through it
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "stages_ms": {s: h.export() for s, h in sorted(self.stages.items())},
+                "counters": {c: h.export() for c, h in sorted(self.counters.items())},
+            }
+
+    def prometheus(self, prefix: str = "selfindex_query") -> str:
+        """The histograms in the Prometheus text exposition format."""
+        hists = self.histograms()
+        lines: List[str] = []
+        for kind, metric, unit in (("stages_ms", "stage", "milliseconds"), ("counters", "counter", "count")):
+            name = f"{prefix}_{metric}_{unit}"
+            lines.append(f"# TYPE {name} histogram")
+            for label, h in hists[kind].items():
+                for le, n in h["buckets"]:
+                    lines.append(f'{name}_bucket{{{metric}="{label}",le="{le}"}} {n}')
+                lines.append(f'{name}_sum{{{metric}="{label}"}} {h["sum"]}')
+                lines.append(f'{name}_count{{{metric}="{label}"}} {h["count"]}')
+        return "\n".join(lines) + "\n"